@@ -0,0 +1,70 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+from app.services.answer_cache import AnswerCache
+from app.services.conversations import ConversationCache
+from app.services.digests import DigestService
+from app.services.index_registry import VectorIndexRegistry
+from app.services.llm import OllamaLLM
+from app.services.vector_store import VectorStore
+
+T = TypeVar("T")
+
+# How often a long-running call checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+def get_index_registry(request: Request) -> VectorIndexRegistry:
+    """Return the index registry created in the app lifespan, once its live index is warm"""
+    registry = getattr(request.app.state, "vector_indexes", None)
+    if registry is None or registry.active is None or not registry.active.is_ready:
+        raise HTTPException(status_code=503, detail="Vector store is still warming up")
+    return registry
+
+
+def get_vector_store(request: Request) -> VectorStore:
+    """Return the live VectorStore (see app.services.index_registry)"""
+    return get_index_registry(request).active
+
+
+def get_llm(request: Request) -> OllamaLLM:
+    """Return the shared OllamaLLM (and its connection pool) created in the app lifespan"""
+    return request.app.state.llm
+
+
+def get_answer_cache(request: Request) -> AnswerCache:
+    """Return the chat answer cache created in the app lifespan"""
+    return request.app.state.answer_cache
+
+
+def get_conversations(request: Request) -> ConversationCache:
+    """Return the per-session conversation cache created in the app lifespan"""
+    return request.app.state.conversations
+
+
+def get_digests(request: Request) -> DigestService:
+    """Return the source digest service created in the app lifespan"""
+    return request.app.state.digests
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """Await awaitable, cancelling it if the client disconnects first
+
+    Starlette keeps running a handler after its client has gone, so a slow
+    model call would otherwise run to completion for nobody. Raises
+    HTTPException 499 (client closed request) when the client disconnects.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print(f"[API] Client disconnected from {request.url.path}; cancelling")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
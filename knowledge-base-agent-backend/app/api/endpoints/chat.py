@@ -1,19 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
-from sqlalchemy.sql import func
-from typing import List
+from sqlalchemy.sql import func, null
+from pydantic import ValidationError
+import numpy as np
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import re
+import time
 import uuid
 from datetime import datetime, timezone
 
-from app.core.database import get_db
+from app.api.deps import (
+    cancel_on_disconnect, get_answer_cache, get_conversations, get_digests, get_llm, get_vector_store
+)
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
 from app.models.chat import ChatSession, ChatMessage
+from app.models.digest import SourceDigest
+from app.models.source import KnowledgeSource
 from app.schemas.chat import ChatSessionCreate, ChatSessionResponse, ChatMessageResponse
-from app.services.llm import OllamaLLM
+from app.schemas.search import SearchFilters
+from app.services.answer_cache import AnswerCache
+from app.services.conversations import Conversation, ConversationCache
+from app.services.digests import DigestService, digest_text
+from app.services.llm import ERROR_RESPONSE, LLMError, OllamaLLM
+from app.services.llm_scheduler import CHAT, LLMBusyError
 from app.services.vector_store import VectorStore
 
 router = APIRouter()
 
+# Words by which a message refers back to the previous question
+_FOLLOW_UP_REFERENCE = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|this|that|these|those|he|she|him|his|her|there|"
+    r"what about|how about|the same|instead|above|previous|earlier)\b",
+    re.IGNORECASE
+)
+
 @router.post("/chat/sessions", response_model=ChatSessionResponse)
 async def create_chat_session(
     session_data: ChatSessionCreate,
@@ -80,206 +105,526 @@ async def get_chat_messages(
         for message in messages
     ]
 
-@router.post("/chat/sessions/{session_id}/messages")
-async def send_message(
-    session_id: uuid.UUID,
+async def _search_query(vector_store: VectorStore, previous_question: Optional[str], user_content: str) -> str:
+    """What to search for: a follow-up ("what about its pricing?") together with the previous question
+
+    A message that neither refers back to the previous question nor is
+    similar to it (CHAT_FOLLOW_UP_SIMILARITY) changes the topic, and is
+    searched on its own so the old topic does not dominate the results.
+    """
+    if not previous_question:
+        return user_content
+    follow_up = bool(_FOLLOW_UP_REFERENCE.search(user_content))
+    if not follow_up:
+        current, previous = await asyncio.gather(
+            vector_store.query_embedding(user_content),
+            vector_store.query_embedding(previous_question)
+        )
+        current, previous = np.asarray(current), np.asarray(previous)
+        similarity = float(current @ previous / (np.linalg.norm(current) * np.linalg.norm(previous) or 1.0))
+        follow_up = similarity >= settings.CHAT_FOLLOW_UP_SIMILARITY
+        print(f"[CHAT] Similarity to the previous question: {similarity:.2f}")
+    if not follow_up:
+        return user_content
+    print(f"[CHAT] Follow-up; searching with the previous question: {previous_question}")
+    return f"{previous_question}\n{user_content}"
+
+async def _retrieve_context(
     message: dict,
-    db: AsyncSession = Depends(get_db)
-):
-    """Send a message and get AI response"""
+    db: AsyncSession,
+    vector_store: VectorStore,
+    digests: DigestService,
+    previous_question: Optional[str] = None
+) -> Dict[str, Any]:
+    """Validate a chat message and gather what the model needs to answer it
+
+    Returns the message's "content", the model "context" (search results,
+    plus the knowledge-base overview and every source's digest for
+    questions about the knowledge base), the citation "sources" to store
+    with the answer, "is_kb_query", and the "chunk_ids" and "source_ids"
+    the answer will be built from. previous_question is the session's last
+    question (see _search_query).
+    """
+    user_content = message.get("content", "")
+
+    if not user_content.strip():
+        raise HTTPException(status_code=400, detail="Message content cannot be empty")
+
     try:
-        user_content = message.get("content", "")
-        
-        if not user_content.strip():
-            raise HTTPException(status_code=400, detail="Message content cannot be empty")
-        
-        # Save user message
-        user_message = ChatMessage(
-            session_id=str(session_id),
-            content=user_content,
-            role="user"
-        )
-        db.add(user_message)
-        await db.flush()  # Get the ID
-        
-        # Check if user is asking about knowledge base contents
-        knowledge_base_queries = [
-            "list", "show", "knowledge base", "what resources",
-            "sources", "documents", "what do you know", "summarize",
-            "main topics", "overview", "what's in", "my articles",
-            "my documents", "key insights", "recent articles", "recent documents",
-            "what have i", "compare", "across", "from my"
-        ]
-        is_kb_query = any(keyword in user_content.lower() for keyword in knowledge_base_queries)
-        
-        # Search for relevant context
-        # If it's a knowledge base query, get more results to ensure coverage of all sources
-        vector_store = VectorStore()
-        n_results = 15 if is_kb_query else 5
-        relevant_docs = await vector_store.search(user_content, n_results=n_results)
-
-        print(f"\n[CHAT] ==================== SEARCH DEBUG ====================")
-        print(f"[CHAT] Query: {user_content}")
-        print(f"[CHAT] Found {len(relevant_docs)} relevant documents")
-        for idx, doc in enumerate(relevant_docs):
-            title = doc['metadata'].get('title', 'Untitled')
-            url = doc['metadata'].get('url', 'Unknown')
-            distance = doc.get('distance', 'N/A')
-            content_preview = doc.get('content', '')[:100] + '...' if len(doc.get('content', '')) > 100 else doc.get('content', '')
-            print(f"[CHAT] Doc {idx+1}: {title}")
-            print(f"        URL: {url}")
-            print(f"        Distance: {distance}")
-            print(f"        Preview: {content_preview}")
-        print(f"[CHAT] ======================================================\n")
-        
-        # If asking about knowledge base, also get all sources from database
-        additional_context = ""
-        all_kb_sources = []  # Store for later use in sources list
-        if is_kb_query:
-            # Get all sources from database for comprehensive listing
-            from app.models.source import KnowledgeSource
-
-            sources_result = await db.execute(
-                select(KnowledgeSource)
-                .where(KnowledgeSource.status == "completed")
-                .order_by(KnowledgeSource.created_at.desc())
+        search_filters = SearchFilters(**(message.get("filters") or {})).to_dict()
+    except (ValidationError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filters: {e}")
+
+    search_mode = message.get("mode")
+    if search_mode not in (None, "dense", "lexical", "hybrid"):
+        raise HTTPException(status_code=400, detail=f"Invalid search mode: {search_mode}")
+
+    # Check if user is asking about knowledge base contents
+    knowledge_base_queries = [
+        "list", "show", "knowledge base", "what resources",
+        "sources", "documents", "what do you know", "summarize",
+        "main topics", "overview", "what's in", "my articles",
+        "my documents", "key insights", "recent articles", "recent documents",
+        "what have i", "compare", "across", "from my"
+    ]
+    is_kb_query = any(keyword in user_content.lower() for keyword in knowledge_base_queries)
+
+    # Search for relevant context
+    # If it's a knowledge base query, get more results to ensure coverage of all sources
+    n_results = 15 if is_kb_query else 5
+    relevant_docs = await vector_store.search(
+        await _search_query(vector_store, previous_question, user_content),
+        n_results=n_results,
+        mode=search_mode,
+        filters=search_filters,
+        diversify=message.get("diversify", settings.CHAT_DIVERSIFY)
+    )
+
+    print(f"\n[CHAT] ==================== SEARCH DEBUG ====================")
+    print(f"[CHAT] Query: {user_content}")
+    print(f"[CHAT] Found {len(relevant_docs)} relevant documents")
+    for idx, doc in enumerate(relevant_docs):
+        title = doc['metadata'].get('title', 'Untitled')
+        url = doc['metadata'].get('url', 'Unknown')
+        distance = doc.get('distance', 'N/A')
+        content_preview = doc.get('content', '')[:100] + '...' if len(doc.get('content', '')) > 100 else doc.get('content', '')
+        print(f"[CHAT] Doc {idx+1}: {title}")
+        print(f"        URL: {url}")
+        print(f"        Distance: {distance}")
+        print(f"        Preview: {content_preview}")
+    print(f"[CHAT] ======================================================\n")
+
+    # If asking about knowledge base, also get all sources from database
+    additional_context = ""
+    all_kb_sources = []  # Store for later use in sources list
+    if is_kb_query:
+        # Get all sources with their digests for comprehensive listing; the
+        # documents' content is not read (digests are made at ingest)
+        if await digests.available():
+            statement = select(
+                KnowledgeSource.id, KnowledgeSource.url, KnowledgeSource.title,
+                SourceDigest.summary, SourceDigest.keywords
+            ).outerjoin(SourceDigest, SourceDigest.source_id == KnowledgeSource.id)
+        else:
+            # Titles and URLs only
+            statement = select(
+                KnowledgeSource.id, KnowledgeSource.url, KnowledgeSource.title,
+                null().label("summary"), null().label("keywords")
             )
-            all_kb_sources = sources_result.scalars().all()
-
-            if all_kb_sources:
-                source_list = []
-                for source in all_kb_sources:
-                    source_type = "Website" if source.url.startswith("http") else "Document"
-                    # Include a preview of content
-                    content_preview = ""
-                    if source.content:
-                        preview = source.content[:300].strip()
-                        content_preview = f"\n  Preview: {preview}..."
-
-                    source_list.append(
-                        f"- {source.title or 'Untitled'} ({source_type})"
-                        f"\n  URL: {source.url}"
-                        f"{content_preview}"
-                    )
-
-                # Determine if user is asking about "recent" items
-                is_recent_query = "recent" in user_content.lower()
-
-                additional_context = (
-                    f"\n\nCOMPLETE KNOWLEDGE BASE INVENTORY:\n"
-                    f"You have {len(all_kb_sources)} sources in your knowledge base"
-                    f"{' (shown in reverse chronological order)' if is_recent_query else ''}:\n\n" +
-                    "\n\n".join(source_list)
+        sources_result = await db.execute(
+            statement
+            .where(KnowledgeSource.status == "completed")
+            .order_by(KnowledgeSource.created_at.desc())
+        )
+        all_kb_sources = sources_result.all()
+
+        if all_kb_sources:
+            source_list = []
+            for source in all_kb_sources:
+                source_type = "Website" if source.url.startswith("http") else "Document"
+                source_list.append(
+                    f"- {digest_text(source.title, source.url, source.summary, source.keywords)}"
+                    f" [{source_type}]"
                 )
-        
-        # Generate AI response
-        llm = OllamaLLM()
-        
-        # Add knowledge base context if this is a listing query
-        context_for_llm = relevant_docs
-        if additional_context:
-            # Add synthetic document with complete source listing
-            context_for_llm.append({
-                "content": additional_context,
-                "metadata": {
-                    "title": "Knowledge Base Inventory",
-                    "url": "system://knowledge_base_sources",
-                    "source_type": "system"
-                },
-                "distance": 0.0  # Highest relevance
+
+            # Determine if user is asking about "recent" items
+            is_recent_query = "recent" in user_content.lower()
+
+            overview = await digests.overview()
+            overview_text = ""
+            if overview["summary"]:
+                overview_text = f"KNOWLEDGE BASE OVERVIEW:\n{overview['summary']}\n\n"
+
+            additional_context = (
+                f"\n\n{overview_text}COMPLETE KNOWLEDGE BASE INVENTORY:\n"
+                f"You have {len(all_kb_sources)} sources in your knowledge base"
+                f"{' (shown in reverse chronological order)' if is_recent_query else ''}:\n\n" +
+                "\n\n".join(source_list)
+            )
+
+    # Add knowledge base context if this is a listing query
+    context_for_llm = list(relevant_docs)
+    if additional_context:
+        # Add synthetic document with complete source listing
+        context_for_llm.append({
+            "content": additional_context,
+            "metadata": {
+                "title": "Knowledge Base Inventory",
+                "url": "system://knowledge_base_sources",
+                "source_type": "system"
+            },
+            "distance": 0.0  # Highest relevance
+        })
+
+    # Save AI message with sources (include chunk_index and page_number for deep linking)
+    # Diversify sources - get at least one result from each unique source
+    seen_sources = set()
+    sources = []
+
+    # First, add sources from vector search results (with relevance scores)
+    for doc in relevant_docs:
+        source_id = doc["metadata"].get("source_id")
+        if source_id and source_id not in seen_sources:
+            sources.append({
+                "url": doc["metadata"].get("url", ""),
+                "title": doc["metadata"].get("title", ""),
+                "relevance": 1 - (doc.get("distance", 0) or 0),
+                "chunk_index": doc["metadata"].get("chunk_index", 0),
+                "total_chunks": doc["metadata"].get("total_chunks", 1),
+                "page_number": doc["metadata"].get("page_number"),  # Actual page number from PDF
+                "content_preview": doc.get("content", "")[:200]  # First 200 chars for preview
             })
-        
-        ai_response = await llm.generate_response(user_content, context_for_llm, is_kb_summary=is_kb_query)
-        
-        # Save AI message with sources (include chunk_index and page_number for deep linking)
-        # Diversify sources - get at least one result from each unique source
-        seen_sources = set()
-        sources = []
-
-        # First, add sources from vector search results (with relevance scores)
-        for doc in relevant_docs:
-            source_id = doc["metadata"].get("source_id")
-            if source_id and source_id not in seen_sources:
+            seen_sources.add(source_id)
+
+            # Stop after 5 unique sources
+            if len(sources) >= 5:
+                break
+
+    # For knowledge base queries, ensure ALL sources are listed (even if not in vector results)
+    if is_kb_query and all_kb_sources:
+        for kb_source in all_kb_sources:
+            source_id = str(kb_source.id)
+            if source_id not in seen_sources:
+                # Add source even if it wasn't in vector search results
                 sources.append({
-                    "url": doc["metadata"].get("url", ""),
-                    "title": doc["metadata"].get("title", ""),
-                    "relevance": 1 - (doc.get("distance", 0) or 0),
-                    "chunk_index": doc["metadata"].get("chunk_index", 0),
-                    "total_chunks": doc["metadata"].get("total_chunks", 1),
-                    "page_number": doc["metadata"].get("page_number"),  # Actual page number from PDF
-                    "content_preview": doc.get("content", "")[:200]  # First 200 chars for preview
+                    "url": kb_source.url,
+                    "title": kb_source.title or "Untitled",
+                    "relevance": 0.5,  # Medium relevance (not from vector search)
+                    "chunk_index": 0,
+                    "total_chunks": 1,
+                    "page_number": None,
+                    "content_preview": kb_source.summary[:200] if kb_source.summary else "No preview available"
                 })
                 seen_sources.add(source_id)
 
-                # Stop after 5 unique sources
-                if len(sources) >= 5:
-                    break
-
-        # For knowledge base queries, ensure ALL sources are listed (even if not in vector results)
-        if is_kb_query and all_kb_sources:
-            for kb_source in all_kb_sources:
-                source_id = str(kb_source.id)
-                if source_id not in seen_sources:
-                    # Add source even if it wasn't in vector search results
-                    sources.append({
-                        "url": kb_source.url,
-                        "title": kb_source.title or "Untitled",
-                        "relevance": 0.5,  # Medium relevance (not from vector search)
-                        "chunk_index": 0,
-                        "total_chunks": 1,
-                        "page_number": None,
-                        "content_preview": kb_source.content[:200] if kb_source.content else "No preview available"
-                    })
-                    seen_sources.add(source_id)
-        
-        ai_message = ChatMessage(
-            session_id=str(session_id),
-            content=ai_response,
-            role="assistant",
-            sources=sources
-        )
-        db.add(ai_message)
-        await db.flush()  # Get the ID
-        
-        # Update session timestamp
-        session_result = await db.execute(
-            select(ChatSession).where(ChatSession.id == str(session_id))
-        )
-        session = session_result.scalar_one_or_none()
-        if session:
-            session.updated_at = datetime.now(timezone.utc)
+    return {
+        "content": user_content,
+        "context": context_for_llm,
+        "sources": sources,
+        "is_kb_query": is_kb_query,
+        "chunk_ids": [doc["id"] for doc in relevant_docs],
+        "source_ids": {doc["metadata"]["source_id"] for doc in relevant_docs if doc["metadata"].get("source_id")}
+    }
 
-        await db.commit()
-        
-        return {
-            "user_message": {
-                "id": str(user_message.id),
-                "session_id": str(user_message.session_id),
-                "content": user_message.content,
-                "role": user_message.role,
-                "sources": user_message.sources or [],
-                "created_at": user_message.created_at.isoformat()
-            },
-            "ai_message": {
-                "id": str(ai_message.id),
-                "session_id": str(ai_message.session_id),
-                "content": ai_message.content,
-                "role": ai_message.role,
-                "sources": ai_message.sources or [],
-                "created_at": ai_message.created_at.isoformat()
-            }
+class _CachedAnswer:
+    """The answer cache lookup for one message; "cache": false in the message skips the lookup
+
+    Follow-ups in a conversation are neither looked up nor stored, since
+    their answers depend on the earlier turns.
+    """
+
+    def __init__(
+        self,
+        message: dict,
+        retrieved: Dict[str, Any],
+        answer_cache: AnswerCache,
+        vector_store: VectorStore,
+        llm: OllamaLLM,
+        conversation: Optional[Conversation] = None
+    ):
+        self.answer_cache = answer_cache
+        self.retrieved = retrieved
+        self.follow_up = bool(conversation and conversation.turns)
+        self.use_cache = message.get("cache", True) is not False and not self.follow_up
+        self.group = AnswerCache.group_key(vector_store.name, llm.chat_model, retrieved["is_kb_query"], retrieved["chunk_ids"])
+        self.embed = lambda: vector_store.query_embedding(retrieved["content"])
+        self.hit = False
+        # Read before generating, so a source change during generation keeps the answer out
+        self.generation = answer_cache.generation
+
+    async def get(self) -> Optional[str]:
+        if not self.use_cache:
+            self.answer_cache.bypassed += 1
+            return None
+        answer = await self.answer_cache.get(self.group, self.retrieved["content"], self.embed)
+        self.hit = answer is not None
+        return answer
+
+    async def put(self, answer: str) -> None:
+        if answer != ERROR_RESPONSE and not self.follow_up:
+            await self.answer_cache.put(
+                self.group,
+                self.retrieved["content"],
+                answer,
+                self.retrieved["source_ids"],
+                self.embed,
+                self.generation
+            )
+
+async def _save_exchange(
+    db: AsyncSession,
+    session_id: uuid.UUID,
+    user_content: str,
+    ai_content: str,
+    sources: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Store the user message and the answer in one transaction and return both"""
+    user_message = ChatMessage(
+        session_id=str(session_id),
+        content=user_content,
+        role="user"
+    )
+    db.add(user_message)
+    await db.flush()  # Get the ID
+
+    ai_message = ChatMessage(
+        session_id=str(session_id),
+        content=ai_content,
+        role="assistant",
+        sources=sources
+    )
+    db.add(ai_message)
+    await db.flush()  # Get the ID
+
+    # Update session timestamp
+    session_result = await db.execute(
+        select(ChatSession).where(ChatSession.id == str(session_id))
+    )
+    session = session_result.scalar_one_or_none()
+    if session:
+        session.updated_at = datetime.now(timezone.utc)
+
+    await db.commit()
+
+    return {
+        "user_message": {
+            "id": str(user_message.id),
+            "session_id": str(user_message.session_id),
+            "content": user_message.content,
+            "role": user_message.role,
+            "sources": user_message.sources or [],
+            "created_at": user_message.created_at.isoformat()
+        },
+        "ai_message": {
+            "id": str(ai_message.id),
+            "session_id": str(ai_message.session_id),
+            "content": ai_message.content,
+            "role": ai_message.role,
+            "sources": ai_message.sources or [],
+            "created_at": ai_message.created_at.isoformat()
         }
-    
+    }
+
+def _conversation_payload(
+    llm: OllamaLLM,
+    conversation: Optional[Conversation],
+    retrieved: Dict[str, Any],
+    stream: bool
+) -> Optional[Dict[str, Any]]:
+    """/api/chat request continuing the session's conversation, or None to answer the message on its own
+
+    Knowledge-base summaries are answered on their own, since their source
+    inventory needs the whole context window. Search results the model
+    has already seen earlier in the conversation are not sent again.
+    """
+    if conversation is None or retrieved["is_kb_query"]:
+        return None
+    context = [doc for doc in retrieved["context"] if not conversation.contains(doc.get("content", ""))]
+    return llm.chat_payload(
+        conversation.history(settings.CHAT_HISTORY_MAX_TOKENS),
+        retrieved["content"],
+        context,
+        is_kb_summary=False,
+        stream=stream
+    )
+
+def _remember_turn(
+    conversations: ConversationCache,
+    conversation: Optional[Conversation],
+    retrieved: Dict[str, Any],
+    payload: Optional[Dict[str, Any]],
+    answer: str,
+    started: float
+) -> None:
+    """Add an answered message to the session's conversation"""
+    if conversation is None:
+        return
+    conversations.record_latency(not conversation.turns, time.perf_counter() - started)
+    # Answers that did not continue the conversation join it as plain questions
+    content = payload["messages"][-1]["content"] if payload is not None else f"Question: {retrieved['content']}"
+    conversations.add_turn(conversation, retrieved["content"], content, answer)
+
+def _busy(e: LLMBusyError) -> HTTPException:
+    """503 telling the client when to retry, for a saturated model queue"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """One Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/sessions/{session_id}/messages")
+async def send_message(
+    session_id: uuid.UUID,
+    message: dict,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    vector_store: VectorStore = Depends(get_vector_store),
+    llm: OllamaLLM = Depends(get_llm),
+    answer_cache: AnswerCache = Depends(get_answer_cache),
+    conversations: ConversationCache = Depends(get_conversations),
+    digests: DigestService = Depends(get_digests)
+):
+    """Send a message and get AI response
+
+    Besides "content", the message may carry "filters" (see SearchFilters) to
+    restrict retrieval to a slice of the knowledge base, and a search "mode".
+    "cache": false generates a fresh answer instead of reusing a cached one.
+    Follow-ups are answered with the session's earlier turns in view (see
+    CHAT_HISTORY_ENABLED).
+    """
+    started = time.perf_counter()
+    try:
+        conversation = await conversations.get(str(session_id)) if settings.CHAT_HISTORY_ENABLED else None
+        retrieved = await _retrieve_context(
+            message, db, vector_store, digests,
+            previous_question=conversation.last_question if conversation else None
+        )
+
+        cached = _CachedAnswer(message, retrieved, answer_cache, vector_store, llm, conversation)
+        ai_response = await cached.get()
+        payload = None
+        if ai_response is None:
+            # Generate AI response
+            payload = _conversation_payload(llm, conversation, retrieved, stream=False)
+            generation = llm.answer(payload) if payload is not None else llm.generate_response(
+                retrieved["content"], retrieved["context"], is_kb_summary=retrieved["is_kb_query"]
+            )
+            # Nobody is waiting for the answer once the client has gone, so stop generating
+            ai_response = await cancel_on_disconnect(request, generation)
+            await cached.put(ai_response)
+
+        saved = await _save_exchange(db, session_id, retrieved["content"], ai_response, retrieved["sources"])
+        _remember_turn(conversations, conversation, retrieved, payload, ai_response, started)
+        saved["cached"] = cached.hit
+        return saved
+
     except HTTPException:
+        await db.rollback()
         raise
+    except LLMBusyError as e:
+        await db.rollback()
+        raise _busy(e)
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.post("/chat/sessions/{session_id}/messages/stream")
+async def stream_message(
+    session_id: uuid.UUID,
+    message: dict,
+    db: AsyncSession = Depends(get_db),
+    vector_store: VectorStore = Depends(get_vector_store),
+    llm: OllamaLLM = Depends(get_llm),
+    answer_cache: AnswerCache = Depends(get_answer_cache),
+    conversations: ConversationCache = Depends(get_conversations),
+    digests: DigestService = Depends(get_digests)
+):
+    """Send a message and stream the AI response as Server-Sent Events
+
+    Takes the same body as send_message. Events, in order:
+      sources  {"sources": [...]}, as soon as retrieval is done
+      token    {"content": "..."}, answer text as the model produces it
+               (a cached answer arrives as a single token)
+      done     {"user_message", "ai_message", "cached", "timing"}, once both are saved
+    or error {"detail": "..."} instead of done if generation fails, in
+    which case nothing is saved. If the client disconnects, Starlette
+    cancels the stream, which aborts the model request; nothing is saved.
+    A saturated model queue is answered with 503 before the stream starts
+    (or an error event if the message waited too long for the model).
+    """
+    started = time.perf_counter()
+    try:
+        conversation = await conversations.get(str(session_id)) if settings.CHAT_HISTORY_ENABLED else None
+        retrieved = await _retrieve_context(
+            message, db, vector_store, digests,
+            previous_question=conversation.last_question if conversation else None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    retrieval_ms = round((time.perf_counter() - started) * 1000, 1)
+    cached = _CachedAnswer(message, retrieved, answer_cache, vector_store, llm, conversation)
+    cached_response = await cached.get()
+    payload = None
+    if cached_response is None:
+        try:
+            llm.scheduler.admit(CHAT)
+        except LLMBusyError as e:
+            raise _busy(e)
+        payload = _conversation_payload(llm, conversation, retrieved, stream=True)
+
+    async def events():
+        yield _sse("sources", {"sources": retrieved["sources"]})
+
+        ai_response = cached_response
+        if ai_response is not None:
+            first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield _sse("token", {"content": ai_response})
+        else:
+            pieces = []
+            first_token_ms = None
+            try:
+                pieces_stream = llm.stream_answer(payload) if payload is not None else llm.stream_response(
+                    retrieved["content"],
+                    retrieved["context"],
+                    is_kb_summary=retrieved["is_kb_query"]
+                )
+                async for piece in pieces_stream:
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                        print(f"[CHAT] First token after {first_token_ms}ms (retrieval {retrieval_ms}ms)")
+                    pieces.append(piece)
+                    yield _sse("token", {"content": piece})
+            except LLMError as e:
+                print(f"[CHAT] Streaming failed: {e}")
+                yield _sse("error", {"detail": ERROR_RESPONSE})
+                return
+            except LLMBusyError as e:
+                print(f"[CHAT] Model busy: {e}")
+                yield _sse("error", {"detail": str(e), "retry_after": e.retry_after})
+                return
+            except asyncio.CancelledError:
+                print(f"[CHAT] Client disconnected after {len(pieces)} pieces; generation cancelled")
+                raise
+
+            ai_response = "".join(pieces)
+            if not ai_response:
+                ai_response = "I couldn't generate a response."
+                yield _sse("token", {"content": ai_response})
+            await cached.put(ai_response)
+
+        # The request's session may already be closed once the response has started
+        async with AsyncSessionLocal() as save_db:
+            try:
+                saved = await _save_exchange(save_db, session_id, retrieved["content"], ai_response, retrieved["sources"])
+            except Exception as e:
+                await save_db.rollback()
+                print(f"[CHAT] Failed to save streamed answer: {e}")
+                yield _sse("error", {"detail": f"Internal server error: {str(e)}"})
+                return
+
+        _remember_turn(conversations, conversation, retrieved, payload, ai_response, started)
+        saved["cached"] = cached.hit
+        saved["timing"] = {
+            "retrieval_ms": retrieval_ms,
+            "first_token_ms": first_token_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        yield _sse("done", saved)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.delete("/chat/sessions/{session_id}")
 async def delete_chat_session(
     session_id: uuid.UUID,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    conversations: ConversationCache = Depends(get_conversations)
 ):
     """Delete a chat session and all its messages"""
     try:
@@ -293,6 +638,7 @@ async def delete_chat_session(
         
         await db.delete(session)
         await db.commit()
+        conversations.discard(str(session_id))
         
         return {"message": "Chat session deleted successfully"}
     
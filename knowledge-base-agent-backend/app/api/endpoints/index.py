@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Literal, Optional
+
+from app.api.deps import get_index_registry
+from app.services.index_registry import VectorIndexRegistry
+
+router = APIRouter()
+
+class IndexMigrationRequest(BaseModel):
+    """Embedder and chunker settings for the new index; omitted fields keep the configured values"""
+    embedder_backend: Optional[Literal["sentence-transformers", "onnx", "ollama"]] = None
+    embedding_model: Optional[str] = None
+    onnx_model_path: Optional[str] = None
+    onnx_quantized: Optional[bool] = None
+    ollama_embed_model: Optional[str] = None
+    chunker: Optional[Literal["tokens", "chars"]] = None
+    chunk_max_tokens: Optional[int] = Field(None, ge=16, le=8192)
+    chunk_overlap_tokens: Optional[int] = Field(None, ge=0, le=1024)
+
+@router.get("/index")
+async def get_index_status(registry: VectorIndexRegistry = Depends(get_index_registry)) -> Dict[str, Any]:
+    """Live, previous and configured index, and progress of the last migration"""
+    return registry.status()
+
+@router.post("/index/migrations", status_code=202)
+async def start_index_migration(
+    request: Optional[IndexMigrationRequest] = None,
+    registry: VectorIndexRegistry = Depends(get_index_registry)
+) -> Dict[str, Any]:
+    """Build the index for the configured (or given) settings in the background, then switch to it"""
+    overrides = {
+        key.upper(): value
+        for key, value in (request.model_dump(exclude_none=True) if request else {}).items()
+    }
+    try:
+        return await registry.start_migration(overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/index/migrations")
+async def cancel_index_migration(registry: VectorIndexRegistry = Depends(get_index_registry)) -> Dict[str, Any]:
+    """Stop the running migration; its partial index is kept and reused by the next one"""
+    try:
+        return await registry.cancel_migration()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/index/rollback")
+async def rollback_index(registry: VectorIndexRegistry = Depends(get_index_registry)) -> Dict[str, Any]:
+    """Switch back to the previous index"""
+    try:
+        return await registry.rollback()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/index/previous")
+async def drop_previous_index(registry: VectorIndexRegistry = Depends(get_index_registry)) -> Dict[str, Any]:
+    """Delete the previous index and its vectors; rollback is no longer possible"""
+    try:
+        return await registry.drop_previous()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -1,23 +1,92 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Literal, Optional
+import base64
+import json
 
+from app.api.deps import get_vector_store
+from app.core.config import settings
+from app.schemas.search import SearchFilters
 from app.services.vector_store import VectorStore
 
 router = APIRouter()
 
 class QueryRequest(BaseModel):
     query: str
-    limit: int = 5
+    limit: int = Field(5, ge=1, le=settings.QUERY_MAX_LIMIT)
+    mode: Optional[Literal["dense", "lexical", "hybrid"]] = None  # Defaults to settings.SEARCH_MODE
+    filters: Optional[SearchFilters] = None
+    cursor: Optional[str] = None  # next_cursor from a previous response
+    diversify: bool = False  # MMR + per-source cap + merged adjacent chunks (no pagination)
 
 class QueryResponse(BaseModel):
     results: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class BatchQueryItem(BaseModel):
+    query: str
+    limit: int = Field(5, ge=1, le=settings.QUERY_MAX_LIMIT)
+    mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    filters: Optional[SearchFilters] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem] = Field(..., min_length=1, max_length=settings.QUERY_BATCH_MAX_QUERIES)
+
+class BatchQueryResponse(BaseModel):
+    results: List[List[Dict[str, Any]]]  # One list per query, in request order
+    timing: Dict[str, Any]
+
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
 
 @router.post("/query", response_model=QueryResponse)
-async def query_knowledge_base(request: QueryRequest):
+async def query_knowledge_base(
+    request: QueryRequest,
+    vector_store: VectorStore = Depends(get_vector_store)
+):
     """Query the knowledge base for relevant information"""
     
-    vector_store = VectorStore()
-    results = await vector_store.search(request.query, n_results=request.limit)
+    offset = _decode_cursor(request.cursor) if request.cursor else 0
+    if request.diversify and offset:
+        raise HTTPException(status_code=400, detail="Diversified search does not support pagination")
+    results = await vector_store.search(
+        request.query,
+        n_results=request.limit,
+        mode=request.mode,
+        filters=request.filters.to_dict() if request.filters else None,
+        offset=offset,
+        diversify=request.diversify
+    )
+
+    # A full page means there may be more results
+    next_cursor = None
+    if len(results) == request.limit and not request.diversify:
+        next_cursor = _encode_cursor(offset + len(results))
     
-    return QueryResponse(results=results)
\ No newline at end of file
+    return QueryResponse(results=results, next_cursor=next_cursor)
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def query_knowledge_base_batch(
+    request: BatchQueryRequest,
+    vector_store: VectorStore = Depends(get_vector_store)
+):
+    """Run many queries at once: one embedding pass and one index query per distinct filter set"""
+    results, timing = await vector_store.search_batch([
+        {
+            "query": item.query,
+            "n_results": item.limit,
+            "mode": item.mode,
+            "filters": item.filters.to_dict() if item.filters else None
+        }
+        for item in request.queries
+    ])
+    return BatchQueryResponse(results=results, timing=timing)
@@ -4,6 +4,7 @@ from sqlalchemy import select
 from pydantic import BaseModel
 from datetime import datetime
 
+from app.api.deps import get_vector_store
 from app.core.database import get_db
 from app.models.source import KnowledgeSource
 from app.services.scraper import WebScraper
@@ -13,41 +14,74 @@ router = APIRouter()
 
 class ScrapeRequest(BaseModel):
     url: str
+    refresh: bool = False  # Re-scrape a URL that is already in the knowledge base
+
+def _chunk_metadata(url: str, source: KnowledgeSource, title: str) -> dict:
+    return {
+        "url": url,
+        "title": title,
+        "source_id": str(source.id),
+        "source_type": "web_scrape",
+        "created_at": source.created_at.timestamp()
+    }
 
 @router.post("/scrape")
 async def scrape_url(
     request: ScrapeRequest,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    vector_store: VectorStore = Depends(get_vector_store)
 ):
-    """Scrape a URL and add to knowledge base"""
+    """Scrape a URL and add to knowledge base
+
+    A failed "refresh" leaves the source, and as far as possible its chunks,
+    as they were and only reports the error.
+    """
     
     # Check if URL already exists
     result = await db.execute(
         select(KnowledgeSource).where(KnowledgeSource.url == request.url)
     )
     existing_source = result.scalar_one_or_none()
+    source = None
 
     if existing_source:
         # If it previously failed, allow retry by deleting and recreating
         if existing_source.status == "error":
+            # Chunks a failed attempt left behind would be orphaned under the old source_id
+            await vector_store.delete_by_source_id(str(existing_source.id), db=db)
             await db.delete(existing_source)
             await db.commit()
+        elif request.refresh:
+            # Update in place; only chunks whose text changed are re-embedded
+            source = existing_source
         else:
             return {"message": "URL already exists in knowledge base", "source_id": str(existing_source.id)}
     
-    # Create new source entry
-    source = KnowledgeSource(
-        url=request.url,
-        status="processing"
-    )
-    db.add(source)
-    await db.commit()
-    await db.refresh(source)
+    # A failed refresh keeps the source as it was; only a new source is marked as failed
+    refreshing = source is not None
+    previous = None
+    if refreshing and source.content:
+        previous = (source.content, _chunk_metadata(request.url, source, source.title or ""))
+
+    if source is None:
+        # Create new source entry
+        source = KnowledgeSource(
+            url=request.url,
+            status="processing"
+        )
+        db.add(source)
+        await db.commit()
+        await db.refresh(source)
+
+    sync_stats = None
+    sync_started = False
     
     try:
         # Scrape the URL
         scraper = WebScraper()
         scraped_data = await scraper.scrape_url(request.url)
+        if refreshing and scraped_data.get("status") != "completed":
+            raise Exception(scraped_data.get("metadata", {}).get("error", "scrape failed"))
         
         # Update source with scraped data
         source.title = scraped_data.get("title", "")
@@ -60,16 +94,13 @@ async def scrape_url(
         if scraped_data.get("status") == "completed" and scraped_data.get("content"):
             print(f"[SCRAPE] Adding to vector store: {scraped_data.get('title', 'Untitled')}")
             print(f"[SCRAPE] Content length: {len(scraped_data.get('content', ''))} characters")
-            vector_store = VectorStore()
-            doc_id = await vector_store.add_document(
+            sync_started = True
+            sync_stats = await vector_store.sync_document(
                 scraped_data["content"],
-                {
-                    "url": request.url,
-                    "title": scraped_data.get("title", ""),
-                    "source_id": str(source.id)
-                }
+                _chunk_metadata(request.url, source, scraped_data.get("title", "")),
+                db=db
             )
-            print(f"[SCRAPE] Added to vector store with doc_id: {doc_id}")
+            print(f"[SCRAPE] Added to vector store with doc_id: {sync_stats['first_id']}")
         
         await db.commit()
         
@@ -77,13 +108,26 @@ async def scrape_url(
             "message": "URL scraped successfully",
             "source_id": str(source.id),
             "title": source.title,
-            "status": source.status
+            "status": source.status,
+            "chunks": {key: sync_stats[key] for key in ("added", "kept", "removed")} if sync_stats else None
         }
         
     except Exception as e:
+        # Discard whatever the failed sync wrote (e.g. removed chunks) before recording the error
+        await db.rollback()
+
+        if refreshing:
+            if sync_started and previous is not None and not vector_store.transactional:
+                # The rollback cannot undo vectors the sync already wrote; put the previous chunks back
+                try:
+                    await vector_store.sync_document(*previous)
+                except Exception as restore_error:
+                    print(f"[SCRAPE] Could not restore the chunks of {request.url}: {restore_error}")
+            raise HTTPException(status_code=500, detail=f"Failed to refresh URL: {str(e)}")
+
         # Update source with error status
         source.status = "error"
         source.source_metadata = {"error": str(e)}
         await db.commit()
         
-        raise HTTPException(status_code=500, detail=f"Failed to scrape URL: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to scrape URL: {str(e)}")
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
-from typing import List, Optional
-from pydantic import BaseModel
+from sqlalchemy import select, desc, delete
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
 from datetime import datetime
 import uuid
 
+from app.api.deps import get_digests, get_vector_store
 from app.core.database import get_db
 from app.models.source import KnowledgeSource
+from app.services.digests import DigestService
 from app.services.vector_store import VectorStore
 
 router = APIRouter()
@@ -24,6 +26,9 @@ class SourceResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BulkDeleteRequest(BaseModel):
+    source_ids: List[uuid.UUID] = Field(..., min_length=1, max_length=1000)
+
 @router.get("/sources", response_model=List[SourceResponse])
 async def get_sources(
     limit: int = 50,
@@ -53,10 +58,16 @@ async def get_sources(
         for source in sources
     ]
 
+@router.get("/sources/overview")
+async def get_sources_overview(digests: DigestService = Depends(get_digests)) -> Dict[str, Any]:
+    """Cached overview of the whole knowledge base, built from the source digests"""
+    return await digests.overview()
+
 @router.delete("/sources/{source_id}")
 async def delete_source(
     source_id: uuid.UUID,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    vector_store: VectorStore = Depends(get_vector_store)
 ):
     """Delete a knowledge source and its vector embeddings"""
     try:
@@ -72,10 +83,10 @@ async def delete_source(
 
         print(f"[DELETE] Deleting source {source_id}: {source.title}")
 
-        # Delete vectors from ChromaDB FIRST (before DB deletion)
-        # This ensures we can still access source info if needed
-        vector_store = VectorStore()
-        vectors_deleted = await vector_store.delete_by_source_id(str(source_id))
+        # Delete vectors FIRST (before DB deletion)
+        # This ensures we can still access source info if needed; with pgvector
+        # the delete runs in this session and commits with the source
+        vectors_deleted = await vector_store.delete_by_source_id(str(source_id), db=db)
 
         # Then delete from database (CASCADE handles related records)
         await db.delete(source)
@@ -94,4 +105,47 @@ async def delete_source(
         await db.rollback()
         print(f"[DELETE] Error deleting source {source_id}: {e}")
         from fastapi import HTTPException
-        raise HTTPException(status_code=500, detail=f"Error deleting source: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error deleting source: {str(e)}")
+
+@router.delete("/sources")
+async def delete_sources(
+    request: BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db),
+    vector_store: VectorStore = Depends(get_vector_store)
+):
+    """Delete many knowledge sources and their vector embeddings
+
+    Vectors are deleted in batches of SOURCE_DELETE_BATCH_SIZE sources and the
+    sources in a single statement; unknown IDs are reported, not treated as errors.
+    """
+    source_ids = list(dict.fromkeys(str(source_id) for source_id in request.source_ids))
+    try:
+        result = await db.execute(
+            select(KnowledgeSource.id).where(KnowledgeSource.id.in_(source_ids))
+        )
+        found = [row[0] for row in result.all()]
+        found_ids = set(found)
+        not_found = [source_id for source_id in source_ids if source_id not in found_ids]
+
+        print(f"[DELETE] Deleting {len(found)} sources ({len(not_found)} not found)")
+
+        # Vectors first, as for a single source; with pgvector this joins the transaction
+        vectors_deleted = await vector_store.delete_by_source_ids(found, db=db)
+
+        if found:
+            await db.execute(delete(KnowledgeSource).where(KnowledgeSource.id.in_(found)))
+        await db.commit()
+
+        print(f"[DELETE] Deleted {len(found)} sources and {vectors_deleted} vectors")
+
+        return {
+            "message": "Sources and associated vectors deleted successfully",
+            "sources_deleted": len(found),
+            "vectors_deleted": vectors_deleted,
+            "not_found": not_found
+        }
+
+    except Exception as e:
+        await db.rollback()
+        print(f"[DELETE] Error deleting sources: {e}")
+        raise HTTPException(status_code=500, detail=f"Error deleting sources: {str(e)}")
@@ -5,6 +5,7 @@ from sqlalchemy import select
 from app.services.document_processor import DocumentProcessor
 from app.services.vector_store import VectorStore
 from app.models.source import KnowledgeSource
+from app.api.deps import get_vector_store
 from app.core.database import get_db
 from app.core.config import settings
 from datetime import datetime
@@ -12,7 +13,11 @@ from datetime import datetime
 router = APIRouter()
 
 @router.post("/upload")
-async def upload_document(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+async def upload_document(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    vector_store: VectorStore = Depends(get_vector_store)
+):
     """Upload and process documents (PDF, TXT, EPUB) with database and vector storage"""
     
     # Debug logging
@@ -107,25 +112,31 @@ async def upload_document(file: UploadFile = File(...), db: AsyncSession = Depen
             )
             db.add(db_source)
         
-        # Commit to database
-        await db.commit()
+        # Flush to get the source id; the commit happens once the chunks are stored
+        await db.flush()
         await db.refresh(db_source)
         
         # Add to vector store
-        vector_store = VectorStore()
         metadata = {
             "source_id": str(db_source.id),
             "title": db_source.title,
             "url": db_source.url,
             "source_type": "document_upload",
             "filename": file.filename,
-            "content_type": actual_content_type
+            "content_type": actual_content_type,
+            "created_at": db_source.created_at.timestamp()
         }
         
-        vector_doc_id = await vector_store.add_document(
+        # Re-uploads only embed the chunks that changed
+        sync_stats = await vector_store.sync_document(
             content=processed_doc.get("content", ""),
-            metadata=metadata
+            metadata=metadata,
+            db=db
         )
+        vector_doc_id = sync_stats["first_id"]
+        
+        # Commit the source (and, with pgvector, its chunks) in one transaction
+        await db.commit()
         
         print(f"DEBUG: Document added to vector store with ID: {vector_doc_id}")
         
@@ -139,6 +150,7 @@ async def upload_document(file: UploadFile = File(...), db: AsyncSession = Depen
             "content_length": len(processed_doc.get("content", "")),
             "source_id": str(db_source.id),
             "vector_doc_id": vector_doc_id,
+            "chunks": {key: sync_stats[key] for key in ("added", "kept", "removed")},
             "preview": processed_doc.get("content", "")[:200] + "..." if len(processed_doc.get("content", "")) > 200 else processed_doc.get("content", "")
         }
         
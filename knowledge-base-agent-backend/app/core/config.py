@@ -14,11 +14,127 @@ class Settings(BaseSettings):
     # Vector Database
     VECTOR_DB_TYPE: str = "chromadb"
     CHROMA_DB_PATH: str = "./data/chroma_db"
+    # VECTOR_DB_TYPE="numpy": memory-mapped brute-force index for small/medium knowledge bases
+    NUMPY_INDEX_PATH: str = "./data/numpy_index"
+    NUMPY_INDEX_DTYPE: str = "float16"  # "float16" or "int8"
+    # VECTOR_DB_TYPE="pgvector": knowledge_chunks table in DATABASE_URL (needs the vector extension)
+    PGVECTOR_EF_SEARCH: int = 100
+    EMBEDDING_DIMENSION: int = 384  # Width of the pgvector column; must match EMBEDDING_MODEL
+    EMBED_BATCH_SIZE: int = 64  # Chunks per embedding model call
+    VECTOR_WRITE_BATCH_SIZE: int = 1000  # Chunks per bulk collection.upsert/delete
+    SOURCE_DELETE_BATCH_SIZE: int = 200  # Sources per vector delete round trip (bulk DELETE /sources)
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+
+    # Embedder ("sentence-transformers" runs EMBEDDING_MODEL in PyTorch, "onnx" runs the
+    # export written by scripts/export_onnx_embedder.py through ONNX Runtime on CPU,
+    # "ollama" calls OLLAMA_EMBED_MODEL on the Ollama server)
+    EMBEDDER_BACKEND: str = "sentence-transformers"
+    ONNX_MODEL_PATH: str = "./data/onnx/all-MiniLM-L6-v2"
+    ONNX_QUANTIZED: bool = False  # int8 weights; vectors are versioned apart from float32 ones
+    ONNX_INTRA_OP_THREADS: int = 0  # 0 = ONNX Runtime default (one per physical core)
+    ONNX_INTER_OP_THREADS: int = 0
+
+    # Versioned indexes: the embedder and chunker settings above pick an index namespace.
+    # When they change, the new index is built from knowledge_sources in the background
+    # while the old one keeps serving, then swapped in (see app/services/index_registry.py)
+    VECTOR_INDEX_STATE_PATH: str = "./data/vector_index.json"
+    INDEX_MIGRATION_AUTO_START: bool = True
+    INDEX_MIGRATION_PAGE_SIZE: int = 50  # Sources re-indexed between progress updates
+
+    # Chunking ("tokens" sizes chunks in model word-pieces, "chars" is the legacy 1000/200 splitter)
+    CHUNKER: str = "tokens"
+    CHUNK_MAX_TOKENS: int = 256  # Capped at the embedding model's max_seq_length
+    CHUNK_OVERLAP_TOKENS: int = 32
+
+    # Search ("dense", "lexical" or "hybrid") and the BM25 index behind lexical/hybrid
+    SEARCH_MODE: str = "hybrid"
+    LEXICAL_INDEX_ENABLED: bool = True
+    LEXICAL_INDEX_PATH: str = "./data/bm25_index.pkl"
+    LEXICAL_INDEX_SAVE_INTERVAL_SECONDS: int = 30
+    LEXICAL_INDEX_CHECK_INTERVAL_SECONDS: int = 10  # How often searches look for a pickle rewritten by a script
+
+    # Diversified retrieval (chat context): MMR trade-off, per-source cap, candidate over-fetch
+    MMR_LAMBDA: float = 0.7
+    MAX_CHUNKS_PER_SOURCE: int = 2
+    DIVERSIFY_FETCH_MULTIPLIER: int = 4
+    CHAT_DIVERSIFY: bool = True
+
+    # POST /query and /query/batch
+    QUERY_MAX_LIMIT: int = 100  # Largest page ("limit"); page further with the cursor
+    QUERY_BATCH_MAX_QUERIES: int = 500
+
+    # Worker pools that keep embedding and Chroma calls off the event loop
+    EMBED_EXECUTOR: str = "thread"  # "thread" or "process"
+    EMBED_WORKERS: int = 1
+    VECTOR_IO_WORKERS: int = 4
+    EXECUTOR_MAX_PENDING: int = 64
+
+    # Embedding cache (content-addressed, on disk)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./data/embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_MB: int = 512
+
+    # Micro-batching of concurrent query encodes: flush at MAX_SIZE queued queries or after MAX_WAIT_MS
+    QUERY_MICROBATCH_ENABLED: bool = True
+    QUERY_MICROBATCH_MAX_SIZE: int = 32
+    QUERY_MICROBATCH_MAX_WAIT_MS: float = 5.0
+
+    # Query caches (in memory, invalidated by knowledge-base version)
+    QUERY_CACHE_TTL_SECONDS: int = 300
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = 4096
+    SEARCH_CACHE_MAX_ENTRIES: int = 1024
+
+    # Chat answer cache: reuses an answer when a question meets the same retrieved chunks
+    # (invalidated when any of their sources changes; see app/services/answer_cache.py)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 256
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # Query-embedding cosine for a match; 0 = exact text only
     
     # Ollama
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_CHAT_MODEL: str = "llama3.1:8b"
-    OLLAMA_EMBED_MODEL: str = "nomic-embed-text"
+    OLLAMA_EMBED_MODEL: str = "nomic-embed-text"  # EMBEDDER_BACKEND="ollama"
+    OLLAMA_EMBED_CONCURRENCY: int = 4  # Embedding requests in flight per API process
+    OLLAMA_EMBED_TIMEOUT_SECONDS: float = 60.0
+    OLLAMA_EMBED_MAX_RETRIES: int = 3
+    # Chat model client: one pooled keep-alive session per API process (see OllamaLLM)
+    OLLAMA_POOL_SIZE: int = 16  # Connections to Ollama per API process
+    OLLAMA_KEEPALIVE_SECONDS: float = 60.0  # Idle time before a pooled connection is closed
+    OLLAMA_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    OLLAMA_READ_TIMEOUT_SECONDS: float = 120.0  # Longest wait for the next bytes of a response
+    OLLAMA_TOTAL_TIMEOUT_SECONDS: float = 300.0  # Upper bound on a whole generation
+    # Scheduler in front of the model: match OLLAMA_MAX_CONCURRENCY to the server's OLLAMA_NUM_PARALLEL
+    OLLAMA_MAX_CONCURRENCY: int = 2
+    OLLAMA_MAX_QUEUE: int = 16  # Chat/title calls waiting before new ones get 503
+    OLLAMA_QUEUE_TIMEOUT_SECONDS: float = 30.0  # Longest a chat/title call waits for a slot
+    # Prompt budget: context is packed into OLLAMA_NUM_CTX minus the answer's OLLAMA_NUM_PREDICT
+    OLLAMA_NUM_CTX: int = 8192
+    OLLAMA_NUM_PREDICT: int = 1024
+    CONTEXT_CHARS_PER_TOKEN: float = 3.5  # Plain-text characters per token in the estimate; see "prompts" on /metrics
+    CONTEXT_SAFETY_MARGIN: float = 0.05  # Share of OLLAMA_NUM_CTX left unused, since prompt sizes are estimates
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps the chat model (and conversation KV cache) loaded
+
+    # Multi-turn chat: follow-ups continue the session's conversation through Ollama's /api/chat
+    CHAT_HISTORY_ENABLED: bool = True
+    CHAT_HISTORY_MAX_TOKENS: int = 3072  # Turns kept verbatim, context included; leaves the rest of OLLAMA_NUM_CTX to the new turn
+    CHAT_HISTORY_KEEP_TURNS: int = 1  # Most recent turns never folded into the summary
+    CHAT_SUMMARY_TOKENS: int = 300
+    CHAT_SESSION_CACHE_MAX_ENTRIES: int = 256
+    CHAT_SESSION_CACHE_TTL_SECONDS: int = 3600
+    # A message is searched together with the previous question only if it refers back to it
+    # ("it", "what about ...") or its embedding is at least this similar to the previous question's
+    CHAT_FOLLOW_UP_SIMILARITY: float = 0.5
+
+    # Source digests and knowledge-base overview for summary/listing questions
+    DIGESTS_ENABLED: bool = True
+    DIGEST_METHOD: str = "llm"  # "llm" (falls back to extractive if the model fails) or "extractive"
+    DIGEST_SUMMARY_CHARS: int = 600
+    DIGEST_KEYWORDS: int = 8
+    DIGEST_INPUT_CHARS: int = 6000  # Start of the document the model summarizes
+    DIGEST_GROUP_SIZE: int = 16  # Digests (or group summaries) per overview group
+    DIGEST_OVERVIEW_TOKENS: int = 400  # Length of each group summary and of the overview
+    DIGEST_REFRESH_DELAY_SECONDS: float = 5.0  # Wait after a change so a burst of uploads is digested together
     
     # API
     API_V1_STR: str = "/api/v1"
@@ -1,9 +1,84 @@
+from contextlib import asynccontextmanager
+import asyncio
+
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import chat, scrape, sources, query, upload, upload_simple
+from fastapi.responses import JSONResponse
+from app.api.endpoints import chat, index, scrape, sources, query, upload, upload_simple
 from app.core.config import settings
+from app.services.answer_cache import AnswerCache
+from app.services.conversations import ConversationCache
+from app.services.digests import DigestService
+from app.services.index_registry import VectorIndexRegistry
+from app.services.llm import OllamaLLM
+
+# How long shutdown waits for a vector store that is still warming up
+WARMUP_SHUTDOWN_TIMEOUT_SECONDS = 10
+
+async def _start_vector_store(app: FastAPI):
+    """Open the live index off the event loop (loading its embedding model), then publish it"""
+    try:
+        await app.state.vector_indexes.open()
+        print("[STARTUP] Vector store ready")
+    except Exception as e:
+        app.state.vector_store_error = str(e)
+        print(f"[STARTUP] Failed to initialise vector store: {e}")
+
+async def _start_digests(app: FastAPI):
+    """Digest sources added while the API was down and reconcile the knowledge-base overview"""
+    try:
+        await app.state.digests.start()
+    except Exception as e:
+        print(f"[STARTUP] Failed to start source digests: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.vector_indexes = VectorIndexRegistry()
+    app.state.llm = OllamaLLM()
+    app.state.answer_cache = AnswerCache(
+        settings.ANSWER_CACHE_MAX_ENTRIES if settings.ANSWER_CACHE_ENABLED else 0,
+        settings.ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+    )
+    # Answers built from a source are dropped as soon as the source changes
+    app.state.vector_indexes.source_listeners.append(app.state.answer_cache.invalidate_sources)
+    app.state.conversations = ConversationCache(
+        app.state.llm,
+        settings.CHAT_SESSION_CACHE_MAX_ENTRIES,
+        settings.CHAT_SESSION_CACHE_TTL_SECONDS
+    )
+    app.state.digests = DigestService(app.state.llm)
+    # Kept so it is not garbage-collected mid-run and can be stopped on shutdown
+    app.state.digests_task = None
+    if settings.DIGESTS_ENABLED:
+        app.state.vector_indexes.source_listeners.append(app.state.digests.sources_changed)
+        # Cached knowledge-base summaries would describe the previous overview
+        app.state.digests.overview_listeners.append(lambda: app.state.answer_cache.invalidate_sources([]))
+        app.state.digests_task = asyncio.create_task(_start_digests(app))
+    app.state.vector_store_error = None
+    # Warm up in the background so /health answers while the model loads
+    warmup_task = asyncio.create_task(_start_vector_store(app))
 
-app = FastAPI(title="Knowledge Base Agent API", version="1.0.0")
+    yield
+
+    try:
+        # Let a warm-up that is nearly done finish, then stop waiting for it. Work already running
+        # in its thread cannot be interrupted (and interpreter exit still waits for it); the
+        # registry closes that store when it arrives
+        await asyncio.wait_for(warmup_task, WARMUP_SHUTDOWN_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"[SHUTDOWN] Vector store still warming up after {WARMUP_SHUTDOWN_TIMEOUT_SECONDS}s; not waiting for it")
+    if app.state.digests_task is not None:
+        app.state.digests_task.cancel()
+        await asyncio.gather(app.state.digests_task, return_exceptions=True)
+    await app.state.digests.close()
+    await app.state.conversations.close()
+    await app.state.vector_indexes.close()
+    print("[SHUTDOWN] Vector store closed")
+    await app.state.llm.close()
+    print("[SHUTDOWN] LLM client closed")
+
+app = FastAPI(title="Knowledge Base Agent API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +90,7 @@ app.add_middleware(
 
 # Include API routers
 app.include_router(chat.router, prefix=settings.API_V1_STR, tags=["chat"])
+app.include_router(index.router, prefix=settings.API_V1_STR, tags=["index"])
 app.include_router(scrape.router, prefix=settings.API_V1_STR, tags=["scrape"])
 app.include_router(sources.router, prefix=settings.API_V1_STR, tags=["sources"])
 app.include_router(query.router, prefix=settings.API_V1_STR, tags=["query"])
@@ -29,6 +105,35 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check():
+    """Report whether the live vector index has finished warming up"""
+    vector_store = app.state.vector_indexes.active
+    if vector_store is None or not vector_store.is_ready:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "error" if app.state.vector_store_error else "warming_up",
+                "vector_store": False,
+                "error": app.state.vector_store_error
+            }
+        )
+    return {"status": "ready", "vector_store": True}
+
+@app.get("/metrics")
+def metrics():
+    """Runtime metrics for the shared services"""
+    registry = app.state.vector_indexes
+    vector_store = registry.active
+    return {
+        "vector_store": vector_store.metrics() if vector_store is not None else None,
+        "vector_index": registry.status(),
+        "llm": app.state.llm.stats(),
+        "answer_cache": app.state.answer_cache.stats(),
+        "digests": app.state.digests.stats(),
+        "conversations": app.state.conversations.stats()
+    }
+
 @app.post("/test-upload")
 async def test_upload_endpoint(file: UploadFile = File(...)):
     """Simple test upload endpoint"""
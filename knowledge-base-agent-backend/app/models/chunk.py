@@ -0,0 +1,47 @@
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from pgvector.sqlalchemy import Vector
+from app.core.config import settings
+from app.core.database import Base
+
+# Collection of indexes created before namespacing; it keeps the table-level HNSW index
+DEFAULT_COLLECTION = "knowledge_base"
+
+class KnowledgeChunk(Base):
+    """Embedded chunk of a knowledge source (VECTOR_DB_TYPE="pgvector")
+
+    collection namespaces the rows by index (embedding model and chunker, see
+    index_registry), so a new index can be built next to the live one.
+    """
+    __tablename__ = "knowledge_chunks"
+
+    collection = Column(String(100), primary_key=True, default=DEFAULT_COLLECTION, server_default=DEFAULT_COLLECTION)
+    id = Column(String(100), primary_key=True)
+    source_id = Column(String(36), ForeignKey("knowledge_sources.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False, default=0)
+    content = Column(Text, nullable=False)
+    chunk_metadata = Column(JSONB, nullable=False, default=dict)
+    embedding = Column(Vector(settings.EMBEDDING_DIMENSION), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index(
+            "idx_knowledge_chunks_embedding",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            # Other collections get partial indexes of their own (PgVectorCollection.ensure_index)
+            postgresql_where=text(f"collection = '{DEFAULT_COLLECTION}'")
+        ),
+    )
+
+
+class VectorCollection(Base):
+    """Collection-level metadata such as the embedder that produced its vectors (Chroma keeps this on the collection)"""
+    __tablename__ = "vector_collections"
+
+    name = Column(String(100), primary_key=True)
+    collection_metadata = Column(JSONB, nullable=False, default=dict)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
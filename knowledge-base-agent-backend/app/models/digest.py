@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class SourceDigest(Base):
+    """Short summary and topic keywords of a knowledge source, computed at ingest (see app.services.digests)"""
+    __tablename__ = "source_digests"
+
+    source_id = Column(String(36), ForeignKey("knowledge_sources.id", ondelete="CASCADE"), primary_key=True)
+    content_hash = Column(String(64), nullable=False)  # sha256 of the content the digest was made from
+    summary = Column(Text, nullable=False)
+    keywords = Column(JSON, nullable=False, default=list)
+    method = Column(String(20), nullable=False)  # "llm" or "extractive"
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class DigestGroup(Base):
+    """One node of the knowledge-base summary tree
+
+    Level 1 groups summarize up to DIGEST_GROUP_SIZE source digests, level
+    2 groups summarize level 1 groups, and so on; the single group of the
+    top level is the knowledge-base overview. fingerprint covers the
+    members' text, so a group is only summarized again when it changes.
+    """
+    __tablename__ = "digest_groups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    level = Column(Integer, nullable=False, index=True)
+    members = Column(JSON, nullable=False, default=list)  # source IDs (level 1) or group IDs
+    fingerprint = Column(String(64), nullable=False)
+    summary = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
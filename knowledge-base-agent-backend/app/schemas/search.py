@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+
+class SearchFilters(BaseModel):
+    """Metadata filters applied inside the vector index rather than after retrieval"""
+    source_ids: Optional[List[str]] = None
+    domain: Optional[str] = None
+    source_type: Optional[str] = None
+    content_type: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict of the filters that are set, as VectorStore.search expects"""
+        filters = self.model_dump(exclude_none=True)
+        for key in ("created_after", "created_before"):
+            if key in filters:
+                filters[key] = filters[key].timestamp()
+        return filters
@@ -0,0 +1,163 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EmbedQuery = Callable[[], Awaitable[List[float]]]
+
+
+class AnswerCache:
+    """Generated chat answers, reused when the same question meets the same context.
+
+    Answers are grouped by everything the prompt is built from besides the
+    question: the index namespace, the chat model, the prompt kind
+    (knowledge-base summary or not) and the exact set of retrieved chunk
+    IDs. Within a group a question matches a cached one when their
+    normalised text is equal or, with similarity_threshold > 0, when their
+    query embeddings have at least that cosine similarity.
+
+    An entry is dropped when a source behind any of its chunks is written or
+    deleted (invalidate_sources). Knowledge-base summaries also list every
+    source, so any change drops those. An answer whose generation overlapped
+    an invalidation is not stored (see generation).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # (group, normalised question) -> (answer, expires_at, embedding, source_ids, kb_wide)
+        self._entries: "OrderedDict[Tuple[Hashable, str], tuple]" = OrderedDict()
+        self._groups: Dict[Hashable, set] = {}
+        self._by_source: Dict[str, set] = {}
+        self._kb_wide: set = set()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation
+        self.generation = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidated = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def group_key(index: str, model: str, kb_wide: bool, chunk_ids: Iterable[str]) -> Hashable:
+        return (index, model, kb_wide, tuple(sorted(chunk_ids)))
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Case, spacing and trailing punctuation don't change the question"""
+        return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+    async def get(self, group: Hashable, query: str, embed: EmbedQuery) -> Optional[str]:
+        """Cached answer for query in group, or None; embed is only awaited for a similarity match"""
+        if not self.enabled:
+            return None
+        key = (group, self.normalize(query))
+        with self._lock:
+            candidates = [
+                (self._entries[other][2], other)
+                for other in self._groups.get(group, ())
+                if other != key and self._entries[other][2] is not None
+            ]
+            exact = key in self._entries
+
+        semantic = False
+        if not exact and candidates and self.similarity_threshold > 0:
+            query_vector = self._unit(await embed())
+            similarity, best = max((float(vector @ query_vector), other) for vector, other in candidates)
+            if similarity >= self.similarity_threshold:
+                key, semantic = best, True
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.semantic_hits += semantic
+            return entry[0]
+
+    async def put(
+        self,
+        group: Hashable,
+        query: str,
+        answer: str,
+        source_ids: Iterable[str],
+        embed: EmbedQuery,
+        generation: int
+    ) -> None:
+        """Store answer unless a source changed since generation (read before generating)"""
+        if not self.enabled:
+            return
+        embedding = self._unit(await embed()) if self.similarity_threshold > 0 else None
+        key = (group, self.normalize(query))
+        kb_wide = group[2]
+        source_ids = frozenset(source_ids)
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, time.monotonic() + self.ttl_seconds, embedding, source_ids, kb_wide)
+            self._groups.setdefault(group, set()).add(key)
+            for source_id in source_ids:
+                self._by_source.setdefault(source_id, set()).add(key)
+            if kb_wide:
+                self._kb_wide.add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_sources(self, source_ids: List[str]) -> None:
+        """Drop answers built from any of source_ids, and every knowledge-base summary"""
+        with self._lock:
+            self.generation += 1
+            keys = set(self._kb_wide)
+            for source_id in source_ids:
+                keys.update(self._by_source.get(source_id, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidated += len(keys)
+
+    def _remove(self, key: Tuple[Hashable, str]) -> None:
+        _, _, _, source_ids, kb_wide = self._entries.pop(key)
+        group = key[0]
+        self._groups[group].discard(key)
+        if not self._groups[group]:
+            del self._groups[group]
+        for source_id in source_ids:
+            keys = self._by_source[source_id]
+            keys.discard(key)
+            if not keys:
+                del self._by_source[source_id]
+        if kb_wide:
+            self._kb_wide.discard(key)
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidated": self.invalidated
+            }
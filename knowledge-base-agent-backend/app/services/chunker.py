@@ -0,0 +1,201 @@
+import re
+import threading
+from collections import deque
+from typing import Iterator, List, NamedTuple, Tuple
+
+_PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n\s*')
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+# Segments are token-counted in batches so the fast tokenizer can parallelise
+_COUNT_BATCH = 1024
+
+# Bump when chunk boundaries change for the same settings, so indexes are rebuilt (see index_registry)
+CHUNKER_VERSION = 1
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character offset of the chunk in the source text
+    end: int
+    token_count: int
+
+
+class _Unit(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    paragraph_start: bool
+
+
+def load_tokenizer(model_name: str):
+    """Load the Hugging Face tokenizer behind a sentence-transformers model name"""
+    from transformers import AutoTokenizer
+
+    try:
+        return AutoTokenizer.from_pretrained(model_name)
+    except OSError:
+        return AutoTokenizer.from_pretrained(f"sentence-transformers/{model_name}")
+
+
+def chunker_version(config) -> str:
+    """Short tag for the chunking an index is built with, e.g. "t256o32v1" (tokens) or "c1000o200" (chars)"""
+    if config.CHUNKER == "tokens":
+        return f"t{config.CHUNK_MAX_TOKENS}o{config.CHUNK_OVERLAP_TOKENS}v{CHUNKER_VERSION}"
+    return "c1000o200"
+
+
+def _trim(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+class TokenChunker:
+    """Split text into chunks measured in model tokens rather than characters.
+
+    Sentences are packed greedily into chunks of at most max_tokens word-pieces
+    (so nothing is silently truncated by the embedding model), breaking early
+    at a paragraph boundary once a chunk is mostly full. Consecutive chunks
+    share up to overlap_tokens of trailing sentences. Sentences longer than
+    max_tokens are split on token boundaries. Each unit is added and dropped
+    once, so the pass is linear in the length of the text.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int = 254, overlap_tokens: int = 32):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        # Fast tokenizers raise "Already borrowed" when shared across threads
+        self._lock = threading.Lock()
+
+    def chunk(self, text: str) -> List[Chunk]:
+        chunks = []
+        window = deque()
+        window_tokens = 0
+
+        def emit():
+            start, end = window[0].start, window[-1].end
+            chunks.append(Chunk(text[start:end], start, end, window_tokens))
+
+        for unit in self._units(text):
+            if window:
+                overflow = window_tokens + unit.tokens > self.max_tokens
+                paragraph_break = unit.paragraph_start and window_tokens >= self.max_tokens * 3 // 4
+                if overflow or paragraph_break:
+                    emit()
+                    # Carry trailing sentences forward as overlap, as long as the
+                    # next unit still fits alongside them
+                    while window and (
+                        window_tokens > self.overlap_tokens
+                        or window_tokens + unit.tokens > self.max_tokens
+                    ):
+                        window_tokens -= window.popleft().tokens
+
+            window.append(unit)
+            window_tokens += unit.tokens
+
+        # Skip a trailing window that is pure overlap of the previous chunk
+        if window and (not chunks or window[-1].end > chunks[-1].end):
+            emit()
+
+        return chunks
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        with self._lock:
+            encoded = self.tokenizer(
+                texts,
+                add_special_tokens=False,
+                return_attention_mask=False,
+                return_token_type_ids=False
+            )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _units(self, text: str) -> Iterator[_Unit]:
+        pending: List[Tuple[int, int, bool]] = []
+        for segment in self._segments(text):
+            pending.append(segment)
+            if len(pending) >= _COUNT_BATCH:
+                yield from self._count(text, pending)
+                pending = []
+        if pending:
+            yield from self._count(text, pending)
+
+    def _count(self, text: str, segments: List[Tuple[int, int, bool]]) -> Iterator[_Unit]:
+        counts = self.count_tokens([text[start:end] for start, end, _ in segments])
+        for (start, end, paragraph_start), tokens in zip(segments, counts):
+            if tokens <= self.max_tokens:
+                yield _Unit(start, end, tokens, paragraph_start)
+            else:
+                yield from self._split_long(text, start, end, paragraph_start)
+
+    def _split_long(self, text: str, start: int, end: int, paragraph_start: bool) -> Iterator[_Unit]:
+        """Cut a sentence that exceeds max_tokens on token boundaries"""
+        with self._lock:
+            offsets = self.tokenizer(
+                text[start:end],
+                add_special_tokens=False,
+                return_offsets_mapping=True
+            )["offset_mapping"]
+
+        step = self.max_tokens - self.overlap_tokens
+        for i in range(0, len(offsets), step):
+            window = offsets[i:i + self.max_tokens]
+            piece_start, piece_end = _trim(text, start + window[0][0], start + window[-1][1])
+            yield _Unit(piece_start, piece_end, len(window), paragraph_start and i == 0)
+            if i + self.max_tokens >= len(offsets):
+                break
+
+    @staticmethod
+    def _segments(text: str) -> Iterator[Tuple[int, int, bool]]:
+        """Yield (start, end, starts_paragraph) for each sentence, whitespace-trimmed"""
+        paragraph_start = 0
+        for paragraph_break in _PARAGRAPH_BREAK.finditer(text):
+            yield from TokenChunker._sentences(text, paragraph_start, paragraph_break.start())
+            paragraph_start = paragraph_break.end()
+        yield from TokenChunker._sentences(text, paragraph_start, len(text))
+
+    @staticmethod
+    def _sentences(text: str, paragraph_start: int, paragraph_end: int) -> Iterator[Tuple[int, int, bool]]:
+        first = True
+        sentence_start = paragraph_start
+        for match in _SENTENCE_BREAK.finditer(text, paragraph_start, paragraph_end):
+            start, end = _trim(text, sentence_start, match.start())
+            if start < end:
+                yield start, end, first
+                first = False
+            sentence_start = match.end()
+        start, end = _trim(text, sentence_start, paragraph_end)
+        if start < end:
+            yield start, end, first
+
+
+def chunk_by_characters(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Chunk]:
+    """The original fixed-size character chunker, kept for comparison benchmarks"""
+    if len(text) <= chunk_size:
+        start, end = _trim(text, 0, len(text))
+        return [Chunk(text[start:end], start, end, 0)]
+
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_size
+
+        # Try to break at sentence boundaries
+        if end < len(text):
+            sentence_end = text.rfind('.', start, end)
+            if sentence_end != -1 and sentence_end > start + chunk_size // 2:
+                end = sentence_end + 1
+
+        chunk_start, chunk_end = _trim(text, start, min(end, len(text)))
+        chunks.append(Chunk(text[chunk_start:chunk_end], chunk_start, chunk_end, 0))
+        start = end - overlap
+
+        if start >= len(text):
+            break
+
+    return chunks
@@ -0,0 +1,134 @@
+import math
+import re
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+from app.services.diversify import group_adjacent, join_passage
+
+# A passage cut shorter than this is not worth including
+_MIN_TRUNCATED_TOKENS = 64
+
+# Synthetic documents (the knowledge-base inventory) may take at most this share of the budget
+_MAX_SYSTEM_SHARE = 0.5
+
+_TRUNCATION_MARK = "\n[...]"
+
+# Characters that tokenizers rarely merge with their neighbours: ASCII punctuation and
+# symbols (code, URLs, tables) and anything outside ASCII (accents, non-Latin scripts)
+_DENSE_CHARS = re.compile(r"[^\sA-Za-z0-9]")
+
+# Prompts shorter than this (by estimate) do not calibrate it
+_MIN_CALIBRATION_TOKENS = 256
+
+# Tokens Ollama evaluated per estimated token, for recent prompts (see record_evaluation)
+_observed_ratios = deque(maxlen=200)
+
+
+def _raw_estimate(text: str) -> float:
+    dense = len(_DENSE_CHARS.findall(text))
+    return (len(text) - dense) / settings.CONTEXT_CHARS_PER_TOKEN + dense
+
+
+def estimate_tokens(text: str) -> int:
+    """Prompt tokens for text: an estimate, not a count, erring on the high side
+
+    Plain words and digits count CONTEXT_CHARS_PER_TOKEN characters per
+    token, every other character a token of its own. The result is scaled
+    up when Ollama has reported evaluating more tokens than estimated.
+    """
+    return math.ceil(_raw_estimate(text) * correction())
+
+
+def correction() -> float:
+    """Factor estimates are scaled by: the largest recent undercount Ollama reported, at least 1"""
+    return max(1.0, *_observed_ratios) if _observed_ratios else 1.0
+
+
+def record_evaluation(prompt: str, evaluated_tokens: int) -> None:
+    """Calibrate estimate_tokens with the prompt_eval_count Ollama reported for a whole prompt"""
+    estimate = _raw_estimate(prompt)
+    # Short prompts are dominated by the template tokens Ollama adds around them
+    if estimate >= _MIN_CALIBRATION_TOKENS and evaluated_tokens > 0:
+        _observed_ratios.append(evaluated_tokens / estimate)
+
+
+def format_document(document: Dict[str, Any]) -> str:
+    """How a context document appears in the prompt"""
+    return f"Source: {document.get('metadata', {}).get('url', 'Unknown')}\n{document.get('content', '')}"
+
+
+def _is_system(document: Dict[str, Any]) -> bool:
+    return document.get("metadata", {}).get("source_type") == "system"
+
+
+def _truncate(document: Dict[str, Any], tokens: int) -> Dict[str, Any]:
+    """document with its content cut so it formats to at most tokens tokens (by estimate_tokens)"""
+    content = document.get("content", "")
+    chars = len(content)
+    while True:
+        # Shrink in proportion to the overshoot; token density varies along the text
+        truncated = {**document, "content": content[:chars].rstrip() + _TRUNCATION_MARK}
+        used = estimate_tokens(format_document(truncated))
+        if used <= tokens or chars == 0:
+            return truncated
+        chars = int(chars * min(0.95, tokens / used))
+        cut = content.rfind("\n", 0, chars)
+        if cut >= chars // 2:
+            chars = cut
+
+
+def pack_context(context: List[Dict[str, Any]], budget_tokens: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Fit retrieved documents into budget_tokens of prompt
+
+    Consecutive chunks of the same source are joined into one passage
+    without their repeated overlap. Passages are then taken in order of
+    relevance: synthetic documents (the knowledge-base inventory, capped at
+    half the budget) first, then search results in rank order. A passage
+    that no longer fits is cut to the space left if that is still useful,
+    otherwise dropped, so the lowest-ranked results go first.
+
+    Returns (documents, report), documents in the order they were taken and
+    report counting tokens, passages kept and dropped, and overlap removed.
+    """
+    ranked = list(enumerate(context))
+    searched = [document for _, document in ranked if not _is_system(document)]
+    rank = {id(document): position for position, document in ranked}
+
+    passages = []
+    overlap_chars = 0
+    for group in group_adjacent(searched):
+        passage = join_passage(searched, group)
+        # Joining only removes text, apart from a newline between chunks that did not overlap
+        overlap_chars += max(0, sum(len(searched[i].get("content", "")) for i in group) - len(passage.get("content", "")))
+        passages.append((min(rank[id(searched[i])] for i in group), passage))
+
+    candidates = [(position, document) for position, document in ranked if _is_system(document)]
+    candidates += sorted(passages, key=lambda item: item[0])
+
+    packed, used, dropped, truncated = [], 0, 0, 0
+    for _, document in candidates:
+        remaining = budget_tokens - used
+        if _is_system(document):
+            remaining = min(remaining, int(budget_tokens * _MAX_SYSTEM_SHARE))
+        tokens = estimate_tokens(format_document(document))
+        if tokens > remaining:
+            if remaining < _MIN_TRUNCATED_TOKENS:
+                dropped += 1
+                continue
+            document = _truncate(document, remaining)
+            tokens = estimate_tokens(format_document(document))
+            truncated += 1
+        packed.append(document)
+        used += tokens
+
+    return packed, {
+        "budget_tokens": budget_tokens,
+        "estimated_context_tokens": used,
+        "documents_in": len(context),
+        "passages": len(candidates),
+        "passages_kept": len(packed),
+        "passages_dropped": dropped,
+        "passages_truncated": truncated,
+        "overlap_chars_removed": overlap_chars
+    }
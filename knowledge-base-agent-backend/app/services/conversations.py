@@ -0,0 +1,215 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.chat import ChatMessage
+from app.services.context_packer import estimate_tokens
+from app.services.llm import ERROR_RESPONSE, OllamaLLM
+
+
+class Turn(NamedTuple):
+    question: str
+    content: str  # The user message as sent to the model, with its context
+    answer: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.content) + estimate_tokens(self.answer)
+
+
+class Conversation:
+    """What the model has seen of one chat session
+
+    Turns keep the user messages exactly as they were sent, context
+    included, so every request repeats the previous one as its prefix and
+    Ollama can reuse its KV cache. Turns beyond the history budget are
+    folded into summary (see ConversationCache.compact).
+    """
+
+    def __init__(self, turns: Optional[List[Turn]] = None):
+        self.summary: Optional[str] = None
+        self.turns: List[Turn] = turns or []
+        self.compacting = False
+        self.used_at = time.monotonic()
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary or "") + sum(turn.tokens for turn in self.turns)
+
+    @property
+    def last_question(self) -> Optional[str]:
+        return self.turns[-1].question if self.turns else None
+
+    def contains(self, text: str) -> bool:
+        """Whether text was already sent in a turn the model still sees, so a new turn need not repeat it"""
+        return bool(text) and any(text in turn.content for turn in self.turns)
+
+    def history(self, max_tokens: int) -> List[Dict[str, str]]:
+        """Messages for the next request: the summary, then the most recent turns that fit max_tokens
+
+        Turns only have to be dropped here while a compaction is behind.
+        """
+        turns, used = [], estimate_tokens(self.summary or "")
+        for turn in reversed(self.turns):
+            used += turn.tokens
+            if used > max_tokens and turns:
+                break
+            turns.append(turn)
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{self.summary}"})
+        for turn in reversed(turns):
+            messages.append({"role": "user", "content": turn.content})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+
+class ConversationCache:
+    """Conversations of recently active chat sessions, least recently used first out.
+
+    A session that is not cached (new process, evicted, expired) is
+    rebuilt from its stored messages, without their retrieved context.
+    When a conversation grows past CHAT_HISTORY_MAX_TOKENS, its oldest
+    turns (all but the last CHAT_HISTORY_KEEP_TURNS) are summarized in the
+    background at batch priority and replaced by a rolling summary.
+    """
+
+    def __init__(self, llm: OllamaLLM, max_sessions: int, ttl_seconds: float):
+        self.llm = llm
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._tasks = set()
+        # Seconds from request to answer, for a session's first turn and for follow-ups
+        self._turn_seconds = {"first": deque(maxlen=1000), "follow_up": deque(maxlen=1000)}
+        self._stats = {
+            "hits": 0,
+            "loaded": 0,
+            "evicted": 0,
+            "compactions": 0,
+            "compaction_failures": 0,
+            "turns_summarized": 0
+        }
+
+    async def get(self, session_id: str) -> Conversation:
+        """The session's conversation, rebuilt from the database if it is not cached"""
+        conversation = self._conversations.get(session_id)
+        if conversation is not None and time.monotonic() - conversation.used_at < self.ttl_seconds:
+            self._conversations.move_to_end(session_id)
+            conversation.used_at = time.monotonic()
+            self._stats["hits"] += 1
+            return conversation
+
+        conversation = Conversation(turns=await self._load_turns(session_id))
+        self._stats["loaded"] += 1
+        self._conversations[session_id] = conversation
+        self._conversations.move_to_end(session_id)
+        while len(self._conversations) > self.max_sessions:
+            self._conversations.popitem(last=False)
+            self._stats["evicted"] += 1
+        if conversation.tokens > settings.CHAT_HISTORY_MAX_TOKENS:
+            self._spawn(self.compact(conversation))
+        return conversation
+
+    @staticmethod
+    async def _load_turns(session_id: str) -> List[Turn]:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(ChatMessage.role, ChatMessage.content)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.created_at)
+            )
+            rows = result.all()
+        turns, question = [], None
+        for role, content in rows:
+            if role == "user":
+                question = content
+            elif question is not None:
+                if content != ERROR_RESPONSE:
+                    turns.append(Turn(question=question, content=f"Question: {question}", answer=content))
+                question = None
+        return turns
+
+    def add_turn(
+        self,
+        conversation: Conversation,
+        question: str,
+        content: str,
+        answer: str
+    ) -> None:
+        """Record an answered turn; content is the user message as sent to the model"""
+        if answer == ERROR_RESPONSE:
+            return
+        conversation.turns.append(Turn(question=question, content=content, answer=answer))
+        conversation.used_at = time.monotonic()
+        if conversation.tokens > settings.CHAT_HISTORY_MAX_TOKENS and not conversation.compacting:
+            self._spawn(self.compact(conversation))
+
+    def record_latency(self, first_turn: bool, seconds: float) -> None:
+        self._turn_seconds["first" if first_turn else "follow_up"].append(seconds)
+
+    async def compact(self, conversation: Conversation) -> None:
+        """Fold the oldest turns into the rolling summary; if the model fails they are only dropped"""
+        if conversation.compacting:
+            return
+        keep = max(1, settings.CHAT_HISTORY_KEEP_TURNS)
+        old = conversation.turns[:-keep]
+        if not old:
+            return
+        conversation.compacting = True
+        try:
+            exchanges = "\n\n".join(f"User: {turn.question}\nAssistant: {turn.answer}" for turn in old)
+            previous = f"Summary so far:\n{conversation.summary}\n\n" if conversation.summary else ""
+            prompt = f"""{previous}Conversation to add:
+{exchanges}
+
+Write a concise summary of the whole conversation so far: the questions asked, the answers given and any facts, names or preferences needed to follow up. Summary:"""
+            summary = await self.llm.complete(prompt, max_tokens=settings.CHAT_SUMMARY_TOKENS)
+            if summary is None:
+                self._stats["compaction_failures"] += 1
+                print(f"[CHAT] Could not summarize {len(old)} turns; dropping them from the model's history")
+            else:
+                conversation.summary = summary
+            # Turns added meanwhile come after these, so removing the prefix is safe
+            del conversation.turns[:len(old)]
+            self._stats["compactions"] += 1
+            self._stats["turns_summarized"] += len(old)
+        finally:
+            conversation.compacting = False
+        # Turns may have been added while the model was summarizing
+        if conversation.tokens > settings.CHAT_HISTORY_MAX_TOKENS and len(conversation.turns) > keep:
+            self._spawn(self.compact(conversation))
+
+    def discard(self, session_id: str) -> None:
+        self._conversations.pop(session_id, None)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        latency = {}
+        for kind, samples in self._turn_seconds.items():
+            samples = sorted(samples)
+            latency[kind] = {
+                "samples": len(samples),
+                "p50_ms": round(1000 * samples[len(samples) // 2], 1) if samples else None,
+                "p95_ms": round(1000 * samples[int(len(samples) * 0.95)], 1) if samples else None
+            }
+        return {
+            **self._stats,
+            "sessions": len(self._conversations),
+            "max_sessions": self.max_sessions,
+            "turn_latency": latency
+        }
@@ -0,0 +1,423 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.digest import DigestGroup, SourceDigest
+from app.models.source import KnowledgeSource
+from app.services.lexical_index import tokenize
+from app.services.llm import OllamaLLM
+
+_STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are as at be because been before being below
+    between both but by can could did do does doing down during each few for from further had has have having
+    he her here hers him his how however i if in into is it its itself just may me might more most must my
+    no nor not now of off on once only or other our ours out over own same she should so some such than that
+    the their theirs them then there these they this those through to too under until up very was we were
+    what when where which while who whom why will with would you your yours also use used using one two new
+    like get make many much well way even still see within without via per etc
+""".split())
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_KEYWORD = re.compile(r"[a-z][a-z-]+")
+
+# Sentences an extractive summary chooses from; the lead of a long document is enough
+_MAX_SENTENCES = 400
+
+
+class DigestError(Exception):
+    """The language model could not summarize part of the knowledge base"""
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _keyword_counts(text: str) -> Counter:
+    return Counter(
+        token for token in tokenize(text)
+        if len(token) > 2 and token not in _STOPWORDS and _KEYWORD.fullmatch(token)
+    )
+
+
+def extract_keywords(text: str, limit: int) -> List[str]:
+    """The most frequent content words of text"""
+    return [word for word, _ in _keyword_counts(text).most_common(limit)]
+
+
+def extractive_summary(text: str, max_chars: int) -> str:
+    """The document's first sentence plus its most keyword-dense ones, in document order, within max_chars"""
+    sentences = [
+        " ".join(sentence.split())
+        for sentence in _SENTENCE_BREAK.split(text)[:_MAX_SENTENCES]
+    ]
+    sentences = [sentence for sentence in sentences if len(sentence.split()) >= 4]
+    if not sentences:
+        return " ".join(text.split())[:max_chars]
+
+    # Words that occur once say little about what the document is about
+    weights = {word: count for word, count in _keyword_counts(text).items() if count > 1}
+
+    def score(index: int) -> float:
+        tokens = tokenize(sentences[index])
+        return sum(weights.get(token, 0) for token in tokens) / math.sqrt(len(tokens) + 1)
+
+    ranked = [index for index in sorted(range(1, len(sentences)), key=score, reverse=True) if score(index) > 0]
+    chosen, used = [], 0
+    for index in [0] + ranked:
+        if used + len(sentences[index]) + 1 > max_chars:
+            if not chosen:
+                return sentences[index][:max_chars]
+            continue
+        chosen.append(index)
+        used += len(sentences[index]) + 1
+    return " ".join(sentences[index] for index in sorted(chosen))
+
+
+def digest_text(title: str, url: str, summary: Optional[str], keywords: Optional[List[str]]) -> str:
+    """How a source appears in the knowledge-base inventory and overview prompts"""
+    text = f"{title or 'Untitled'} ({url})"
+    if summary:
+        text += f"\n{summary}"
+    if keywords:
+        text += f"\nTopics: {', '.join(keywords)}"
+    return text
+
+
+class DigestService:
+    """Per-source digests and the knowledge-base overview built from them.
+
+    Summary and listing questions read these small rows instead of every
+    document. sources_changed is registered as a VectorIndexRegistry source
+    listener: changed sources are queued, and a background task (after
+    DIGEST_REFRESH_DELAY_SECONDS, so a burst of uploads is handled at once)
+    digests those whose content hash changed and then refreshes the overview.
+
+    The overview is a map-reduce over digest groups (see DigestGroup).
+    Groups keep their members across refreshes and new sources fill the
+    first group with room, so a change only re-summarizes the groups on its
+    path to the top. If the model fails, the previous overview stays in
+    place and the refresh is retried on the next change.
+
+    Callables in overview_listeners are called after the overview changes.
+    """
+
+    def __init__(self, llm: OllamaLLM):
+        self.llm = llm
+        self.overview_listeners: List[Callable[[], None]] = []
+        self._pending: set = set()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._overview: Optional[Dict[str, Any]] = None
+        self._overview_loaded = False
+        self._tables_exist = False
+        self._stats = {
+            "sources_digested": 0,
+            "sources_unchanged": 0,
+            "sources_removed": 0,
+            "llm_fallbacks": 0,
+            "groups_summarized": 0,
+            "groups_reused": 0,
+            "refreshes": 0,
+            "failures": 0,
+            "last_refresh_seconds": None
+        }
+
+    async def available(self) -> bool:
+        """Whether digests are enabled and their tables exist (databases from before digests need init_db.py)"""
+        if not settings.DIGESTS_ENABLED:
+            return False
+        if not self._tables_exist:
+            # Checked again until init_db.py has created them
+            async with async_engine.connect() as conn:
+                self._tables_exist = await conn.run_sync(
+                    lambda sync_conn: all(
+                        inspect(sync_conn).has_table(model.__tablename__) for model in (SourceDigest, DigestGroup)
+                    )
+                )
+        return self._tables_exist
+
+    async def start(self) -> None:
+        """Queue completed sources that have no digest yet, and reconcile the overview"""
+        if not await self.available():
+            print("[DIGEST] Digest tables not found; run init_db.py to create them. Answering without digests")
+            return
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(KnowledgeSource.id)
+                .outerjoin(SourceDigest, SourceDigest.source_id == KnowledgeSource.id)
+                .where(KnowledgeSource.status == "completed", SourceDigest.source_id.is_(None))
+            )
+            missing = [str(row[0]) for row in result.all()]
+        if missing:
+            print(f"[DIGEST] {len(missing)} sources have no digest yet")
+        self._pending.update(missing)
+        self._dirty = True
+        self._schedule(delay=0)
+
+    def sources_changed(self, source_ids: List[str]) -> None:
+        """Queue sources whose content changed (a VectorIndexRegistry source listener)"""
+        self._pending.update(source_ids)
+        self._schedule()
+
+    def _schedule(self, delay: Optional[float] = None) -> None:
+        if self._task is None or self._task.done():
+            if delay is None:
+                delay = settings.DIGEST_REFRESH_DELAY_SECONDS
+            self._task = asyncio.create_task(self._run(delay))
+
+    async def _run(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if not await self.available():
+            return
+        while self._pending or self._dirty:
+            source_ids, self._pending = list(self._pending), set()
+            try:
+                await self.digest_sources(source_ids)
+                await self.refresh_overview()
+            except Exception as e:
+                self._stats["failures"] += 1
+                # Unchanged sources are skipped by hash when this is retried
+                self._pending.update(source_ids)
+                self._dirty = True
+                print(f"[DIGEST] Refresh failed: {e}")
+                return
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def digest_sources(self, source_ids: List[str], force: bool = False) -> Dict[str, int]:
+        """Digest sources whose content changed since their digest (all of them with force)
+
+        Digests of sources that were deleted or are no longer completed are
+        removed. No database connection is held while the model runs.
+        """
+        totals = {"digested": 0, "unchanged": 0, "removed": 0}
+        for source_id in source_ids:
+            async with AsyncSessionLocal() as session:
+                source = await session.get(KnowledgeSource, source_id)
+                digest = await session.get(SourceDigest, source_id)
+                if source is None or source.status != "completed" or not (source.content or "").strip():
+                    if digest is not None:
+                        await session.delete(digest)
+                        await session.commit()
+                        totals["removed"] += 1
+                    continue
+                digest_hash = content_hash(source.content)
+                if digest is not None and digest.content_hash == digest_hash and not force:
+                    totals["unchanged"] += 1
+                    continue
+                title, content = source.title or "Untitled", source.content
+
+            summary, method = await self._summarize_source(title, content)
+            keywords = extract_keywords(content, settings.DIGEST_KEYWORDS)
+
+            async with AsyncSessionLocal() as session:
+                digest = await session.get(SourceDigest, source_id)
+                if digest is None:
+                    digest = SourceDigest(source_id=source_id)
+                    session.add(digest)
+                digest.content_hash = digest_hash
+                digest.summary = summary
+                digest.keywords = keywords
+                digest.method = method
+                try:
+                    await session.commit()
+                except IntegrityError:
+                    # The source was deleted while it was being summarized
+                    await session.rollback()
+                    continue
+            totals["digested"] += 1
+
+        self._stats["sources_digested"] += totals["digested"]
+        self._stats["sources_unchanged"] += totals["unchanged"]
+        self._stats["sources_removed"] += totals["removed"]
+        if totals["digested"] or totals["removed"]:
+            self._dirty = True
+            print(f"[DIGEST] Sources: {totals}")
+        return totals
+
+    async def _summarize_source(self, title: str, content: str) -> Tuple[str, str]:
+        """(summary, method) for a document; falls back to an extractive summary if the model fails"""
+        max_chars = settings.DIGEST_SUMMARY_CHARS
+        if settings.DIGEST_METHOD == "llm":
+            prompt = f"""Summarize the following document in at most three sentences. State what it is about and its main points. Do not add commentary.
+
+Title: {title}
+
+{content[:settings.DIGEST_INPUT_CHARS]}
+
+Summary:"""
+            summary = await self.llm.complete(prompt, max_tokens=math.ceil(max_chars / settings.CONTEXT_CHARS_PER_TOKEN))
+            if summary:
+                return summary[:max_chars], "llm"
+            self._stats["llm_fallbacks"] += 1
+        return extractive_summary(content, max_chars), "extractive"
+
+    async def refresh_overview(self) -> Optional[Dict[str, Any]]:
+        """Bring the digest groups and the overview in line with the current digests"""
+        async with self._lock:
+            self._dirty = False
+            started = time.perf_counter()
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(
+                        KnowledgeSource.id, KnowledgeSource.title, KnowledgeSource.url,
+                        SourceDigest.summary, SourceDigest.keywords
+                    )
+                    .join(SourceDigest, SourceDigest.source_id == KnowledgeSource.id)
+                    .where(KnowledgeSource.status == "completed")
+                    .order_by(KnowledgeSource.created_at)
+                )
+                items = {
+                    str(source_id): digest_text(title, url, summary, keywords)
+                    for source_id, title, url, summary, keywords in result.all()
+                }
+                groups = (await session.execute(select(DigestGroup).order_by(DigestGroup.level, DigestGroup.id))).scalars().all()
+
+            source_count = len(items)
+            level, top = 1, []
+            while items:
+                top = await self._build_level(level, items, [group for group in groups if group.level == level])
+                if len(top) <= 1:
+                    break
+                items = {str(group.id): group.summary for group in top}
+                level += 1
+
+            async with AsyncSessionLocal() as session:
+                # Levels above the top are left over from a larger knowledge base
+                await session.execute(delete(DigestGroup).where(DigestGroup.level > (level if top else 0)))
+                await session.commit()
+
+            previous = self._overview or {}
+            summary = top[0].summary if top else None
+            self._overview = {
+                "summary": summary,
+                "sources": source_count,
+                "updated_at": (
+                    previous.get("updated_at") if summary == previous.get("summary")
+                    else datetime.now(timezone.utc).isoformat()
+                )
+            }
+            self._overview_loaded = True
+            self._stats["refreshes"] += 1
+            self._stats["last_refresh_seconds"] = round(time.perf_counter() - started, 2)
+            if summary != previous.get("summary"):
+                print(f"[DIGEST] Overview of {source_count} sources refreshed in {self._stats['last_refresh_seconds']}s")
+                for listener in self.overview_listeners:
+                    listener()
+            return self._overview
+
+    async def _build_level(self, level: int, items: Dict[str, str], groups: List[DigestGroup]) -> List[DigestGroup]:
+        """Update level's groups for items (member ID -> text) and summarize the changed ones"""
+        size = max(2, settings.DIGEST_GROUP_SIZE)
+        assigned = set()
+        for group in groups:
+            group.members = [member for member in group.members if member in items and member not in assigned]
+            assigned.update(group.members)
+        removed = [group for group in groups if not group.members]
+        groups = [group for group in groups if group.members]
+
+        for member in items:
+            if member in assigned:
+                continue
+            group = next((group for group in groups if len(group.members) < size), None)
+            if group is None:
+                group = DigestGroup(level=level, members=[], fingerprint="", summary="")
+                groups.append(group)
+            group.members = group.members + [member]
+
+        failed = False
+        for group in groups:
+            fingerprint = hashlib.sha256(
+                "\n".join(f"{member}:{content_hash(items[member])}" for member in group.members).encode("utf-8")
+            ).hexdigest()
+            if fingerprint == group.fingerprint:
+                self._stats["groups_reused"] += 1
+                continue
+            summary = await self._summarize_group(level, [items[member] for member in group.members])
+            if summary is None:
+                # Keeps its old fingerprint, so the next refresh tries again
+                failed = True
+                break
+            group.summary, group.fingerprint = summary, fingerprint
+            self._stats["groups_summarized"] += 1
+
+        # Saved even after a failure, so the groups summarized so far are reused
+        async with AsyncSessionLocal() as session:
+            if removed:
+                await session.execute(delete(DigestGroup).where(DigestGroup.id.in_([group.id for group in removed])))
+            groups = [await session.merge(group) for group in groups if group.summary]
+            await session.commit()
+        if failed:
+            raise DigestError(f"the model did not summarize a level {level} group; keeping the previous overview")
+        return groups
+
+    async def _summarize_group(self, level: int, texts: List[str]) -> Optional[str]:
+        max_tokens = settings.DIGEST_OVERVIEW_TOKENS
+        # Share what the context window leaves after the instructions and the answer
+        room = (settings.OLLAMA_NUM_CTX - max_tokens - 256) * settings.CONTEXT_CHARS_PER_TOKEN
+        per_text = max(200, int(room / len(texts)))
+        joined = "\n\n".join(f"- {text[:per_text]}" for text in texts)
+        if level == 1:
+            prompt = f"""Below are short digests of {len(texts)} documents in a personal knowledge base. Write one paragraph describing the main topics they cover, grouping related documents and naming each document at least once.
+
+{joined}
+
+Overview:"""
+        else:
+            prompt = f"""Below are overviews of {len(texts)} parts of a personal knowledge base. Combine them into one overview of its main themes. Keep the document names that matter most.
+
+{joined}
+
+Overview:"""
+        return await self.llm.complete(prompt, max_tokens=max_tokens)
+
+    async def overview(self) -> Dict[str, Any]:
+        """The cached knowledge-base overview; "stale" while changes are still being digested"""
+        if not await self.available():
+            return {"summary": None, "sources": 0, "updated_at": None, "stale": False}
+        if not self._overview_loaded:
+            async with AsyncSessionLocal() as session:
+                top = (await session.execute(
+                    select(DigestGroup).where(
+                        DigestGroup.level == select(func.max(DigestGroup.level)).scalar_subquery()
+                    )
+                )).scalars().all()
+                source_count = (await session.execute(select(func.count()).select_from(SourceDigest))).scalar_one()
+            # A top level with several groups is left from an interrupted refresh
+            root = top[0] if len(top) == 1 else None
+            self._overview = {
+                "summary": root.summary if root is not None else None,
+                "sources": source_count,
+                "updated_at": root.updated_at.isoformat() if root is not None and root.updated_at else None
+            }
+            self._overview_loaded = True
+        return {**self._overview, "stale": self.stale}
+
+    @property
+    def stale(self) -> bool:
+        return bool(self._pending or self._dirty or (self._task is not None and not self._task.done()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "stale": self.stale,
+            "sources_in_overview": (self._overview or {}).get("sources")
+        }
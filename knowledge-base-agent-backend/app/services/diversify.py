@@ -0,0 +1,141 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Longest overlap searched for when chunks carry no character offsets (legacy 200-char overlap)
+_MAX_TEXT_OVERLAP = 400
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    for size in range(min(len(left), len(right), _MAX_TEXT_OVERLAP), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _join(left: Dict[str, Any], right: Dict[str, Any]) -> str:
+    """Concatenate two consecutive chunks without repeating their overlap"""
+    left_meta, right_meta = left["metadata"], right["metadata"]
+    if "end_char" in left_meta and "start_char" in right_meta:
+        overlap = left_meta["end_char"] - right_meta["start_char"]
+        if overlap <= 0:
+            return left["content"] + "\n" + right["content"]
+        # Trust the offsets only if the texts agree; otherwise fall back to a text match
+        if left["content"].endswith(right["content"][:overlap]):
+            return left["content"] + right["content"][overlap:]
+
+    overlap = _text_overlap(left["content"], right["content"])
+    if overlap:
+        return left["content"] + right["content"][overlap:]
+    return left["content"] + "\n" + right["content"]
+
+
+def group_adjacent(results: List[Dict[str, Any]]) -> List[List[int]]:
+    """Indices of results grouped into runs of consecutive chunks of the same source"""
+    order = sorted(
+        range(len(results)),
+        key=lambda i: (
+            results[i]["metadata"].get("source_id") or "",
+            results[i]["metadata"].get("chunk_index", 0)
+        )
+    )
+
+    groups: List[List[int]] = []
+    for i in order:
+        if groups:
+            previous = results[groups[-1][-1]]["metadata"]
+            current = results[i]["metadata"]
+            if (
+                current.get("source_id")
+                and current.get("source_id") == previous.get("source_id")
+                and current.get("chunk_index", 0) == previous.get("chunk_index", 0) + 1
+            ):
+                groups[-1].append(i)
+                continue
+        groups.append([i])
+    return groups
+
+
+def join_passage(results: List[Dict[str, Any]], group: List[int]) -> Dict[str, Any]:
+    """One passage from a run of consecutive chunks (see group_adjacent), without repeated overlaps
+
+    The passage keeps the best distance of its parts and the metadata of its
+    first chunk plus "end_chunk_index"/"merged_chunks".
+    """
+    passage = dict(results[group[0]])
+    passage["metadata"] = dict(passage["metadata"])
+    for i in group[1:]:
+        passage["content"] = _join(passage, results[i])
+        if "end_char" in results[i]["metadata"]:
+            passage["metadata"]["end_char"] = results[i]["metadata"]["end_char"]
+
+    distances = [results[i]["distance"] for i in group if results[i].get("distance") is not None]
+    passage["distance"] = min(distances) if distances else None
+    if len(group) > 1:
+        passage["metadata"]["end_chunk_index"] = results[group[-1]]["metadata"].get("chunk_index", 0)
+        passage["metadata"]["merged_chunks"] = len(group)
+    return passage
+
+
+def merge_adjacent_chunks(
+    results: List[Dict[str, Any]],
+    vectors: Sequence[np.ndarray]
+) -> Tuple[List[Dict[str, Any]], List[np.ndarray]]:
+    """Merge results that are consecutive chunks of the same source into single passages.
+
+    Returns (merged_results, merged_vectors): passages as built by
+    join_passage, and the normalised mean of each passage's vectors.
+    """
+    merged_results, merged_vectors = [], []
+    for group in group_adjacent(results):
+        merged_results.append(join_passage(results, group))
+        merged_vectors.append(_normalize(np.mean([vectors[i] for i in group], axis=0)))
+
+    return merged_results, merged_vectors
+
+
+def mmr_select(
+    query_vector: np.ndarray,
+    results: List[Dict[str, Any]],
+    vectors: Sequence[np.ndarray],
+    n_results: int,
+    lambda_mult: float = 0.7,
+    max_per_source: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Pick n_results by maximal marginal relevance, capping results per source.
+
+    Each step takes the candidate maximising
+    lambda * sim(query, d) - (1 - lambda) * max(sim(d, already selected)).
+    """
+    if not results:
+        return []
+
+    matrix = np.vstack([_normalize(np.asarray(v, dtype=np.float32)) for v in vectors])
+    relevance = matrix @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    redundancy = np.zeros(len(results), dtype=np.float32)
+    available = np.ones(len(results), dtype=bool)
+    per_source: Dict[str, int] = {}
+    selected = []
+
+    while len(selected) < n_results and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        available[best] = False
+
+        source_id = results[best]["metadata"].get("source_id")
+        if max_per_source and source_id:
+            if per_source.get(source_id, 0) >= max_per_source:
+                continue
+            per_source[source_id] = per_source.get(source_id, 0) + 1
+
+        selected.append(best)
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+
+    return [results[i] for i in selected]
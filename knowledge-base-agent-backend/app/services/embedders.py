@@ -0,0 +1,241 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+EMBEDDER_BACKENDS = ("sentence-transformers", "onnx", "ollama")
+
+# Written next to the exported model by scripts/export_onnx_embedder.py
+ONNX_CONFIG = "embedder.json"
+ONNX_MODEL = "model.onnx"
+ONNX_MODEL_INT8 = "model-int8.onnx"
+
+
+def embedder_version(config=settings) -> str:
+    """Identifier of the vector space the configured embedder produces.
+
+    The float32 ONNX export reproduces the PyTorch model's vectors (cosine
+    > 0.9999), so both share the model name. Int8 quantisation moves vectors
+    measurably, so those are versioned separately and never mixed with
+    PyTorch vectors in the embedding cache or in sync_document. Ollama runs
+    its own model (OLLAMA_EMBED_MODEL), so its vectors are a space of their own.
+
+    config defaults to the application settings; an index built with other
+    embedder settings passes its own (see index_registry).
+    """
+    if config.EMBEDDER_BACKEND == "ollama":
+        return f"ollama:{config.OLLAMA_EMBED_MODEL}"
+    if config.EMBEDDER_BACKEND == "onnx" and config.ONNX_QUANTIZED:
+        return f"{config.EMBEDDING_MODEL}+onnx-int8"
+    return config.EMBEDDING_MODEL
+
+
+def create_embedder(config=settings):
+    """Instantiate the embedder selected by config.EMBEDDER_BACKEND"""
+    if config.EMBEDDER_BACKEND == "onnx":
+        return OnnxEmbedder(
+            config.ONNX_MODEL_PATH,
+            quantized=config.ONNX_QUANTIZED,
+            intra_op_threads=config.ONNX_INTRA_OP_THREADS,
+            inter_op_threads=config.ONNX_INTER_OP_THREADS
+        )
+    if config.EMBEDDER_BACKEND == "ollama":
+        return OllamaEmbedder(
+            config.OLLAMA_BASE_URL,
+            config.OLLAMA_EMBED_MODEL,
+            concurrency=config.OLLAMA_EMBED_CONCURRENCY,
+            timeout=config.OLLAMA_EMBED_TIMEOUT_SECONDS,
+            max_retries=config.OLLAMA_EMBED_MAX_RETRIES
+        )
+    if config.EMBEDDER_BACKEND != "sentence-transformers":
+        raise ValueError(f"Unsupported EMBEDDER_BACKEND: {config.EMBEDDER_BACKEND}")
+    return SentenceTransformerEmbedder(config.EMBEDDING_MODEL)
+
+
+class SentenceTransformerEmbedder:
+    """PyTorch model through sentence-transformers (the default backend)"""
+
+    def __init__(self, model_name: str):
+        # Imported here so the ONNX backend never pays for importing torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+
+class OnnxEmbedder:
+    """Exported transformer run by ONNX Runtime on CPU, optionally int8-quantised.
+
+    Reproduces the sentence-transformers pipeline (transformer, mean pooling,
+    optional L2 normalisation) from the files written by
+    scripts/export_onnx_embedder.py, so neither torch nor sentence-transformers
+    is imported. Texts are sorted by length before batching to keep padding low.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        quantized: bool = False,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        config_path = os.path.join(model_path, ONNX_CONFIG)
+        if not os.path.exists(config_path):
+            raise FileNotFoundError(
+                f"No exported model at {model_path}; run scripts/export_onnx_embedder.py first"
+            )
+        with open(config_path) as f:
+            config = json.load(f)
+
+        self.max_seq_length = config["max_seq_length"]
+        self.normalize = config.get("normalize", True)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 0 lets ONNX Runtime pick (one thread per physical core)
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_path, ONNX_MODEL_INT8 if quantized else ONNX_MODEL),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[i] = vector
+        return np.vstack(vectors)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feeds = {
+            name: encoded[name].astype(np.int64)
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in self._input_names and name in encoded
+        }
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+class OllamaEmbedder:
+    """Embeddings from an Ollama server's /api/embed (Ollama 0.3 or later).
+
+    The model then lives once in the Ollama process instead of in every API
+    worker. Each encode() call is split into batches of batch_size texts, sent
+    over a pooled keep-alive session by at most `concurrency` threads; that
+    limit is shared by every caller of the embedder. Connection errors,
+    timeouts, 429 and 5xx responses are retried with jittered exponential
+    backoff. There is no local tokenizer, so the token chunker falls back to
+    EMBEDDING_MODEL's tokenizer.
+
+    Point base_url at scripts/stub_ollama_embed_server.py to exercise it
+    without a model.
+    """
+
+    tokenizer = None
+    max_seq_length = None
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        concurrency: int = 4,
+        timeout: float = 60.0,
+        max_retries: int = 3
+    ):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = f"{base_url.rstrip('/')}/api/embed"
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.concurrency = max(1, concurrency)
+        self._errors = (requests.ConnectionError, requests.Timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ollama-embed")
+
+        self._lock = threading.Lock()
+        self.dimension: Optional[int] = None
+        self.requests = 0
+        self.retries = 0
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        vectors = np.vstack(list(self._pool.map(self._embed_batch, batches)))
+        self.dimension = vectors.shape[1]
+        return vectors
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        payload = {"model": self.model, "input": texts}
+        for attempt in range(self.max_retries + 1):
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    embeddings = response.json()["embeddings"]
+                    if len(embeddings) != len(texts):
+                        raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+                    return np.asarray(embeddings, dtype=np.float32)
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+            except self._errors as e:
+                error = str(e)
+
+            if attempt == self.max_retries:
+                raise RuntimeError(f"Ollama embedding failed after {attempt + 1} attempts: {error}")
+            with self._lock:
+                self.retries += 1
+            delay = min(0.25 * 2 ** attempt, 5.0) * (0.5 + random.random())
+            print(f"[OLLAMA_EMBED] {error}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        return {"model": self.model, "requests": self.requests, "retries": self.retries, "concurrency": self.concurrency}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Recent samples kept for the latency percentiles on /metrics
+_SAMPLES = 2048
+
+
+def _percentiles(samples: Deque[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    values = np.fromiter(samples, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(values.max()), 3)
+    }
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-text encode requests into batched model calls.
+
+    Callers await encode(text). Requests queue until max_batch_size of them
+    are waiting or the oldest has waited max_wait_ms, then the whole queue is
+    encoded in one call and each caller's future is resolved with its vector.
+    Raising the wait trades p99 latency for throughput; stats() exports the
+    batch-size histogram and queueing delay needed to tune it.
+
+    All state is touched from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0
+    ):
+        self._encode = encode
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        # Histogram buckets are powers of two up to max_batch_size
+        self._buckets = [1]
+        while self._buckets[-1] < self.max_batch_size:
+            self._buckets.append(min(self._buckets[-1] * 2, self.max_batch_size))
+        self._batch_sizes = {bucket: 0 for bucket in self._buckets}
+        self._queue_delays_ms: Deque[float] = deque(maxlen=_SAMPLES)
+        self._encode_ms: Deque[float] = deque(maxlen=_SAMPLES)
+        self.requests = 0
+        self.batches = 0
+
+    async def encode(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            self._queue_delays_ms.append((started - enqueued) * 1000)
+        self.batches += 1
+        self._batch_sizes[next(b for b in self._buckets if b >= len(batch))] += 1
+
+        # Identical concurrent queries are encoded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await self._encode(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._encode_ms.append((time.perf_counter() - started) * 1000)
+
+        by_text = dict(zip(texts, vectors))
+        for text, future, _ in batch:
+            # A caller that disconnected has cancelled its future
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "queued": len(self._pending),
+            "batch_size_histogram": {f"le_{bucket}": count for bucket, count in self._batch_sizes.items()},
+            "queue_delay_ms": _percentiles(self._queue_delays_ms),
+            "encode_ms": _percentiles(self._encode_ms)
+        }
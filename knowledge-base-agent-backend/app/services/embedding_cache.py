@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed, on-disk cache of chunk embeddings.
+
+    Entries are keyed by (embedding model id, sha256 of the whitespace-normalised
+    chunk), so re-uploading a file, re-scraping a page or running
+    scripts/reindex_sources.py only embeds chunks whose text actually changed.
+    Vectors are stored as float32 blobs in SQLite; once the cache grows past
+    max_bytes the least recently used entries are evicted.
+    """
+
+    # SQLite's default limit on bound parameters is 999
+    _LOOKUP_BATCH = 500
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._total_bytes = int(row[0])
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Collapse whitespace; the word-piece tokenizers we use ignore it anyway"""
+        return " ".join(text.split())
+
+    @classmethod
+    def make_key(cls, model_id: str, text: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(model_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(cls.normalize(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, model_id: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors aligned with texts, None where there is no entry"""
+        keys = [self.make_key(model_id, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            for start in range(0, len(keys), self._LOOKUP_BATCH):
+                batch = keys[start:start + self._LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model_id: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Store vectors for texts, evicting least recently used entries if over budget"""
+        if not texts:
+            return
+
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            key = self.make_key(model_id, text)
+            rows[key] = (key, model_id, np.asarray(vector, dtype=np.float32).tobytes(), now)
+
+        with self._lock:
+            # Bytes about to be replaced, so the running total stays exact
+            keys = list(rows)
+            replaced = 0
+            for start in range(0, len(keys), self._LOOKUP_BATCH):
+                batch = keys[start:start + self._LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchone()[0]
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model_id, vector, last_used) VALUES (?, ?, ?, ?)",
+                list(rows.values())
+            )
+            self._total_bytes += sum(len(row[2]) for row in rows.values()) - int(replaced)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is ~90% of max_bytes"""
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        cursor = self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used")
+        for key, size in cursor:
+            if self._total_bytes <= target:
+                break
+            victims.append((key,))
+            self._total_bytes -= size
+        cursor.close()
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"entries": entries, "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class BoundedExecutor:
+    """Thread or process pool that async code can await without blocking the loop.
+
+    At most max_pending calls are submitted to the pool at once; further
+    callers wait on a semaphore instead of piling work into the pool's
+    unbounded internal queue. Queue depth is tracked for /metrics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_pending: int,
+        kind: str = "thread",
+        initializer: Optional[Callable] = None,
+        initargs: Tuple = ()
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported executor kind: {kind}")
+
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+
+        if kind == "process":
+            self.executor: Executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=initializer,
+                initargs=initargs
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"kba-{name}",
+                initializer=initializer,
+                initargs=initargs
+            )
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._counter_lock = threading.Lock()
+        self._waiting = 0
+        self._submitted = 0
+        self._running = 0
+        self._completed = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the loop that actually uses it
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        return self._semaphore
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) in the pool and await its result"""
+        semaphore = self._get_semaphore()
+        with self._counter_lock:
+            self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._counter_lock:
+                self._waiting -= 1
+
+        try:
+            with self._counter_lock:
+                self._submitted += 1
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                return await loop.run_in_executor(self.executor, self._track, fn, *args)
+            # Process workers can't update our counters, so count around the await
+            with self._counter_lock:
+                self._running += 1
+            try:
+                return await loop.run_in_executor(self.executor, fn, *args)
+            finally:
+                with self._counter_lock:
+                    self._running -= 1
+                    self._completed += 1
+        finally:
+            semaphore.release()
+
+    def _track(self, fn: Callable, *args: Any) -> Any:
+        with self._counter_lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._counter_lock:
+                self._running -= 1
+                self._completed += 1
+
+    def submit_blocking(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) in the pool from synchronous code and wait for the result"""
+        return self.executor.submit(fn, *args).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            in_pool = self._submitted - self._completed
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "running": self._running,
+                "queued": max(0, in_pool - self._running),
+                "waiting": self._waiting,
+                "completed": self._completed
+            }
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
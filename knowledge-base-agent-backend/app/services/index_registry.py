@@ -0,0 +1,561 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.chunk import DEFAULT_COLLECTION
+from app.models.source import KnowledgeSource
+from app.services.chunker import chunker_version
+from app.services.embedders import embedder_version
+from app.services.embedding_cache import EmbeddingCache
+from app.services.vector_store import VectorStore
+
+# Settings that decide which vectors and chunks an index holds
+INDEX_SPEC_KEYS = (
+    "EMBEDDER_BACKEND",
+    "EMBEDDING_MODEL",
+    "ONNX_MODEL_PATH",
+    "ONNX_QUANTIZED",
+    "OLLAMA_EMBED_MODEL",
+    "CHUNKER",
+    "CHUNK_MAX_TOKENS",
+    "CHUNK_OVERLAP_TOKENS"
+)
+
+# What the default collection was built with before indexes were namespaced: the original
+# 1000/200 character chunker over sentence-transformers all-MiniLM-L6-v2
+LEGACY_INDEX_SPEC = {
+    "EMBEDDER_BACKEND": "sentence-transformers",
+    "EMBEDDING_MODEL": "all-MiniLM-L6-v2",
+    "ONNX_QUANTIZED": False,
+    "CHUNKER": "chars"
+}
+
+# A replaced index stays open this long so requests that picked it up before a switch can finish
+RETIRE_AFTER_SECONDS = 60
+
+MIGRATION_RUNNING = ("loading", "building", "catching_up")
+
+
+def index_spec(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """The configured index settings, with optional overrides"""
+    spec = {key: getattr(settings, key) for key in INDEX_SPEC_KEYS}
+    spec.update(overrides or {})
+    return spec
+
+
+def collection_name(spec: Dict[str, Any]) -> str:
+    """Namespace for an index built with spec, e.g. kb-all-minilm-l6-v2-t256o32v1-3fa1c2
+
+    Two specs share a name exactly when they produce the same vectors
+    (embedder_version) and the same chunks (chunker_version).
+    """
+    config = settings.model_copy(update=spec)
+    version, chunking = embedder_version(config), chunker_version(config)
+    slug = re.sub(r"[^a-z0-9]+", "-", version.lower()).strip("-")[:28].strip("-")
+    digest = hashlib.sha256(f"{version}|{chunking}".encode("utf-8")).hexdigest()[:6]
+    return f"kb-{slug}-{chunking}-{digest}"
+
+
+def source_index_metadata(source: KnowledgeSource) -> Dict[str, Any]:
+    """Chunk metadata for a stored source, as the scrape and upload endpoints write it"""
+    uploaded = source.url.startswith("file://")
+    metadata = {
+        "source_id": str(source.id),
+        "title": source.title or "Untitled",
+        "url": source.url,
+        "source_type": "document_upload" if uploaded else "web_scrape",
+        "created_at": source.created_at.timestamp()
+    }
+    if uploaded:
+        source_metadata = source.source_metadata or {}
+        for key in ("filename", "content_type"):
+            if source_metadata.get(key):
+                metadata[key] = source_metadata[key]
+    return metadata
+
+
+def load_index_state(path: Optional[str] = None) -> Dict[str, Any]:
+    """Read VECTOR_INDEX_STATE_PATH
+
+    Without it the default collection is live: built with LEGACY_INDEX_SPEC
+    if it already holds chunks (a deployment from before namespacing, so a
+    migration to the configured settings is offered), otherwise new and
+    built with the configured settings.
+    """
+    path = path or settings.VECTOR_INDEX_STATE_PATH
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+    else:
+        spec = index_spec()
+        if VectorStore.index_exists(DEFAULT_COLLECTION):
+            spec = index_spec(LEGACY_INDEX_SPEC)
+            print(f"[INDEX] {DEFAULT_COLLECTION} predates {path}; assuming it was built with {LEGACY_INDEX_SPEC}")
+        state = {"active": {"name": DEFAULT_COLLECTION, "spec": spec, "activated_at": None}}
+    state.setdefault("previous", None)
+    state.setdefault("migration", None)
+    return state
+
+
+def open_active_store(path: Optional[str] = None) -> VectorStore:
+    """Open the live index for maintenance scripts, with the settings it was built with (see load_index_state)"""
+    entry = load_index_state(path)["active"]
+    return VectorStore(name=entry["name"], spec=entry["spec"])
+
+
+async def completed_source_ids() -> List[str]:
+    """IDs of the sources an index should hold, oldest first"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(KnowledgeSource.id)
+            .where(KnowledgeSource.status == "completed")
+            .order_by(KnowledgeSource.created_at)
+        )
+        return [str(row[0]) for row in result.all()]
+
+
+async def sync_sources(store: VectorStore, source_ids: List[str]) -> Dict[str, int]:
+    """Bring store's chunks for source_ids in line with knowledge_sources
+
+    Completed sources are synced from their stored content; sources that
+    were deleted, failed or have no content lose their chunks.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(KnowledgeSource).where(KnowledgeSource.id.in_(source_ids)))
+        sources = {str(source.id): source for source in result.scalars()}
+
+    totals = {"synced": 0, "failed": 0, "added": 0, "kept": 0, "removed": 0}
+    gone = []
+    for source_id in source_ids:
+        source = sources.get(source_id)
+        if source is None or source.status != "completed" or not (source.content or "").strip():
+            gone.append(source_id)
+            continue
+        try:
+            stats = await store.sync_document(source.content, source_index_metadata(source))
+        except Exception as e:
+            print(f"[INDEX] Failed to index source {source_id} into {store.name}: {e}")
+            totals["failed"] += 1
+            continue
+        totals["synced"] += 1
+        for key in ("added", "kept", "removed"):
+            totals[key] += stats[key]
+    if gone:
+        totals["removed"] += await store.delete_by_source_ids(gone)
+    return totals
+
+
+def stored_source_ids(store: VectorStore, page_size: int = 1000) -> set:
+    """Source IDs that have chunks in store (blocking)"""
+    source_ids, offset = set(), 0
+    while True:
+        page = store.collection.get(limit=page_size, offset=offset, include=["metadatas"])
+        if not page["ids"]:
+            return source_ids
+        source_ids.update(metadata["source_id"] for metadata in page["metadatas"] if metadata and metadata.get("source_id"))
+        offset += len(page["ids"])
+
+
+class IndexMigration:
+    """Builds an index namespace from knowledge_sources while the live index keeps serving
+
+    Sources are synced into the target page by page. Sources written through
+    the live index meanwhile are collected in dirty (via on_sources_changed,
+    after their commit) and re-read from PostgreSQL after each page. Once no
+    changes are left, the registry switches to the target in the same
+    event-loop step, so no write can land in between.
+
+    Because sync_document reuses stored vectors by content hash, a cancelled
+    or failed migration that is started again only embeds what is missing.
+    """
+
+    def __init__(self, registry: "VectorIndexRegistry", target: Dict[str, Any]):
+        self.registry = registry
+        self.target = target
+        self.store: Optional[VectorStore] = None
+        self.task: Optional[asyncio.Task] = None
+        self.dirty = set()
+        self.status = "loading"
+        self.error: Optional[str] = None
+        self.sources_total = 0
+        self.sources_done = 0
+        self.sources_failed = 0
+        self.chunks = {"added": 0, "kept": 0, "removed": 0}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.status in MIGRATION_RUNNING
+
+    def progress(self) -> Dict[str, Any]:
+        """Progress reported on GET /index and persisted with the index state"""
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        rate = self.sources_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.sources_total - self.sources_done
+        return {
+            "target": self.target["name"],
+            "spec": self.target["spec"],
+            "status": self.status,
+            "error": self.error,
+            "sources_total": self.sources_total,
+            "sources_done": self.sources_done,
+            "sources_failed": self.sources_failed,
+            "percent": round(100 * self.sources_done / self.sources_total, 1) if self.sources_total else None,
+            "pending_changes": len(self.dirty),
+            "chunks": dict(self.chunks),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "eta_seconds": round(remaining / rate) if self.running and rate else None
+        }
+
+    async def run(self) -> None:
+        name = self.target["name"]
+        print(f"[INDEX_MIGRATION] Building {name} for {self.target['spec']}")
+        try:
+            self.store = await asyncio.to_thread(self.registry.take_store, self.target)
+            # Fail now rather than on every insert once the build is under way
+            await self.store.check_embedding_width()
+
+            self.status = "building"
+            source_ids = await completed_source_ids()
+            self.sources_total = len(source_ids)
+            stale = await asyncio.to_thread(stored_source_ids, self.store) - set(source_ids)
+            if stale:
+                # Left over from an earlier build or from before the last switch
+                self.chunks["removed"] += await self.store.delete_by_source_ids(list(stale))
+
+            page_size = max(1, settings.INDEX_MIGRATION_PAGE_SIZE)
+            for start in range(0, len(source_ids), page_size):
+                page = source_ids[start:start + page_size]
+                await self._sync(page)
+                self.sources_done += len(page)
+                await self._sync(self._take_dirty())
+                self.registry.save_progress(self)
+                progress = self.progress()
+                print(
+                    f"[INDEX_MIGRATION] {name}: {self.sources_done}/{self.sources_total} sources "
+                    f"({progress['percent']}%), ETA {progress['eta_seconds']}s"
+                )
+
+            self.status = "catching_up"
+            while self.dirty:
+                await self._sync(self._take_dirty())
+            # No await between the last check and the switch
+            self.registry.activate(self.store, self.target)
+            self.status = "completed"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"[INDEX_MIGRATION] {name} failed: {e}")
+        finally:
+            self.finished_at = time.time()
+            if self.status != "completed" and self.store is not None:
+                self.registry.release_store(self.store)
+            self.registry.save_progress(self)
+            print(f"[INDEX_MIGRATION] {name} {self.status} after {self.finished_at - self.started_at:.1f}s")
+
+    def _take_dirty(self) -> List[str]:
+        source_ids, self.dirty = list(self.dirty), set()
+        return source_ids
+
+    async def _sync(self, source_ids: List[str]) -> None:
+        if not source_ids:
+            return
+        totals = await sync_sources(self.store, source_ids)
+        self.sources_failed += totals["failed"]
+        for key in self.chunks:
+            self.chunks[key] += totals[key]
+
+
+class VectorIndexRegistry:
+    """The live VectorStore, the index it replaced, and migrations between them
+
+    The state file (VECTOR_INDEX_STATE_PATH) records:
+      active:    name and spec of the index serving requests
+      previous:  the index it replaced, kept until dropped so a rollback is instant
+      migration: progress of the last migration
+
+    The API creates one registry in the app lifespan; request handlers get
+    registry.active through app.api.deps.get_vector_store. Indexes share one
+    embedding cache, whose entries are keyed by embedding version.
+
+    Callables in source_listeners are called with the IDs of sources whose
+    chunks changed in the live index, once the change is committed.
+    """
+
+    def __init__(self, state_path: Optional[str] = None):
+        self.state_path = state_path or settings.VECTOR_INDEX_STATE_PATH
+        self.state = load_index_state(self.state_path)
+        if (self.state["migration"] or {}).get("status") in MIGRATION_RUNNING:
+            self.state["migration"]["status"] = "interrupted"
+        self.active: Optional[VectorStore] = None
+        self.previous: Optional[VectorStore] = None
+        self.migration: Optional[IndexMigration] = None
+        self.source_listeners: List[Callable[[List[str]], None]] = []
+        self.embedding_cache = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                settings.EMBEDDING_CACHE_PATH,
+                max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+            )
+        # Sources written since the last switch, replayed into the previous
+        # index on rollback; None when unknown (after a restart)
+        self._changed_since_switch: Optional[set] = None
+        self._retiring: List[VectorStore] = []
+        self._tasks = set()
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+    async def open(self) -> VectorStore:
+        """Open and warm up the live index; start a migration if the configured settings differ"""
+        entry = self.state["active"]
+        # A thread cannot be interrupted: if shutdown cancels this, the store is closed once it arrives
+        opening = asyncio.ensure_future(asyncio.to_thread(self._open_warm, entry))
+        try:
+            store = await asyncio.shield(opening)
+        except asyncio.CancelledError:
+            opening.add_done_callback(self._close_late_store)
+            raise
+        if self._closed:
+            # No await between this check and publishing the store, so close() cannot slip in
+            store.close()
+            raise RuntimeError("Index registry closed while the live index was opening")
+        self._watch(store)
+        self.active = store
+        self._save_state()
+        print(f"[INDEX] Serving {entry['name']}")
+
+        configured = index_spec()
+        if collection_name(configured) != collection_name(entry["spec"]):
+            if settings.INDEX_MIGRATION_AUTO_START:
+                await self.start_migration()
+            else:
+                print(
+                    f"[INDEX] Configured settings need index {collection_name(configured)}; "
+                    f"POST {settings.API_V1_STR}/index/migrations to build it"
+                )
+        return store
+
+    def _open_warm(self, entry: Dict[str, Any]) -> VectorStore:
+        store = self.open_store(entry)
+        store.warm_up()
+        return store
+
+    @staticmethod
+    def _close_late_store(opening: asyncio.Future) -> None:
+        if not opening.cancelled() and opening.exception() is None:
+            opening.result().close()
+            print("[INDEX] Closed the live index that finished opening after shutdown")
+
+    def open_store(self, entry: Dict[str, Any]) -> VectorStore:
+        """Open an index namespace (blocking)"""
+        return VectorStore(name=entry["name"], spec=entry["spec"], embedding_cache=self.embedding_cache)
+
+    def take_store(self, entry: Dict[str, Any]) -> VectorStore:
+        """Open and warm up a migration target, reusing the previous index if that is the target (blocking)"""
+        if self.previous is not None and self.previous.name == entry["name"]:
+            # Its writes now come from the migration, not from requests
+            self.previous.on_sources_changed = None
+            return self.previous
+        store = self.open_store(entry)
+        store.warm_up()
+        return store
+
+    def release_store(self, store: VectorStore) -> None:
+        """Give back a migration target that was not switched to"""
+        if store is self.previous:
+            self._watch(store)
+        else:
+            self._retire(store, delay=0)
+
+    def _watch(self, store: VectorStore) -> None:
+        store.on_sources_changed = lambda source_ids: self._sources_changed(store, source_ids)
+
+    def _sources_changed(self, store: VectorStore, source_ids: List[str]) -> None:
+        if store is self.active:
+            if self.migration is not None and self.migration.running:
+                self.migration.dirty.update(source_ids)
+            if self._changed_since_switch is not None:
+                self._changed_since_switch.update(source_ids)
+            for listener in self.source_listeners:
+                listener(source_ids)
+        else:
+            # Written through an index that was switched away from mid-request
+            self._spawn(self._replay(list(source_ids)))
+
+    async def _replay(self, source_ids: Optional[List[str]]) -> None:
+        """Re-sync sources into the live index from PostgreSQL; None re-syncs every source"""
+        store = self.active
+        try:
+            if source_ids is None:
+                source_ids = await completed_source_ids()
+                stale = await asyncio.to_thread(stored_source_ids, store) - set(source_ids)
+                source_ids.extend(stale)
+            totals = await sync_sources(store, source_ids)
+            print(f"[INDEX] Replayed {len(source_ids)} sources into {store.name}: {totals}")
+        except Exception as e:
+            print(f"[INDEX] Failed to replay sources into {store.name}: {e}")
+
+    async def start_migration(self, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Start building the index for the configured settings (plus overrides) in the background"""
+        async with self._lock:
+            if self._closed:
+                raise ValueError("The index registry is shutting down")
+            if self.migration is not None and self.migration.running:
+                raise ValueError(f"Migration to {self.migration.target['name']} is already running")
+            spec = index_spec(overrides)
+            name = collection_name(spec)
+            if name == collection_name(self.state["active"]["spec"]):
+                raise ValueError("The live index already uses these embedder and chunker settings")
+            previous = self.state["previous"]
+            if previous is not None and collection_name(previous["spec"]) == name:
+                # Going back to the index switched away from only syncs what changed since
+                name = previous["name"]
+
+            self.migration = IndexMigration(self, {"name": name, "spec": spec})
+            self.migration.task = self._spawn(self.migration.run())
+            return self.migration.progress()
+
+    async def cancel_migration(self) -> Dict[str, Any]:
+        """Stop the running migration; its index is kept, so starting again resumes it"""
+        migration = self.migration
+        if migration is None or not migration.running:
+            raise ValueError("No migration is running")
+        migration.task.cancel()
+        try:
+            await migration.task
+        except asyncio.CancelledError:
+            pass
+        return migration.progress()
+
+    def activate(self, store: VectorStore, entry: Dict[str, Any]) -> None:
+        """Make store the live index; synchronous, so it happens between two event-loop steps"""
+        old, old_entry = self.active, self.state["active"]
+        older, older_entry = self.previous, self.state["previous"]
+
+        self._watch(store)
+        self.active = store
+        self.previous = old
+        self.state["active"] = {"name": entry["name"], "spec": entry["spec"], "activated_at": time.time()}
+        self.state["previous"] = old_entry
+        self._changed_since_switch = set()
+        self._save_state()
+        print(f"[INDEX] Switched to {entry['name']} (previous: {old_entry['name']})")
+
+        # The index before the previous one is no longer reachable by rollback
+        if older_entry is not None and older_entry["name"] not in (entry["name"], old_entry["name"]):
+            self._retire(older, drop=older_entry["name"])
+
+    async def rollback(self) -> Dict[str, Any]:
+        """Switch back to the previous index, then catch it up with what was written since"""
+        async with self._lock:
+            if self.migration is not None and self.migration.running:
+                raise ValueError("Cancel the running migration before rolling back")
+            entry = self.state["previous"]
+            if entry is None:
+                raise ValueError("There is no previous index to roll back to")
+            store = self.previous
+            if store is None:
+                store = await asyncio.to_thread(self.open_store, entry)
+                await asyncio.to_thread(store.warm_up)
+                self.previous = store
+            changed = self._changed_since_switch
+            self.activate(store, entry)
+
+        self._spawn(self._replay(sorted(changed) if changed is not None else None))
+        return self.status()
+
+    async def drop_previous(self) -> Dict[str, Any]:
+        """Delete the previous index, giving up the option to roll back"""
+        async with self._lock:
+            entry = self.state["previous"]
+            if entry is None:
+                raise ValueError("There is no previous index")
+            if self.migration is not None and self.migration.running and self.migration.target["name"] == entry["name"]:
+                raise ValueError("The running migration is rebuilding the previous index")
+            store, self.previous = self.previous, None
+            self.state["previous"] = None
+            self._changed_since_switch = None
+            self._save_state()
+        self._retire(store, drop=entry["name"], delay=0)
+        return self.status()
+
+    def _retire(self, store: Optional[VectorStore], drop: Optional[str] = None, delay: float = RETIRE_AFTER_SECONDS) -> None:
+        """Close a replaced index once in-flight requests are done with it, and optionally delete it"""
+        async def retire():
+            await asyncio.sleep(delay)
+            if store is not None:
+                self._retiring.remove(store)
+                await asyncio.to_thread(store.close, False)
+            if drop is not None:
+                await asyncio.to_thread(VectorStore.drop_index, drop)
+
+        if store is not None:
+            self._retiring.append(store)
+        self._spawn(retire())
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def save_progress(self, migration: IndexMigration) -> None:
+        self.state["migration"] = migration.progress()
+        self._save_state()
+
+    def _save_state(self) -> None:
+        """Write the state file atomically"""
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def status(self) -> Dict[str, Any]:
+        """Live, previous and configured index, and migration progress (GET /index)"""
+        configured = index_spec()
+        configured_name = collection_name(configured)
+        return {
+            "active": self.state["active"],
+            "previous": self.state["previous"],
+            "configured": {"name": configured_name, "spec": configured},
+            "up_to_date": configured_name == collection_name(self.state["active"]["spec"]),
+            "migration": self.migration.progress() if self.migration is not None else self.state["migration"]
+        }
+
+    async def close(self) -> None:
+        """Stop background work and close every open index; a live index still opening is closed when it arrives"""
+        self._closed = True
+        if self.migration is not None and self.migration.running:
+            await self.cancel_migration()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        stores = []
+        for store in (self.previous, *self._retiring):
+            if store is not None and store is not self.active and all(store is not seen for seen in stores):
+                stores.append(store)
+        for store in stores:
+            store.close(release_client=False)
+        if self.active is not None:
+            self.active.close()
+        self.active, self.previous, self._retiring = None, None, []
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+            self.embedding_cache = None
@@ -0,0 +1,201 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Keep identifiers, error codes and dotted names ("E1234", "ERR-42", "os.path") whole
+_TOKEN = re.compile(r"\w+(?:[-.:/]\w+)*")
+_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound tokens also contribute their parts"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-.:/_]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """In-process BM25 inverted index over the chunks stored in the vector store.
+
+    Chunk IDs match the vector store's IDs, so lexical hits can be fused with
+    dense results. The index is updated incrementally on add/delete and
+    pickled to disk; a load whose chunk count doesn't match the collection
+    should be followed by a rebuild.
+
+    Several processes (the API, maintenance scripts) can hold the same
+    index, each in memory. save() never overwrites a pickle another process
+    wrote since this one was loaded or saved; changed_on_disk() tells the
+    owner to rebuild from the collection instead.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self._dirty = False
+        self._last_save = 0.0
+        # (mtime_ns, size) of the pickle as this process last read or wrote it
+        self._disk_stamp = self._stamp(path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load a pickled index, or return an empty one if none exists or it can't be read"""
+        index = cls(path)
+        if not os.path.exists(path):
+            return index
+
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") != _FORMAT_VERSION:
+                print(f"[BM25] Ignoring index with unsupported format at {path}")
+                return index
+            index._postings = state["postings"]
+            index._doc_terms = state["doc_terms"]
+            index._doc_len = state["doc_len"]
+            index._total_len = state["total_len"]
+            index._last_save = time.time()
+            index._disk_stamp = cls._stamp(path)
+        except Exception as e:
+            print(f"[BM25] Failed to load index from {path}: {e}")
+            return cls(path)
+
+        return index
+
+    @staticmethod
+    def _stamp(path: Optional[str]) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed_on_disk(self) -> bool:
+        """Whether another process wrote the pickle since this index last loaded or saved it"""
+        return bool(self.path) and self._stamp(self.path) != self._disk_stamp
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                if doc_id in self._doc_len:
+                    self._remove(doc_id)
+
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self._doc_terms[doc_id] = tuple(counts)
+                self._doc_len[doc_id] = length
+                self._total_len += length
+            self._dirty = True
+
+    def remove_ids(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._doc_len:
+                    self._remove(doc_id)
+            self._dirty = True
+
+    def _remove(self, doc_id: str) -> None:
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._total_len = 0
+            self._dirty = True
+
+    def search(self, query: str, n_results: int, allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Return up to n_results (chunk_id, bm25_score) pairs, best first
+
+        allowed_ids restricts scoring to a pre-filtered set of chunks.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            doc_count = len(self._doc_len)
+            if not terms or not doc_count:
+                return []
+            avg_len = self._total_len / doc_count
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed_ids is not None and doc_id not in allowed_ids:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def save(self, min_interval: float = 0.0, overwrite: bool = False) -> bool:
+        """Pickle the index atomically if it changed and min_interval seconds have passed
+
+        Returns False, without writing, if another process wrote the pickle
+        meanwhile (see changed_on_disk); overwrite=True writes regardless.
+        """
+        if not self.path:
+            return True
+        with self._lock:
+            if not self._dirty or time.time() - self._last_save < min_interval:
+                return True
+            if not overwrite and self.changed_on_disk():
+                print(f"[BM25] {self.path} was written by another process; not overwriting it")
+                return False
+            state = {
+                "version": _FORMAT_VERSION,
+                "postings": self._postings,
+                "doc_terms": self._doc_terms,
+                "doc_len": self._doc_len,
+                "total_len": self._total_len
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_save = time.time()
+            self._disk_stamp = self._stamp(self.path)
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"chunks": len(self._doc_len), "terms": len(self._postings)}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
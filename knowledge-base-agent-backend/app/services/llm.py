@@ -1,32 +1,526 @@
 import aiohttp
+import asyncio
+import hashlib
 import json
 import re
-from typing import List, Dict, Any
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional
 from app.core.config import settings
+from app.services.context_packer import correction, estimate_tokens, format_document, pack_context, record_evaluation
+from app.services.llm_scheduler import BATCH, CHAT, TITLE, LLMBusyError, LLMScheduler
+
+# Reasoning blocks some models emit before answering; removed with their content
+_REASONING_BLOCK = re.compile(r'<(thinking|reflection|plan|scratchpad)>.*?</\1>', flags=re.DOTALL | re.IGNORECASE)
+_REASONING_TAG = re.compile(r'<(thinking|reflection|plan|scratchpad)>', flags=re.IGNORECASE)
+_XML_TAG = re.compile(r'<[^>]+>')
+_BLANK_LINES = re.compile(r'\n\s*\n\s*\n')
+
+# A prompt Ollama evaluated to within this share of num_ctx was most likely cut to fit
+_OVERFLOW_SHARE = 0.98
+
+# Instructions for multi-turn chat; the same for every turn so the conversation prefix stays cacheable
+_CHAT_SYSTEM_PROMPT = """You are a helpful AI assistant with access to a personal knowledge base.
+Each user message carries context retrieved from the knowledge base for that question. Use it,
+and the context from earlier in the conversation, to answer. Resolve follow-up questions using
+the conversation so far. If the context doesn't contain relevant information, say so and
+provide a general response."""
+
+# Returned by generate_response when the model could not answer
+ERROR_RESPONSE = "Error connecting to the language model."
+
+class LLMError(Exception):
+    """The model could not be reached, failed or timed out while streaming"""
+
+class XmlTagStripper:
+    """OllamaLLM._strip_xml_tags for text that arrives in pieces.
+
+    feed() returns the cleaned text that is final so far and holds back what
+    may still change: a tag that has not been closed with ">", a reasoning
+    block until its closing tag, and trailing whitespace (which may turn out
+    to be part of a run of blank lines, or the end of the answer). flush()
+    releases the rest at the end of the stream. The concatenated output
+    equals _strip_xml_tags of the whole text, however it is split.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._closing: Optional[str] = None  # Closing tag of the reasoning block being skipped
+        self._opening = ""  # Its opening tag, and any unclosed "<..." text just before it
+        self._spaces = ""
+        self._started = False
+
+    def feed(self, text: str) -> str:
+        self._buffer += text
+        out = []
+        while self._buffer:
+            if self._closing is not None:
+                end = self._buffer.lower().find(self._closing)
+                if end < 0:
+                    break
+                # Text before the block still needs its ">" (blocks go before other tags)
+                self._buffer = self._opening[:self._opening.rfind("<")] + self._buffer[end + len(self._closing):]
+                self._closing, self._opening = None, ""
+                continue
+
+            start = self._buffer.find("<")
+            if start < 0:
+                out.append(self._buffer)
+                self._buffer = ""
+                break
+            out.append(self._buffer[:start])
+            self._buffer = self._buffer[start:]
+            if len(self._buffer) < 2:
+                break
+            if self._buffer[1] == ">":
+                # "<>" is not a tag
+                out.append("<")
+                self._buffer = self._buffer[1:]
+                continue
+            end = self._buffer.find(">")
+            if end < 0:
+                break
+            tag, self._buffer = self._buffer[:end + 1], self._buffer[end + 1:]
+            match = _REASONING_TAG.fullmatch(tag[tag.rfind("<"):])
+            if match:
+                self._closing, self._opening = f"</{match.group(1).lower()}>", tag
+        return self._release("".join(out))
+
+    def flush(self) -> str:
+        rest = self._buffer
+        if self._closing is not None:
+            # Never closed, so not a block: keep its text, minus tags, as _strip_xml_tags does
+            rest = _XML_TAG.sub('', _REASONING_BLOCK.sub('', self._opening + rest))
+        self._buffer, self._closing, self._opening = "", None, ""
+        return self._release(rest)
+
+    def _release(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._spaces + text
+        body = text.rstrip()
+        self._spaces = text[len(body):]
+        return _BLANK_LINES.sub('\n\n', body)
 
 class OllamaLLM:
+    """Client for the Ollama chat model.
+
+    The API creates one instance in the app lifespan and shares it through
+    app.api.deps.get_llm, so every request goes over the same pooled
+    keep-alive session (at most OLLAMA_POOL_SIZE connections) instead of
+    opening a connection per call. Connect, read and total timeouts bound
+    how long a hung model can hold a request; a timed-out or failed call
+    returns an error message like a non-200 response does.
+
+    Every call goes through scheduler (see LLMScheduler): at most
+    OLLAMA_MAX_CONCURRENCY run at once, chat answers go before titles and
+    background digests, and identical in-flight requests share one call.
+    Interactive calls raise LLMBusyError when the queue is saturated.
+    """
+
     def __init__(self):
         self.base_url = settings.OLLAMA_BASE_URL
         self.chat_model = settings.OLLAMA_CHAT_MODEL
+        self.timeout = aiohttp.ClientTimeout(
+            total=settings.OLLAMA_TOTAL_TIMEOUT_SECONDS,
+            connect=settings.OLLAMA_CONNECT_TIMEOUT_SECONDS,
+            sock_read=settings.OLLAMA_READ_TIMEOUT_SECONDS
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.scheduler = LLMScheduler(
+            settings.OLLAMA_MAX_CONCURRENCY,
+            settings.OLLAMA_MAX_QUEUE,
+            settings.OLLAMA_QUEUE_TIMEOUT_SECONDS
+        )
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "cancelled": 0,
+            "connections_created": 0,
+            "connections_reused": 0
+        }
+        self._in_flight = 0
+        self._request_seconds = 0.0
+        # Seconds from sending a streamed request to its first answer text
+        self._first_token_seconds = deque(maxlen=1000)
+        # Prompt sizes: estimated when packing, actual from Ollama's prompt_eval_count
+        self._prompts = {
+            "packed": 0,
+            "estimated_tokens": 0,
+            "passages_dropped": 0,
+            "passages_truncated": 0,
+            "overlap_chars_removed": 0,
+            "evaluated": 0,
+            "evaluated_tokens": 0,
+            "evaluated_chars": 0,
+            "max_evaluated_tokens": 0,
+            # Prompts Ollama evaluated to the full window, i.e. probably truncated
+            "overflowed": 0,
+            # Multi-turn requests: Ollama only evaluates what its KV cache doesn't already hold
+            "chat_requests": 0,
+            "chat_estimated_tokens": 0,
+            "chat_evaluated_tokens": 0
+        }
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._count("connections_created"))
+            trace.on_connection_reuseconn.append(self._count("connections_reused"))
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.OLLAMA_POOL_SIZE,
+                    keepalive_timeout=settings.OLLAMA_KEEPALIVE_SECONDS
+                ),
+                timeout=self.timeout,
+                trace_configs=[trace]
+            )
+        return self._session
+
+    def _count(self, key: str):
+        async def count(session, context, params):
+            self._stats[key] += 1
+        return count
+
+    async def close(self) -> None:
+        """Close the pooled session (app shutdown)"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Request, timeout and connection reuse counts reported on /metrics"""
+        requests = self._stats["requests"]
+        first_token = sorted(self._first_token_seconds)
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "avg_request_ms": round(1000 * self._request_seconds / requests, 1) if requests else None,
+            "pool_size": settings.OLLAMA_POOL_SIZE,
+            "time_to_first_token_ms": {
+                "samples": len(first_token),
+                "p50": round(1000 * first_token[len(first_token) // 2], 1) if first_token else None,
+                "p95": round(1000 * first_token[int(len(first_token) * 0.95)], 1) if first_token else None
+            },
+            "prompts": self._prompt_stats(),
+            "scheduler": self.scheduler.stats()
+        }
+
+    def _prompt_stats(self) -> Dict[str, Any]:
+        prompts = self._prompts
+        return {
+            "num_ctx": settings.OLLAMA_NUM_CTX,
+            "num_predict": settings.OLLAMA_NUM_PREDICT,
+            "packed": prompts["packed"],
+            "safety_margin": settings.CONTEXT_SAFETY_MARGIN,
+            # Our estimates; the evaluated figures are Ollama's own counts
+            "avg_estimated_tokens": round(prompts["estimated_tokens"] / prompts["packed"]) if prompts["packed"] else None,
+            "avg_evaluated_tokens": round(prompts["evaluated_tokens"] / prompts["evaluated"]) if prompts["evaluated"] else None,
+            "max_evaluated_tokens": prompts["max_evaluated_tokens"],
+            "overflowed": prompts["overflowed"],
+            # Factor estimates are currently scaled up by, after Ollama counted more than estimated
+            "estimate_correction": round(correction(), 3),
+            "observed_chars_per_token": (
+                round(prompts["evaluated_chars"] / prompts["evaluated_tokens"], 2) if prompts["evaluated_tokens"] else None
+            ),
+            "passages_dropped": prompts["passages_dropped"],
+            "passages_truncated": prompts["passages_truncated"],
+            "overlap_chars_removed": prompts["overlap_chars_removed"],
+            "chat": {
+                "requests": prompts["chat_requests"],
+                "avg_estimated_tokens": (
+                    round(prompts["chat_estimated_tokens"] / prompts["chat_requests"]) if prompts["chat_requests"] else None
+                ),
+                "avg_evaluated_tokens": (
+                    round(prompts["chat_evaluated_tokens"] / prompts["chat_requests"]) if prompts["chat_requests"] else None
+                ),
+                # Share of the conversation prompt served from Ollama's KV cache
+                "reused_ratio": (
+                    round(max(0.0, 1 - prompts["chat_evaluated_tokens"] / prompts["chat_estimated_tokens"]), 3)
+                    if prompts["chat_estimated_tokens"] else None
+                )
+            }
+        }
+
+    def _record_prompt_eval(self, payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Count the prompt tokens Ollama reports evaluating for payload"""
+        tokens = result.get("prompt_eval_count")
+        if "messages" in payload:
+            # Cached prefixes are not evaluated, so these don't calibrate CONTEXT_CHARS_PER_TOKEN
+            self._prompts["chat_requests"] += 1
+            self._prompts["chat_estimated_tokens"] += estimate_tokens("".join(m["content"] for m in payload["messages"]))
+            self._prompts["chat_evaluated_tokens"] += tokens or 0
+        elif tokens:
+            self._prompts["evaluated"] += 1
+            self._prompts["evaluated_tokens"] += tokens
+            self._prompts["evaluated_chars"] += len(payload["prompt"])
+            self._prompts["max_evaluated_tokens"] = max(self._prompts["max_evaluated_tokens"], tokens)
+            if tokens >= _OVERFLOW_SHARE * payload.get("options", {}).get("num_ctx", settings.OLLAMA_NUM_CTX):
+                # Clipped counts would under-calibrate the estimate, so they are left out
+                self._prompts["overflowed"] += 1
+                print(f"[LLM] Prompt filled the whole {tokens}-token window; Ollama probably truncated it")
+            else:
+                record_evaluation(payload["prompt"], tokens)
+
+    @staticmethod
+    def _flight_key(payload: Dict[str, Any]) -> str:
+        """Identical request bodies give identical answers to share (see LLMScheduler)"""
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def _generate(self, payload: Dict[str, Any], priority: int) -> Optional[str]:
+        """_post in a scheduler slot of priority; raises LLMBusyError if the queue is saturated"""
+        return await self.scheduler.run(self._flight_key(payload), priority, lambda: self._post(payload))
+
+    def _stream(self, payload: Dict[str, Any], priority: int) -> AsyncIterator[str]:
+        """_post_stream in a scheduler slot of priority; raises LLMBusyError if the queue is saturated"""
+        return self.scheduler.stream(self._flight_key(payload), priority, lambda: self._post_stream(payload))
+
+    @staticmethod
+    def _endpoint(payload: Dict[str, Any]) -> str:
+        return "/api/chat" if "messages" in payload else "/api/generate"
+
+    @staticmethod
+    def _text(result: Dict[str, Any]) -> str:
+        """Answer text of a /api/generate or /api/chat response (or stream chunk)"""
+        if "message" in result:
+            return (result["message"] or {}).get("content", "")
+        return result.get("response", "")
+
+    async def _post(self, payload: Dict[str, Any]) -> Optional[str]:
+        """POST to /api/generate (or /api/chat); the response text, or None if the call failed or timed out
+
+        Cancelling the calling task (e.g. when the client disconnects) aborts
+        the request and drops its connection from the pool.
+        """
+        self._stats["requests"] += 1
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            async with self.session.post(f"{self.base_url}{self._endpoint(payload)}", json=payload) as response:
+                if response.status != 200:
+                    self._stats["errors"] += 1
+                    print(f"[LLM] Ollama returned HTTP {response.status}")
+                    return None
+                result = await response.json()
+                self._record_prompt_eval(payload, result)
+                return self._text(result)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            print(f"[LLM] Ollama request timed out after {time.perf_counter() - started:.1f}s")
+            return None
+        except aiohttp.ClientError as e:
+            self._stats["errors"] += 1
+            print(f"[LLM] Ollama request failed: {e}")
+            return None
+        except asyncio.CancelledError:
+            self._stats["cancelled"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._request_seconds += time.perf_counter() - started
+
+    async def _post_stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """POST a streaming request to /api/generate (or /api/chat) and yield the raw text pieces
+
+        Raises LLMError if the model cannot be reached, answers with an
+        error or times out. Closing the generator (e.g. when the client
+        disconnects) aborts the request.
+        """
+        self._stats["requests"] += 1
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            async with self.session.post(f"{self.base_url}{self._endpoint(payload)}", json=payload) as response:
+                if response.status != 200:
+                    self._stats["errors"] += 1
+                    raise LLMError(f"Ollama returned HTTP {response.status}")
+                # One JSON object per line: {"response": "<piece>", "done": false}
+                # ({"message": {"content": "<piece>"}, ...} from /api/chat)
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        self._stats["errors"] += 1
+                        raise LLMError(f"Ollama error: {chunk['error']}")
+                    text = self._text(chunk)
+                    if text:
+                        yield text
+                    if chunk.get("done"):
+                        self._record_prompt_eval(payload, chunk)
+                        break
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise LLMError(f"Ollama request timed out after {time.perf_counter() - started:.1f}s")
+        except aiohttp.ClientError as e:
+            self._stats["errors"] += 1
+            raise LLMError(f"Ollama request failed: {e}")
+        except (asyncio.CancelledError, GeneratorExit):
+            self._stats["cancelled"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._request_seconds += time.perf_counter() - started
 
     def _strip_xml_tags(self, text: str) -> str:
         """Remove XML tags like <plan>, <reflection>, etc. from LLM output"""
         # Remove XML tags and their content (for tags like <thinking>, <reflection>)
-        text = re.sub(r'<(thinking|reflection|plan|scratchpad)>.*?</\1>', '', text, flags=re.DOTALL | re.IGNORECASE)
+        text = _REASONING_BLOCK.sub('', text)
         # Remove any remaining XML-like tags
-        text = re.sub(r'<[^>]+>', '', text)
+        text = _XML_TAG.sub('', text)
         # Clean up extra whitespace
-        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+        text = _BLANK_LINES.sub('\n\n', text)
         return text.strip()
 
     async def generate_response(self, query: str, context: List[Dict[str, Any]], is_kb_summary: bool = False) -> str:
-        """Generate response using Ollama with RAG context"""
+        """Generate response using Ollama with RAG context; raises LLMBusyError if the model is saturated"""
+        return await self.answer(self._answer_payload(query, context, is_kb_summary, stream=False))
+
+    async def answer(self, payload: Dict[str, Any]) -> str:
+        """Run an answer payload (_answer_payload or chat_payload with stream=False) at chat priority"""
+        raw_response = await self._generate(payload, CHAT)
+        if raw_response is None:
+            return ERROR_RESPONSE
+        # Strip XML tags from the response
+        return self._strip_xml_tags(raw_response or "I couldn't generate a response.")
+
+    async def stream_response(self, query: str, context: List[Dict[str, Any]], is_kb_summary: bool = False) -> AsyncIterator[str]:
+        """Like generate_response, but yield the answer's text as the model produces it
+
+        Tags are stripped incrementally (see XmlTagStripper), so the pieces
+        join up to what generate_response would return for the same model
+        output. Raises LLMError instead of returning an error message,
+        or LLMBusyError if the model is saturated.
+        """
+        async for text in self.stream_answer(self._answer_payload(query, context, is_kb_summary, stream=True)):
+            yield text
+
+    async def stream_answer(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Run an answer payload with stream=True at chat priority (see stream_response)"""
+        stripper = XmlTagStripper()
+        started = time.perf_counter()
+        first = True
+        async for piece in self._stream(payload, CHAT):
+            text = stripper.feed(piece)
+            if text:
+                if first:
+                    self._first_token_seconds.append(time.perf_counter() - started)
+                    first = False
+                yield text
+        text = stripper.flush()
+        if text:
+            if first:
+                self._first_token_seconds.append(time.perf_counter() - started)
+            yield text
+
+    def _options(self, **options) -> Dict[str, Any]:
+        """Generation options; every request uses the same num_ctx, since changing it reloads the model"""
+        return {**options, "num_ctx": settings.OLLAMA_NUM_CTX}
+
+    def _answer_payload(self, query: str, context: List[Dict[str, Any]], is_kb_summary: bool, stream: bool) -> Dict[str, Any]:
+        """Request body for an answer grounded in the retrieved context"""
+        return {
+            "model": self.chat_model,
+            "prompt": self._packed_prompt(query, context, is_kb_summary, self._build_prompt),
+            "stream": stream,
+            "options": self._answer_options()
+        }
+
+    def chat_payload(
+        self,
+        history: List[Dict[str, str]],
+        query: str,
+        context: List[Dict[str, Any]],
+        is_kb_summary: bool,
+        stream: bool
+    ) -> Dict[str, Any]:
+        """/api/chat request body answering query after the history messages
+
+        history is sent exactly as it was before (see Conversation), so
+        Ollama finds the conversation in its KV cache and only evaluates
+        the new turn. The new turn's context is packed into what the history
+        leaves of the context window. The last message is the new user
+        turn, to be appended to the history with the answer.
+        """
+        system = {"role": "system", "content": _CHAT_SYSTEM_PROMPT}
+        history_tokens = estimate_tokens("".join(message["content"] for message in [system, *history]))
+        # Reserve the whole history budget, so this turn still fits once it is history itself
+        reserved = max(history_tokens, settings.CHAT_HISTORY_MAX_TOKENS)
+        content = self._packed_prompt(query, context, is_kb_summary, self._turn_content, reserved_tokens=reserved)
+        return {
+            "model": self.chat_model,
+            "messages": [system, *history, {"role": "user", "content": content}],
+            "stream": stream,
+            # Keep the model, and with it the conversation's KV cache, loaded between turns
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            "options": self._answer_options()
+        }
+
+    def _answer_options(self) -> Dict[str, Any]:
+        return self._options(
+            temperature=0.7,
+            top_p=0.9,
+            top_k=40,
+            num_predict=settings.OLLAMA_NUM_PREDICT
+        )
+
+    def _packed_prompt(
+        self,
+        query: str,
+        context: List[Dict[str, Any]],
+        is_kb_summary: bool,
+        build: Callable[[str, List[Dict[str, Any]], bool], str],
+        reserved_tokens: int = 0
+    ) -> str:
+        """build(query, context, is_kb_summary) with the context packed to fit
+
+        The context is packed (see pack_context) into what is left of
+        OLLAMA_NUM_CTX after the answer (OLLAMA_NUM_PREDICT), reserved_tokens
+        (earlier turns), the rest of the prompt and CONTEXT_SAFETY_MARGIN, so
+        Ollama does not truncate the prompt and prompt evaluation time stays
+        bounded. Token figures are estimates (see estimate_tokens).
+        """
+        # Everything but the documents' text: instructions, question, source headers
+        frame = build(query, [{**doc, "content": ""} for doc in context], is_kb_summary)
+        usable = int(settings.OLLAMA_NUM_CTX * (1 - settings.CONTEXT_SAFETY_MARGIN))
+        budget = usable - settings.OLLAMA_NUM_PREDICT - reserved_tokens - estimate_tokens(frame)
+        packed, report = pack_context(context, budget)
+        prompt = build(query, packed, is_kb_summary)
+
+        prompt_tokens = reserved_tokens + estimate_tokens(prompt)
+        self._prompts["packed"] += 1
+        self._prompts["estimated_tokens"] += prompt_tokens
+        for key in ("passages_dropped", "passages_truncated", "overlap_chars_removed"):
+            self._prompts[key] += report[key]
+        print(
+            f"[LLM] Prompt ~{prompt_tokens} tokens (estimated) of {settings.OLLAMA_NUM_CTX}: "
+            f"kept {report['passages_kept']}/{report['passages']} passages "
+            f"({report['passages_truncated']} cut, {report['passages_dropped']} dropped), "
+            f"{report['overlap_chars_removed']} overlapping chars removed"
+        )
+        return prompt
+
+    def _turn_content(self, query: str, context: List[Dict[str, Any]], is_kb_summary: bool) -> str:
+        """User message of a conversation turn; the instructions are in the system message"""
+        if is_kb_summary:
+            # Summaries keep their own instructions about covering every source
+            return self._build_prompt(query, context, is_kb_summary)
+        if not context:
+            return f"(No new context; use the context given earlier in this conversation.)\n\nQuestion: {query}"
+        context_text = "\n\n".join([format_document(doc) for doc in context])
+        return f"Context:\n{context_text}\n\nQuestion: {query}"
+
+    def _build_prompt(self, query: str, context: List[Dict[str, Any]], is_kb_summary: bool) -> str:
+        """Prompt for an answer grounded in context"""
 
         # Prepare context from retrieved documents
-        context_text = "\n\n".join([
-            f"Source: {doc.get('metadata', {}).get('url', 'Unknown')}\n{doc.get('content', '')}"
-            for doc in context
-        ])
+        context_text = "\n\n".join([format_document(doc) for doc in context])
 
         # Create specialized prompt for knowledge base summaries
         if is_kb_summary:
@@ -94,32 +588,24 @@ Context:
 Question: {query}
 
 Answer:"""
-        
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "model": self.chat_model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "top_k": 40
-                }
-            }
-            
-            async with session.post(
-                f"{self.base_url}/api/generate",
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    raw_response = result.get("response", "I couldn't generate a response.")
-                    # Strip XML tags from the response
-                    cleaned_response = self._strip_xml_tags(raw_response)
-                    return cleaned_response
-                else:
-                    return "Error connecting to the language model."
+
+        return prompt
     
+    async def complete(self, prompt: str, max_tokens: int) -> Optional[str]:
+        """Plain completion for background jobs such as digests; None if the model could not be reached"""
+        payload = {
+            "model": self.chat_model,
+            "prompt": prompt,
+            "stream": False,
+            "options": self._options(
+                temperature=0.3,
+                num_predict=max_tokens
+            )
+        }
+        # Waits behind interactive calls however long the queue is
+        text = await self._generate(payload, BATCH)
+        return self._strip_xml_tags(text) if text is not None else None
+
     async def generate_chat_title(self, first_message: str) -> str:
         """Generate a title for a chat session based on the first message"""
         prompt = f"""Generate a short, descriptive title (max 5 words) for this conversation starter:
@@ -128,24 +614,18 @@ Answer:"""
 
 Title:"""
         
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "model": self.chat_model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,
-                    "max_tokens": 20
-                }
-            }
-            
-            async with session.post(
-                f"{self.base_url}/api/generate",
-                json=payload
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    title = result.get("response", "New Chat").strip()
-                    return title[:50]  # Limit length
-                else:
-                    return "New Chat"
\ No newline at end of file
+        payload = {
+            "model": self.chat_model,
+            "prompt": prompt,
+            "stream": False,
+            "options": self._options(
+                temperature=0.3,
+                max_tokens=20
+            )
+        }
+
+        try:
+            title = (await self._generate(payload, TITLE) or "New Chat").strip()
+        except LLMBusyError:
+            title = "New Chat"
+        return title[:50]  # Limit length
@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Priority classes, most urgent first
+CHAT, TITLE, BATCH = 0, 1, 2
+PRIORITY_NAMES = {CHAT: "chat", TITLE: "title", BATCH: "batch"}
+
+
+class LLMBusyError(Exception):
+    """The model's queue is full, or a request waited too long for a slot"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Flight:
+    """One model call shared by every caller with the same key"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.callers = 0
+        # Streams only: the pieces so far, replayed to callers that join late
+        self.pieces: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class LLMScheduler:
+    """Admission, ordering and coalescing of calls to the model server.
+
+    At most max_concurrency calls run at once; the rest wait in priority
+    order (CHAT before TITLE before BATCH, first come first served within a
+    class). Interactive calls are rejected with LLMBusyError, which the API
+    turns into 503 + Retry-After, when max_queue of them are already
+    waiting or when one waits longer than queue_timeout. Batch calls
+    (background digests) always wait for their turn.
+
+    Calls with the same key (the full request body) that overlap share one
+    model call; a streamed call replays what was produced so far to callers
+    that join late. The shared call is cancelled when its last caller goes.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        # (priority, arrival, future); the future is resolved when the call gets a slot
+        self._waiting: List[tuple] = []
+        self._arrivals = itertools.count()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._wait_seconds = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+        self._stats = {
+            "started": 0,
+            "coalesced": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0
+        }
+
+    def _queued(self, priority: Optional[int] = None) -> int:
+        return sum(
+            1 for waiting_priority, _, future in self._waiting
+            if not future.done() and (priority is None or waiting_priority == priority)
+        )
+
+    def admit(self, priority: int) -> None:
+        """Raise LLMBusyError if a call of priority would be turned away right now"""
+        if priority == BATCH or self._running < self.max_concurrency:
+            return
+        if self._queued(CHAT) + self._queued(TITLE) >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise LLMBusyError(
+                f"Language model queue is full ({self.max_queue} waiting)",
+                retry_after=max(1, round(self.queue_timeout / 2))
+            )
+
+    async def _acquire(self, priority: int) -> None:
+        started = time.perf_counter()
+        if self._running < self.max_concurrency and not self._queued():
+            self._running += 1
+            self._wait_seconds[priority].append(0.0)
+            return
+
+        self.admit(priority)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._arrivals), future))
+        try:
+            await asyncio.wait_for(future, None if priority == BATCH else self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["rejected_timeout"] += 1
+            raise LLMBusyError(
+                f"Waited {self.queue_timeout:g}s for the language model",
+                retry_after=max(1, round(self.queue_timeout))
+            )
+        except asyncio.CancelledError:
+            # Handed a slot just as the caller went away
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        self._wait_seconds[priority].append(time.perf_counter() - started)
+
+    def _release(self) -> None:
+        """Pass the slot to the most urgent waiting call, or free it"""
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    async def _in_slot(self, priority: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        await self._acquire(priority)
+        self._stats["started"] += 1
+        try:
+            return await call()
+        finally:
+            self._release()
+
+    def _join(self, key: Optional[Hashable]) -> Optional[_Flight]:
+        flight = self._flights.get(key) if key is not None else None
+        if flight is not None and not flight.task.done():
+            self._stats["coalesced"] += 1
+            return flight
+        return None
+
+    def _track(self, key: Optional[Hashable], flight: _Flight) -> None:
+        if key is None:
+            return
+        self._flights[key] = flight
+        flight.task.add_done_callback(
+            lambda _: self._flights.pop(key) if self._flights.get(key) is flight else None
+        )
+
+    async def run(self, key: Optional[Hashable], priority: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        """await call() in a slot; overlapping calls with the same key (None: never shared) share its result"""
+        flight = self._join(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(self._in_slot(priority, call))
+            self._track(key, flight)
+        flight.callers += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.callers -= 1
+            if not flight.callers and not flight.task.done():
+                flight.task.cancel()
+
+    async def stream(
+        self,
+        key: Optional[Hashable],
+        priority: int,
+        open_stream: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Yield the pieces of open_stream() run in a slot; overlapping streams with the same key share it"""
+        flight = self._join(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(self._in_slot(priority, lambda: self._produce(flight, open_stream)))
+            # Wakes the callers if it fails before producing anything
+            flight.task.add_done_callback(lambda _: flight.notify())
+            self._track(key, flight)
+        flight.callers += 1
+        position = 0
+        try:
+            while True:
+                changed = flight.changed
+                while position < len(flight.pieces):
+                    yield flight.pieces[position]
+                    position += 1
+                if flight.done:
+                    break
+                if flight.task.done():
+                    # Failed before producing, e.g. LLMBusyError while queued
+                    await flight.task
+                    break
+                await changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.callers -= 1
+            if not flight.callers and not flight.task.done():
+                flight.task.cancel()
+
+    @staticmethod
+    async def _produce(flight: _Flight, open_stream: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for piece in open_stream():
+                flight.pieces.append(piece)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait times by priority, reported on /metrics"""
+        waits = {}
+        for priority, name in PRIORITY_NAMES.items():
+            samples = sorted(self._wait_seconds[priority])
+            waits[name] = {
+                "queued": self._queued(priority),
+                "samples": len(samples),
+                "wait_ms_p50": round(1000 * samples[len(samples) // 2], 1) if samples else None,
+                "wait_ms_p95": round(1000 * samples[int(len(samples) * 0.95)], 1) if samples else None
+            }
+        return {
+            **self._stats,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self._queued(),
+            "in_flight_keys": len(self._flights),
+            "priorities": waits
+        }
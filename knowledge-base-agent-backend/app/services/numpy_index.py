@@ -0,0 +1,386 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_HEADER = "index.json"
+_VECTORS = "vectors.bin"
+_SIDECAR = "chunks.sqlite3"
+_KEY = re.compile(r"^\w+$")
+_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+# Rows scored per block, so float16/int8 -> float32 conversion never materialises the whole matrix
+_SCORE_BLOCK = 8192
+_SQL_BATCH = 500
+
+
+def _where_to_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate the subset of Chroma's where syntax VectorStore uses into SQL over the JSON metadata"""
+    if len(where) == 1 and next(iter(where)) in ("$and", "$or"):
+        operator, clauses = next(iter(where.items()))
+        parts, params = [], []
+        for clause in clauses:
+            sql, clause_params = _where_to_sql(clause)
+            parts.append(f"({sql})")
+            params.extend(clause_params)
+        return f" {operator[1:].upper()} ".join(parts), params
+
+    parts, params = [], []
+    for key, condition in where.items():
+        if not _KEY.match(key):
+            raise ValueError(f"Unsupported metadata key: {key}")
+        column = f"json_extract(metadata, '$.{key}')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    parts.append("0" if operator == "$in" else "1")
+                    continue
+                placeholders = ",".join("?" * len(values))
+                parts.append(f"{column} {'IN' if operator == '$in' else 'NOT IN'} ({placeholders})")
+                params.extend(values)
+            elif operator in _COMPARISONS:
+                parts.append(f"{column} {_COMPARISONS[operator]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return " AND ".join(parts) or "1", params
+
+
+class NumpyCollection:
+    """Brute-force vector index in a memory-mapped matrix, for small and medium knowledge bases.
+
+    Implements the part of the Chroma collection API that VectorStore and
+    the maintenance scripts use (add/upsert, query, get, delete, count,
+    metadata/modify), so it can be selected with VECTOR_DB_TYPE="numpy".
+    Vectors are L2-normalised and stored as float16 or int8 rows in
+    vectors.bin; ids, documents and metadata live in a SQLite sidecar that
+    also evaluates where filters.
+    A query is one blockwise matrix-vector product plus argpartition.
+
+    Deletes only tombstone rows; compact() rewrites the matrix without them and
+    runs automatically once tombstones exceed compact_ratio of the rows.
+    """
+
+    def __init__(self, path: str, dtype: str = "float16", compact_ratio: float = 0.25):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        header = {}
+        header_path = os.path.join(path, _HEADER)
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+
+        self.dtype = header.get("dtype", dtype)
+        self.dim: Optional[int] = header.get("dim")
+        self.metadata: Optional[Dict[str, Any]] = header.get("metadata")
+        self._rows: int = header.get("rows", 0)
+        self._capacity: int = header.get("capacity", 0)
+        self._matrix: Optional[np.memmap] = None
+        if self.dim and self._capacity:
+            self._open_matrix()
+
+        self._db = sqlite3.connect(os.path.join(path, _SIDECAR), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT
+            )
+            """
+        )
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_chunks_id ON chunks(id)")
+        self._db.commit()
+
+        # Rows without a sidecar entry (deleted, or written but never committed) are dead
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._row_by_id: Dict[str, int] = {}
+        for row, chunk_id in self._db.execute("SELECT row, id FROM chunks"):
+            if row < self._rows:
+                self._alive[row] = True
+                self._row_by_id[chunk_id] = row
+
+    # -- storage -------------------------------------------------------------------------
+
+    def _open_matrix(self) -> None:
+        self._matrix = np.memmap(
+            os.path.join(self.path, _VECTORS),
+            dtype=np.dtype(self.dtype),
+            mode="r+",
+            shape=(self._capacity, self.dim)
+        )
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, self._capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(os.path.join(self.path, _VECTORS), "ab") as f:
+            f.truncate(capacity * self.dim * np.dtype(self.dtype).itemsize)
+        self._capacity = capacity
+        self._open_matrix()
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _write_header(self) -> None:
+        header_path = os.path.join(self.path, _HEADER)
+        with open(f"{header_path}.tmp", "w") as f:
+            json.dump(
+                {
+                    "dtype": self.dtype,
+                    "dim": self.dim,
+                    "rows": self._rows,
+                    "capacity": self._capacity,
+                    "metadata": self.metadata
+                },
+                f
+            )
+        os.replace(f"{header_path}.tmp", header_path)
+
+    def _encode_vectors(self, embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype == "int8":
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def _decode_rows(self, rows: np.ndarray) -> np.ndarray:
+        vectors = self._matrix[rows].astype(np.float32)
+        return vectors / 127 if self.dtype == "int8" else vectors
+
+    # -- Chroma-compatible API -----------------------------------------------------------
+
+    def count(self) -> int:
+        return len(self._row_by_id)
+
+    def modify(self, metadata: Dict[str, Any]) -> None:
+        """Replace the collection metadata (kept in the header)"""
+        with self._lock:
+            self.metadata = dict(metadata)
+            self._write_header()
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """Append rows; an existing id is tombstoned and re-appended, i.e. add behaves as upsert"""
+        if not ids:
+            return
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = len(embeddings[0])
+            elif len(embeddings[0]) != self.dim:
+                raise ValueError(f"Embedding dimension {len(embeddings[0])} does not match index dimension {self.dim}")
+
+            replaced = [chunk_id for chunk_id in ids if chunk_id in self._row_by_id]
+            if replaced:
+                self._tombstone(replaced)
+
+            start = self._rows
+            self._ensure_capacity(start + len(ids))
+            self._matrix[start:start + len(ids)] = self._encode_vectors(embeddings)
+            self._matrix.flush()
+            self._rows = start + len(ids)
+            self._write_header()
+
+            self._db.executemany(
+                "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (start + i, chunk_id, documents[i], json.dumps(metadatas[i] or {}))
+                    for i, chunk_id in enumerate(ids)
+                ]
+            )
+            self._db.commit()
+            for i, chunk_id in enumerate(ids):
+                self._row_by_id[chunk_id] = start + i
+                self._alive[start + i] = True
+
+    upsert = add
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances")
+    ) -> Dict[str, List]:
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self._lock:
+            candidates = self._candidate_rows(where)
+            for query_embedding in query_embeddings:
+                rows, similarities = self._top_k(np.asarray(query_embedding, dtype=np.float32), candidates, n_results)
+                fetched = self._fetch_rows(rows, include)
+                results["ids"].append(fetched["ids"])
+                results["documents"].append(fetched["documents"])
+                results["metadatas"].append(fetched["metadatas"])
+                results["embeddings"].append(fetched["embeddings"])
+                results["distances"].append([float(1.0 - s) for s in similarities])
+        return results
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas")
+    ) -> Dict[str, List]:
+        with self._lock:
+            if ids is not None:
+                rows = [self._row_by_id[chunk_id] for chunk_id in ids if chunk_id in self._row_by_id]
+                if where is not None:
+                    allowed = set(self._candidate_rows(where).tolist())
+                    rows = [row for row in rows if row in allowed]
+            else:
+                rows = sorted(self._candidate_rows(where).tolist())
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            return self._fetch_rows(np.asarray(rows, dtype=np.int64), include)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            if ids is None:
+                ids = self.get(where=where, include=[])["ids"] if where is not None else []
+            self._tombstone([chunk_id for chunk_id in ids if chunk_id in self._row_by_id])
+            self._db.commit()
+            dead = self._rows - len(self._row_by_id)
+            if self._rows and dead / self._rows > self.compact_ratio:
+                self.compact()
+
+    # -- internals -----------------------------------------------------------------------
+
+    def _tombstone(self, ids: List[str]) -> None:
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            self._db.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+        for chunk_id in ids:
+            self._alive[self._row_by_id.pop(chunk_id)] = False
+
+    def _candidate_rows(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        if where is None:
+            return np.flatnonzero(self._alive[:self._rows])
+        sql, params = _where_to_sql(where)
+        rows = [row for (row,) in self._db.execute(f"SELECT row FROM chunks WHERE {sql}", params)]
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+    def _top_k(self, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._matrix is None or not len(rows) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+
+        if len(rows) == self._rows:
+            # Unfiltered and no tombstones: score contiguous blocks straight off the memmap
+            scores = np.empty(self._rows, dtype=np.float32)
+            for start in range(0, self._rows, _SCORE_BLOCK):
+                end = min(start + _SCORE_BLOCK, self._rows)
+                scores[start:end] = self._matrix[start:end].astype(np.float32) @ query
+        else:
+            scores = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), _SCORE_BLOCK):
+                block_rows = rows[start:start + _SCORE_BLOCK]
+                scores[start:start + len(block_rows)] = self._matrix[block_rows].astype(np.float32) @ query
+        if self.dtype == "int8":
+            scores /= 127
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        selected_rows = top if len(rows) == self._rows else rows[top]
+        return selected_rows, scores[top]
+
+    def _fetch_rows(self, rows: np.ndarray, include: Sequence[str]) -> Dict[str, List]:
+        by_row: Dict[int, Tuple] = {}
+        row_list = [int(row) for row in rows]
+        for start in range(0, len(row_list), _SQL_BATCH):
+            batch = row_list[start:start + _SQL_BATCH]
+            for row, chunk_id, document, metadata in self._db.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})",
+                batch
+            ):
+                by_row[row] = (chunk_id, document, metadata)
+
+        ordered = [row for row in row_list if row in by_row]
+        return {
+            "ids": [by_row[row][0] for row in ordered],
+            "documents": [by_row[row][1] for row in ordered] if "documents" in include else None,
+            "metadatas": [json.loads(by_row[row][2]) for row in ordered] if "metadatas" in include else None,
+            "embeddings": (
+                self._decode_rows(np.asarray(ordered, dtype=np.int64)).tolist()
+                if "embeddings" in include and ordered else ([] if "embeddings" in include else None)
+            )
+        }
+
+    def compact(self) -> None:
+        """Rewrite the matrix and sidecar without tombstoned rows"""
+        with self._lock:
+            if self._matrix is None:
+                return
+            live = [
+                (row, chunk_id)
+                for row, chunk_id in self._db.execute("SELECT row, id FROM chunks ORDER BY row")
+                if row < self._rows
+            ]
+            print(f"[NUMPY_INDEX] Compacting {self._rows} rows down to {len(live)}")
+
+            old_rows = np.asarray([row for row, _ in live], dtype=np.int64)
+            vectors = np.asarray(self._matrix[old_rows]) if len(live) else np.empty((0, self.dim), dtype=self.dtype)
+            self._matrix.flush()
+            self._matrix = None
+
+            capacity = max(len(live), 1024)
+            tmp_path = os.path.join(self.path, f"{_VECTORS}.tmp")
+            compacted = np.memmap(tmp_path, dtype=np.dtype(self.dtype), mode="w+", shape=(capacity, self.dim))
+            compacted[:len(live)] = vectors
+            compacted.flush()
+            del compacted
+            os.replace(tmp_path, os.path.join(self.path, _VECTORS))
+
+            # Renumber rows in two steps so the primary key never collides
+            self._db.execute("UPDATE chunks SET row = -row - 1")
+            self._db.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new_row, -old_row - 1) for new_row, (old_row, _) in enumerate(live)]
+            )
+            self._db.commit()
+
+            self._rows = len(live)
+            self._capacity = capacity
+            self._write_header()
+            self._open_matrix()
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:self._rows] = True
+            self._row_by_id = {chunk_id: new_row for new_row, (_, chunk_id) in enumerate(live)}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+            self._write_header()
+            self._db.close()
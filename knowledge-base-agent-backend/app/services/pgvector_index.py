@@ -0,0 +1,326 @@
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, create_engine, delete, func, or_, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import Delete
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models.chunk import DEFAULT_COLLECTION, KnowledgeChunk, VectorCollection
+
+_COMPARISONS = {
+    "$eq": lambda column, value: column == value,
+    "$ne": lambda column, value: column != value,
+    "$gt": lambda column, value: column > value,
+    "$gte": lambda column, value: column >= value,
+    "$lt": lambda column, value: column < value,
+    "$lte": lambda column, value: column <= value
+}
+
+# hnsw.ef_search is capped at 1000 by pgvector
+_MAX_EF_SEARCH = 1000
+# Collection names are interpolated into index DDL
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9._-]{1,100}$")
+
+
+def sync_database_url(url: str) -> str:
+    """DATABASE_URL for a blocking engine (the API itself talks to PostgreSQL through asyncpg)"""
+    return url.replace("+asyncpg", "+psycopg2")
+
+
+def _metadata_value(key: str, sample: Any) -> ColumnElement:
+    """Metadata field typed after the value it is compared with"""
+    if key == "source_id":
+        # Mirrored in an indexed column with the foreign key
+        return KnowledgeChunk.source_id
+    field = KnowledgeChunk.chunk_metadata[key]
+    if isinstance(sample, bool):
+        return field.as_boolean()
+    if isinstance(sample, (int, float)):
+        return field.as_float()
+    return field.as_string()
+
+
+def where_clause(where: Dict[str, Any]) -> ColumnElement:
+    """Translate the subset of Chroma's where syntax VectorStore uses into a SQL expression"""
+    if len(where) == 1 and next(iter(where)) in ("$and", "$or"):
+        operator, clauses = next(iter(where.items()))
+        parts = [where_clause(clause) for clause in clauses]
+        return and_(*parts) if operator == "$and" else or_(*parts)
+
+    parts = []
+    for key, condition in where.items():
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                column = _metadata_value(key, values[0] if values else "")
+                parts.append(column.in_(values) if operator == "$in" else column.not_in(values))
+            elif operator in _COMPARISONS:
+                parts.append(_COMPARISONS[operator](_metadata_value(key, value), value))
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return and_(*parts)
+
+
+class PgVectorCollection:
+    """Chunk vectors in the knowledge_chunks table, next to the sources they belong to.
+
+    Implements the same collection API as Chroma and NumpyCollection (add/upsert,
+    query, get, delete, count, metadata/modify) so it can be selected with
+    VECTOR_DB_TYPE="pgvector"; collection metadata lives in vector_collections.
+    Chunks reference knowledge_sources with ON DELETE CASCADE, and rows()
+    builds ORM objects so VectorStore.add_document can insert them in the
+    caller's transaction: a source and its chunks commit or roll back together.
+
+    Several collections share the table, told apart by its collection column;
+    each has a partial HNSW index, so searching one is unaffected by the rows
+    of another being built next to it. They share the column's vector width
+    (EMBEDDING_DIMENSION, see vector_width), which VectorStore checks before
+    writing vectors of another width.
+
+    The collection methods are blocking and use a small engine of their own,
+    because VectorStore calls them from its io pool. Unfiltered queries use
+    the HNSW index; filtered ones are answered exactly, since HNSW applies the
+    WHERE clause after the graph search and could return fewer than n_results.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        ef_search: int = 100,
+        pool_size: int = 4,
+        name: str = DEFAULT_COLLECTION
+    ):
+        if not _COLLECTION_NAME.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+        self.name = name
+        self.ef_search = ef_search
+        self._vector_width: Optional[int] = None
+        self.engine = create_engine(
+            sync_database_url(database_url),
+            pool_size=pool_size,
+            pool_pre_ping=True
+        )
+        self.ensure_index()
+
+    @property
+    def index_name(self) -> str:
+        if self.name == DEFAULT_COLLECTION:
+            return "idx_knowledge_chunks_embedding"
+        return f"idx_knowledge_chunks_embedding_{hashlib.sha256(self.name.encode('utf-8')).hexdigest()[:12]}"
+
+    def ensure_index(self) -> None:
+        """Create the collection's partial HNSW index (the default collection's is part of the schema)"""
+        if self.name == DEFAULT_COLLECTION:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {self.index_name} ON knowledge_chunks "
+                f"USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64) "
+                f"WHERE collection = '{self.name}'"
+            ))
+
+    def rows(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> List[KnowledgeChunk]:
+        """ORM rows for chunks, for adding to an AsyncSession"""
+        return [
+            KnowledgeChunk(
+                collection=self.name,
+                id=chunk_id,
+                source_id=metadatas[i]["source_id"],
+                chunk_index=metadatas[i].get("chunk_index", 0),
+                content=documents[i],
+                chunk_metadata=metadatas[i],
+                embedding=embeddings[i]
+            )
+            for i, chunk_id in enumerate(ids)
+        ]
+
+    def delete_statement(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> Delete:
+        """DELETE ... RETURNING id for the given chunks, for executing in a caller's session"""
+        statement = (
+            delete(KnowledgeChunk)
+            .where(KnowledgeChunk.collection == self.name)
+            .returning(KnowledgeChunk.id)
+        )
+        if ids is not None:
+            statement = statement.where(KnowledgeChunk.id.in_(ids))
+        if where is not None:
+            statement = statement.where(where_clause(where))
+        return statement
+
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        """Collection metadata, as Chroma's collection.metadata (None until modify() is called)"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(VectorCollection.collection_metadata).where(VectorCollection.name == self.name)
+            ).scalar_one_or_none()
+
+    def modify(self, metadata: Dict[str, Any]) -> None:
+        """Replace the collection metadata"""
+        statement = insert(VectorCollection).values(name=self.name, collection_metadata=metadata)
+        statement = statement.on_conflict_do_update(
+            index_elements=[VectorCollection.name],
+            set_={"collection_metadata": statement.excluded.collection_metadata, "updated_at": func.now()}
+        )
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+
+    def vector_width(self) -> int:
+        """Width of the embedding column as created in the database, which may predate EMBEDDING_DIMENSION"""
+        if self._vector_width is None:
+            with self.engine.connect() as conn:
+                width = conn.execute(text(
+                    "SELECT atttypmod FROM pg_attribute "
+                    "WHERE attrelid = 'knowledge_chunks'::regclass AND attname = 'embedding'"
+                )).scalar()
+            # pgvector stores the dimension as the type modifier
+            self._vector_width = width if width and width > 0 else KnowledgeChunk.embedding.type.dim
+        return self._vector_width
+
+    def count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(KnowledgeChunk).where(KnowledgeChunk.collection == self.name)
+            ).scalar_one()
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """Insert chunks in their own transaction; an existing id is overwritten, i.e. add behaves as upsert"""
+        if not ids:
+            return
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        statement = insert(KnowledgeChunk).values([
+            {
+                "collection": self.name,
+                "id": chunk_id,
+                "source_id": metadatas[i]["source_id"],
+                "chunk_index": metadatas[i].get("chunk_index", 0),
+                "content": documents[i],
+                "chunk_metadata": metadatas[i],
+                "embedding": embeddings[i]
+            }
+            for i, chunk_id in enumerate(ids)
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[KnowledgeChunk.collection, KnowledgeChunk.id],
+            set_={
+                column: statement.excluded[column]
+                for column in ("source_id", "chunk_index", "content", "chunk_metadata", "embedding")
+            }
+        )
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+
+    upsert = add
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances")
+    ) -> Dict[str, List]:
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self.engine.begin() as conn:
+            if where is None:
+                conn.execute(text(f"SET LOCAL hnsw.ef_search = {min(max(self.ef_search, n_results), _MAX_EF_SEARCH)}"))
+            else:
+                conn.execute(text("SET LOCAL enable_indexscan = off"))
+
+            for query_embedding in query_embeddings:
+                distance = KnowledgeChunk.embedding.cosine_distance(query_embedding).label("distance")
+                columns = [KnowledgeChunk.id, KnowledgeChunk.content, KnowledgeChunk.chunk_metadata, distance]
+                if "embeddings" in include:
+                    columns.append(KnowledgeChunk.embedding)
+                statement = (
+                    select(*columns)
+                    .where(KnowledgeChunk.collection == self.name)
+                    .order_by(distance)
+                    .limit(n_results)
+                )
+                if where is not None:
+                    statement = statement.where(where_clause(where))
+                rows = conn.execute(statement).all()
+
+                results["ids"].append([row.id for row in rows])
+                results["documents"].append([row.content for row in rows])
+                results["metadatas"].append([row.chunk_metadata for row in rows])
+                results["distances"].append([float(row.distance) for row in rows])
+                results["embeddings"].append(
+                    [row.embedding.tolist() for row in rows] if "embeddings" in include else None
+                )
+        return results
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas")
+    ) -> Dict[str, List]:
+        columns = [KnowledgeChunk.id]
+        if "documents" in include:
+            columns.append(KnowledgeChunk.content)
+        if "metadatas" in include:
+            columns.append(KnowledgeChunk.chunk_metadata)
+        if "embeddings" in include:
+            columns.append(KnowledgeChunk.embedding)
+        statement = select(*columns).where(KnowledgeChunk.collection == self.name).order_by(KnowledgeChunk.id)
+        if ids is not None:
+            statement = statement.where(KnowledgeChunk.id.in_(ids))
+        if where is not None:
+            statement = statement.where(where_clause(where))
+        if offset:
+            statement = statement.offset(offset)
+        if limit is not None:
+            statement = statement.limit(limit)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(statement).all()
+
+        if ids is not None:
+            # Chroma returns rows in the order the ids were asked for
+            position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            rows.sort(key=lambda row: position[row.id])
+
+        return {
+            "ids": [row.id for row in rows],
+            "documents": [row.content for row in rows] if "documents" in include else None,
+            "metadatas": [row.chunk_metadata for row in rows] if "metadatas" in include else None,
+            "embeddings": [row.embedding.tolist() for row in rows] if "embeddings" in include else None
+        }
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        if ids is None and where is None:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(self.delete_statement(ids, where))
+
+    def drop(self) -> None:
+        """Delete the collection's chunks, index and metadata"""
+        with self.engine.begin() as conn:
+            conn.execute(delete(KnowledgeChunk).where(KnowledgeChunk.collection == self.name))
+            conn.execute(delete(VectorCollection).where(VectorCollection.name == self.name))
+            if self.name != DEFAULT_COLLECTION:
+                conn.execute(text(f"DROP INDEX IF EXISTS {self.index_name}"))
+
+    def close(self) -> None:
+        self.engine.dispose()
@@ -0,0 +1,84 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def approx_size(obj: Any) -> int:
+    """Rough deep size in bytes of the JSON-like values we cache"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(item) for item in obj)
+    return size
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with a per-entry TTL.
+
+    Tracks hits, misses and the approximate memory held by cached values so
+    they can be reported on /metrics.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+
+        size = approx_size(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "approx_bytes": self._bytes
+            }
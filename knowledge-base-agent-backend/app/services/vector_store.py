@@ -1,105 +1,1238 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
 import uuid
 import re
+from urllib.parse import urlparse
 from app.core.config import settings
+from app.models.chunk import DEFAULT_COLLECTION
+from app.services.diversify import merge_adjacent_chunks, mmr_select
+from app.services.chunker import Chunk, TokenChunker, chunk_by_characters, load_tokenizer
+from app.services.embedding_batcher import MicroBatcher
+from app.services.embedders import create_embedder, embedder_version
+from app.services.embedding_cache import EmbeddingCache
+from app.services.executors import BoundedExecutor
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from app.services.numpy_index import NumpyCollection
+from app.services.pgvector_index import PgVectorCollection
+from app.services.query_cache import LRUCache
+
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+
+# Model instance owned by each encode worker process (EMBED_EXECUTOR="process")
+_worker_embedder = None
+
+def _init_embed_worker(spec: Dict[str, Any]) -> None:
+    global _worker_embedder
+    _worker_embedder = create_embedder(settings.model_copy(update=spec))
+
+def _encode_in_worker(texts: List[str], batch_size: int):
+    return _worker_embedder.encode(texts, batch_size)
 
 class VectorStore:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
-        self.collection = self.client.get_or_create_collection(
-            name="knowledge_base",
+    """Vector index plus embedding model.
+
+    The index is a Chroma collection by default; VECTOR_DB_TYPE="numpy" swaps in
+    NumpyCollection and VECTOR_DB_TYPE="pgvector" PgVectorCollection, which
+    implement the same collection methods. With pgvector, writes given a
+    database session join the caller's transaction (see transactional).
+
+    Loading the model and opening the index is expensive, so the API
+    creates a single instance in the app lifespan (see app.main) and shares it
+    between requests through app.api.deps.get_vector_store.
+
+    Encoding and Chroma calls are blocking, so the async methods hand them to
+    bounded pools (encode_executor, io_executor) instead of running them on
+    the event loop.
+
+    Each instance serves one index namespace: name selects the collection
+    (and the matching numpy index and BM25 files), and spec overrides the
+    embedder and chunker settings it was built with. The API opens them
+    through index_registry, which can build a new namespace while this one
+    stays live. on_sources_changed, when set, is called with the IDs of
+    sources whose chunks were written or deleted, after the caller's commit.
+    """
+
+    def __init__(
+        self,
+        name: str = DEFAULT_COLLECTION,
+        spec: Optional[Dict[str, Any]] = None,
+        embedding_cache: Optional[EmbeddingCache] = None
+    ):
+        self.name = name
+        self.spec = dict(spec or {})
+        # Settings with this index's embedder and chunker overrides applied
+        self.config = settings.model_copy(update=self.spec) if self.spec else settings
+        self.on_sources_changed: Optional[Callable[[List[str]], None]] = None
+        self._write_lock = threading.Lock()
+        self._ready = False
+        # When the BM25 pickle was last checked for writes by other processes
+        self._lexical_checked_at = 0.0
+        # Bumped on every mutation of the collection; part of the search cache key
+        self.kb_version = 0
+        # Post-commit index updates scheduled from session events
+        self._background_tasks = set()
+        self.query_embedding_cache = LRUCache(
+            settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+            settings.QUERY_CACHE_TTL_SECONDS
+        )
+        self.search_cache = LRUCache(
+            settings.SEARCH_CACHE_MAX_ENTRIES,
+            settings.QUERY_CACHE_TTL_SECONDS
+        )
+        self.client, self.collection = self._open_collection()
+        self.embedding_model = self.config.EMBEDDING_MODEL
+        # Vectors from different embedders are never mixed (see embedder_version)
+        self.embedding_version = embedder_version(self.config)
+        # Vector width, known once the collection's embedding space is recorded or checked
+        self.embedding_dimension = None
+        self._check_embedding_space()
+        self.io_executor = BoundedExecutor(
+            "vector-io",
+            max_workers=settings.VECTOR_IO_WORKERS,
+            max_pending=settings.EXECUTOR_MAX_PENDING
+        )
+        if settings.EMBED_EXECUTOR == "process":
+            # Each worker process loads its own copy of the model
+            self.embedder = None
+            self.encode_executor = BoundedExecutor(
+                "embed",
+                max_workers=settings.EMBED_WORKERS,
+                max_pending=settings.EXECUTOR_MAX_PENDING,
+                kind="process",
+                initializer=_init_embed_worker,
+                initargs=(self.spec,)
+            )
+        else:
+            self.embedder = create_embedder(self.config)
+            self.encode_executor = BoundedExecutor(
+                "embed",
+                max_workers=settings.EMBED_WORKERS,
+                max_pending=settings.EXECUTOR_MAX_PENDING
+            )
+        # Concurrent search queries share encode calls instead of encoding one by one
+        self.query_batcher = None
+        if settings.QUERY_MICROBATCH_ENABLED:
+            self.query_batcher = MicroBatcher(
+                lambda texts: self._encode(texts, len(texts)),
+                max_batch_size=settings.QUERY_MICROBATCH_MAX_SIZE,
+                max_wait_ms=settings.QUERY_MICROBATCH_MAX_WAIT_MS
+            )
+        self.chunker = self._create_chunker()
+        self.lexical_index = None
+        if settings.LEXICAL_INDEX_ENABLED:
+            self.lexical_index = BM25Index.load(self.namespaced_path(settings.LEXICAL_INDEX_PATH, name))
+        # A cache passed in is shared with another index and closed by its owner
+        self.embedding_cache = embedding_cache
+        self._owns_embedding_cache = embedding_cache is None
+        if embedding_cache is None and settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                settings.EMBEDDING_CACHE_PATH,
+                max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+            )
+
+    @staticmethod
+    def namespaced_path(path: str, name: str) -> str:
+        """File or directory of a per-index artifact; the default collection keeps the configured path"""
+        if name == DEFAULT_COLLECTION:
+            return path
+        root, ext = os.path.splitext(path.rstrip("/"))
+        return f"{root}-{name}{ext}"
+
+    def _open_collection(self):
+        """Open this index's collection in the configured vector backend; returns (client, collection)"""
+        if settings.VECTOR_DB_TYPE == "numpy":
+            return None, NumpyCollection(
+                self.namespaced_path(settings.NUMPY_INDEX_PATH, self.name),
+                dtype=settings.NUMPY_INDEX_DTYPE
+            )
+        if settings.VECTOR_DB_TYPE == "pgvector":
+            return None, PgVectorCollection(
+                settings.DATABASE_URL,
+                ef_search=settings.PGVECTOR_EF_SEARCH,
+                pool_size=settings.VECTOR_IO_WORKERS,
+                name=self.name
+            )
+        if settings.VECTOR_DB_TYPE != "chromadb":
+            raise ValueError(f"Unsupported VECTOR_DB_TYPE: {settings.VECTOR_DB_TYPE}")
+
+        client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
+        collection = client.get_or_create_collection(
+            name=self.name,
             metadata={"hnsw:space": "cosine"}
         )
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    async def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
-        """Add a document to the vector store"""
-        # Split content into chunks
-        chunks = self._chunk_text(content)
+        return client, collection
 
-        doc_ids = []
-        for i, chunk in enumerate(chunks):
-            doc_id = str(uuid.uuid4())
-            embedding = self.embedder.encode(chunk).tolist()
+    @classmethod
+    def index_exists(cls, name: str) -> bool:
+        """Whether an index namespace already holds chunks, without loading an embedder"""
+        if settings.VECTOR_DB_TYPE == "numpy":
+            path = cls.namespaced_path(settings.NUMPY_INDEX_PATH, name)
+            return os.path.isdir(path) and bool(os.listdir(path))
+        if settings.VECTOR_DB_TYPE == "pgvector":
+            collection = PgVectorCollection(settings.DATABASE_URL, pool_size=1, name=name)
+            try:
+                return collection.count() > 0
+            finally:
+                collection.close()
+        client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
+        try:
+            return client.get_collection(name).count() > 0
+        except Exception:
+            return False  # Never created
+
+    @classmethod
+    def drop_index(cls, name: str) -> None:
+        """Delete a closed index namespace: its collection, numpy index and BM25 file"""
+        if settings.VECTOR_DB_TYPE == "numpy":
+            shutil.rmtree(cls.namespaced_path(settings.NUMPY_INDEX_PATH, name), ignore_errors=True)
+        elif settings.VECTOR_DB_TYPE == "pgvector":
+            collection = PgVectorCollection(settings.DATABASE_URL, pool_size=1, name=name)
+            try:
+                collection.drop()
+            finally:
+                collection.close()
+        else:
+            client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
+            try:
+                client.delete_collection(name)
+            except ValueError:
+                pass  # Never created
+
+        lexical_path = cls.namespaced_path(settings.LEXICAL_INDEX_PATH, name)
+        if os.path.exists(lexical_path):
+            os.remove(lexical_path)
+        print(f"[VECTOR_STORE] Dropped index {name}")
+
+    def _recorded_embedding_space(self) -> Tuple[Optional[str], Optional[int]]:
+        """(embedding_version, dimension) recorded on the collection"""
+        metadata = self.collection.metadata or {}
+        version = metadata.get("embedding_version")
+        if version is None and self.collection.count():
+            # Collections written before versioning hold sentence-transformers vectors
+            version = self.config.EMBEDDING_MODEL
+        return version, metadata.get("embedding_dimension")
+
+    def _check_embedding_space(self) -> None:
+        """Warn at startup when the collection was built by a different embedder"""
+        version, dimension = self._recorded_embedding_space()
+        if version is not None and version != self.embedding_version:
+            print(
+                f"[VECTOR_STORE] WARNING: collection holds {version} vectors but the configured "
+                f"embedder is {self.embedding_version}; searches will fail until it is re-indexed"
+            )
+        elif dimension is not None:
+            self.embedding_dimension = dimension
+
+    def _check_vector_width(self, dimension: int) -> None:
+        """Refuse vectors wider or narrower than the collection can store (pgvector's fixed-width column)"""
+        vector_width = getattr(self.collection, "vector_width", None)
+        width = vector_width() if vector_width is not None else None
+        if width is not None and dimension != width:
+            raise ValueError(
+                f"The configured embedder produces {self.embedding_version} vectors ({dimension} dimensions) "
+                f"but the pgvector column stores {width} dimensions; only embedders of that width "
+                f"(EMBEDDING_DIMENSION) can be used with this database"
+            )
+
+    async def check_embedding_width(self) -> None:
+        """Raise ValueError if the embedder's vectors do not fit the collection, before anything is written"""
+        if getattr(self.collection, "vector_width", None) is None:
+            return
+        dimension = self.embedding_dimension
+        if dimension is None:
+            dimension = len((await self._encode(["dimension probe"], 1))[0])
+        await self.io_executor.run(self._check_vector_width, dimension)
+
+    def _record_embedding_space(self, dimension: int) -> None:
+        """Record the embedder and vector width on the collection, refusing to mix embedding spaces"""
+        self._check_vector_width(dimension)
+        version, recorded_dimension = self._recorded_embedding_space()
+        if version not in (None, self.embedding_version) or recorded_dimension not in (None, dimension):
+            raise ValueError(
+                f"Collection holds {version} vectors ({recorded_dimension or '?'} dimensions) but the "
+                f"configured embedder produces {self.embedding_version} vectors ({dimension} dimensions); "
+                f"re-index into an empty collection instead of mixing them"
+            )
+        if recorded_dimension is None:
+            self.collection.modify(metadata={
+                **(self.collection.metadata or {}),
+                "embedding_backend": self.config.EMBEDDER_BACKEND,
+                "embedding_version": self.embedding_version,
+                "embedding_dimension": dimension
+            })
+            print(f"[VECTOR_STORE] Recorded embedding space {self.embedding_version} ({dimension} dimensions)")
+        self.embedding_dimension = dimension
+
+    def _create_chunker(self) -> Optional[TokenChunker]:
+        """Token-aware chunker sized to the model's input window (None = legacy character chunker)"""
+        if self.config.CHUNKER != "tokens":
+            return None
+
+        max_tokens = self.config.CHUNK_MAX_TOKENS
+        if getattr(self.embedder, "tokenizer", None) is not None:
+            # The chunker gets its own tokenizer copy so it never contends with encode()
+            tokenizer = copy.deepcopy(self.embedder.tokenizer)
+            max_tokens = min(max_tokens, self.embedder.max_seq_length)
+        else:
+            tokenizer = load_tokenizer(self.embedding_model)
+
+        # Leave room for the [CLS] and [SEP] tokens the model adds
+        return TokenChunker(tokenizer, max_tokens=max_tokens - 2, overlap_tokens=self.config.CHUNK_OVERLAP_TOKENS)
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready
+
+    @property
+    def transactional(self) -> bool:
+        """True when chunks live in PostgreSQL and can be written in the caller's transaction"""
+        return isinstance(self.collection, PgVectorCollection)
+
+    def warm_up(self) -> None:
+        """Run a throwaway encode and query so the first real request doesn't pay for lazy init"""
+        if self.encode_executor.kind == "process":
+            embedding = self.encode_executor.submit_blocking(_encode_in_worker, ["warm up"], 1)[0].tolist()
+        else:
+            embedding = self._encode_local(["warm up"], 1)[0].tolist()
+        count = self.collection.count()
+        if count > 0:
+            self.collection.query(query_embeddings=[embedding], n_results=1)
+        if self.lexical_index is not None and len(self.lexical_index) != count:
+            self.rebuild_lexical_index()
+        self._ready = True
+
+    def rebuild_lexical_index(self, page_size: int = 1000) -> None:
+        """Rebuild the BM25 index from the chunks stored in Chroma"""
+        with self._write_lock:
+            self._rebuild_lexical_index_locked(page_size)
+
+    def _rebuild_lexical_index_locked(self, page_size: int = 1000) -> None:
+        print(f"[BM25] Rebuilding lexical index ({self.collection.count()} chunks)")
+        self.lexical_index.clear()
+        offset = 0
+        while True:
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents"])
+            if not page['ids']:
+                break
+            self.lexical_index.add(page['ids'], page['documents'])
+            offset += len(page['ids'])
+        # The collection is the source of truth, so this copy replaces whatever is on disk
+        self.lexical_index.save(overwrite=True)
+        self._lexical_checked_at = time.monotonic()
+        print(f"[BM25] Lexical index rebuilt with {len(self.lexical_index)} chunks")
+
+    def _save_lexical_index(self, min_interval: float = 0.0) -> None:
+        """Persist the BM25 index; call with _write_lock held
+
+        If another process (a reindex or cleanup script) rewrote the pickle,
+        this copy is stale for the chunks it changed: rebuild from the
+        collection instead of overwriting theirs.
+        """
+        if self.lexical_index.save(min_interval=min_interval):
+            return
+        self._rebuild_lexical_index_locked()
+        self._bump_kb_version()
 
-            chunk_metadata = {
-                **metadata,
-                "chunk_index": i,
-                "total_chunks": len(chunks)
+    def _lexical_search(self, query: str, n_results: int, allowed_ids: Optional[set]) -> List[Tuple[str, float]]:
+        """BM25 search that first picks up changes other processes saved to the pickle"""
+        now = time.monotonic()
+        if now - self._lexical_checked_at >= settings.LEXICAL_INDEX_CHECK_INTERVAL_SECONDS:
+            with self._write_lock:
+                self._lexical_checked_at = now
+                if self.lexical_index.changed_on_disk():
+                    print("[BM25] Lexical index changed on disk; rebuilding from the collection")
+                    self._rebuild_lexical_index_locked()
+                    self._bump_kb_version()
+        return self.lexical_index.search(query, n_results, allowed_ids)
+
+    def close(self, release_client: bool = True) -> None:
+        """Release the Chroma client, the model and the worker pools
+
+        Pass release_client=False while other indexes stay open: Chroma's
+        client cache is per process, not per collection.
+        """
+        self._ready = False
+        self.encode_executor.shutdown()
+        self.io_executor.shutdown()
+        with self._write_lock:
+            if self.lexical_index is not None:
+                self._save_lexical_index()
+            clear_cache = getattr(self.client, "clear_system_cache", None)
+            if clear_cache and release_client:
+                clear_cache()
+            close_collection = getattr(self.collection, "close", None)
+            if callable(close_collection):
+                close_collection()
+            self.collection = None
+            self.client = None
+            close_embedder = getattr(self.embedder, "close", None)
+            if callable(close_embedder):
+                close_embedder()
+            self.embedder = None
+            if self.embedding_cache and self._owns_embedding_cache:
+                self.embedding_cache.close()
+            self.embedding_cache = None
+        self.query_embedding_cache.clear()
+        self.search_cache.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Cache statistics reported on /metrics"""
+        return {
+            "collection": self.name,
+            "kb_version": self.kb_version,
+            "query_embedding_cache": self.query_embedding_cache.stats(),
+            "search_cache": self.search_cache.stats(),
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+            "lexical_index": self.lexical_index.stats() if self.lexical_index is not None else None,
+            "query_batcher": self.query_batcher.stats() if self.query_batcher else None,
+            "embedder": {
+                "backend": self.config.EMBEDDER_BACKEND,
+                "version": self.embedding_version,
+                "dimension": self.embedding_dimension,
+                **(self.embedder.stats() if hasattr(self.embedder, "stats") else {})
+            },
+            "executors": {
+                "encode": self.encode_executor.stats(),
+                "io": self.io_executor.stats()
             }
+        }
+
+    def _bump_kb_version(self) -> None:
+        """Invalidate cached search results after the collection changes"""
+        self.kb_version += 1
+
+    async def add_document(
+        self,
+        content: str,
+        metadata: Dict[str, Any],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        db: Optional[AsyncSession] = None
+    ) -> str:
+        """Add a document to the vector store
 
-            # Extract page number from chunk if it's a PDF
-            if metadata.get("type") == "pdf":
-                page_num = self._extract_page_number(chunk)
-                if page_num:
-                    chunk_metadata["page_number"] = page_num
-
-            self.collection.add(
-                ids=[doc_id],
-                embeddings=[embedding],
-                documents=[chunk],
-                metadatas=[chunk_metadata]
+        Chunks of a source get deterministic IDs (see chunk_id), so adding the
+        same document again overwrites its chunks instead of duplicating them.
+        To re-index a source whose content changed, use sync_document, which
+        also drops chunks that no longer exist and skips unchanged ones.
+
+        Args:
+            content: Full document text
+            metadata: Metadata copied onto every chunk
+            progress_callback: Optional callable receiving (chunks_done, total_chunks)
+            db: Optional session holding the source row. With the pgvector
+                backend the chunks are added to it instead of being written
+                directly, so they commit (or roll back) with the source; the
+                lexical index and search caches catch up after the commit.
+                Other backends ignore it.
+
+        Returns:
+            ID of the first chunk, or None if the document produced no chunks
+        """
+        # Split content into chunks
+        chunks = await self.io_executor.run(self._chunk_text, content)
+        metadata = self._document_metadata(metadata)
+        source_id = metadata.get("source_id")
+
+        entries = [
+            (
+                self.chunk_id(source_id, index) if source_id else str(uuid.uuid4()),
+                chunk.text,
+                self._chunk_metadata(metadata, chunk, index, len(chunks))
             )
-            doc_ids.append(doc_id)
+            for index, chunk in enumerate(chunks)
+        ]
+        if entries and db is not None and self.transactional:
+            # The session has no upsert: replace existing rows within the same transaction
+            await db.execute(self.collection.delete_statement(ids=[chunk_id for chunk_id, _, _ in entries]))
+        await self._write_chunks(entries, db=db, progress_callback=progress_callback)
+        if source_id:
+            self._sources_changed([source_id], db)
+        return entries[0][0] if entries else None
+
+    async def sync_document(
+        self,
+        content: str,
+        metadata: Dict[str, Any],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Dict[str, Any]:
+        """Bring a source's chunks in line with its current content
+
+        Every chunk carries a hash of its text. A chunk whose text is already
+        stored for the source keeps that vector (only its metadata is
+        rewritten if it moved), new or edited chunks are embedded, and stored
+        chunks past the new end of the document, or indexed under older IDs,
+        are deleted. A re-scrape or re-upload with small edits therefore only
+        embeds the chunks that changed.
+
+        Args:
+            content: Full document text
+            metadata: Metadata copied onto every chunk; must include source_id
+            progress_callback: Optional callable receiving (chunks_done, chunks_to_embed)
+            db: Optional session, as for add_document
+
+        Returns:
+            "added", "kept" and "removed" chunk counts, plus "first_id", the ID
+            of the document's first chunk (None if it produced no chunks)
+        """
+        source_id = metadata["source_id"]
+        chunks = await self.io_executor.run(self._chunk_text, content)
+        metadata = self._document_metadata(metadata)
+        stored = await self.io_executor.run(self._source_chunk_metadata, source_id)
+
+        # Stored chunk per content hash, so text that only moved reuses its vector;
+        # chunks indexed before hashing, or by another embedder, never match
+        by_hash = {}
+        for chunk_id, chunk_metadata in stored.items():
+            if chunk_metadata.get("content_hash") and self._current_embedding(chunk_metadata):
+                by_hash.setdefault(chunk_metadata["content_hash"], chunk_id)
+
+        added, rewritten, donors = [], [], {}
+        for index, chunk in enumerate(chunks):
+            chunk_id = self.chunk_id(source_id, index)
+            chunk_metadata = self._chunk_metadata(metadata, chunk, index, len(chunks))
+            current = stored.get(chunk_id)
+            if (
+                current is not None
+                and current.get("content_hash") == chunk_metadata["content_hash"]
+                and self._current_embedding(current)
+            ):
+                if current != chunk_metadata:
+                    rewritten.append((chunk_id, chunk.text, chunk_metadata))
+                    donors[chunk_id] = chunk_id
+            elif chunk_metadata["content_hash"] in by_hash:
+                rewritten.append((chunk_id, chunk.text, chunk_metadata))
+                donors[chunk_id] = by_hash[chunk_metadata["content_hash"]]
+            else:
+                added.append((chunk_id, chunk.text, chunk_metadata))
+
+        current_ids = {self.chunk_id(source_id, index) for index in range(len(chunks))}
+        removed = [chunk_id for chunk_id in stored if chunk_id not in current_ids]
+
+        # Read the reused vectors before any of their rows is overwritten
+        vectors = {}
+        if donors:
+            fetched = await self.io_executor.run(self._fetch_embeddings, list(set(donors.values())))
+            vectors = {chunk_id: fetched[donor].tolist() for chunk_id, donor in donors.items()}
+
+        if db is not None and self.transactional:
+            # The session has no upsert: replace overwritten rows within the same transaction
+            overwritten = [chunk_id for chunk_id, _, _ in added + rewritten if chunk_id in stored]
+            if overwritten:
+                await db.execute(self.collection.delete_statement(ids=overwritten))
+
+        await self._write_chunks(added, db=db, progress_callback=progress_callback)
+        await self._write_chunks(rewritten, db=db, vectors=vectors)
+        await self._delete_chunk_ids(removed, db=db)
+        self._sources_changed([source_id], db)
+
+        kept = len(chunks) - len(added)
+        print(
+            f"[VECTOR_SYNC] Source {source_id}: {len(added)} added, {kept} kept "
+            f"({len(rewritten)} rewritten), {len(removed)} removed"
+        )
+        return {
+            "added": len(added),
+            "kept": kept,
+            "removed": len(removed),
+            "first_id": self.chunk_id(source_id, 0) if chunks else None
+        }
+
+    @staticmethod
+    def chunk_id(source_id: str, index: int) -> str:
+        """Stable ID of a source's index-th chunk, so re-indexing overwrites rather than duplicates"""
+        return f"{source_id}:{index}"
+
+    @staticmethod
+    def _document_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of the document metadata with the filterable fields filled in (see _build_where)"""
+        metadata = dict(metadata)
+        metadata.setdefault("created_at", time.time())
+        if "domain" not in metadata and metadata.get("url", "").startswith("http"):
+            metadata["domain"] = urlparse(metadata["url"]).netloc.lower()
+        return metadata
+
+    def _current_embedding(self, chunk_metadata: Dict[str, Any]) -> bool:
+        """Whether a stored chunk's vector came from the configured embedder"""
+        # Chunks stored before versioning were embedded with sentence-transformers
+        return chunk_metadata.get("embedding_version", self.config.EMBEDDING_MODEL) == self.embedding_version
+
+    def _chunk_metadata(self, metadata: Dict[str, Any], chunk: Chunk, index: int, total_chunks: int) -> Dict[str, Any]:
+        chunk_metadata = {
+            **metadata,
+            "chunk_index": index,
+            "total_chunks": total_chunks,
+            "start_char": chunk.start,
+            "end_char": chunk.end,
+            "content_hash": hashlib.sha256(chunk.text.encode("utf-8")).hexdigest(),
+            "embedding_version": self.embedding_version
+        }
+
+        # Extract page number from chunk if it's a PDF
+        if metadata.get("type") == "pdf":
+            page_num = self._extract_page_number(chunk.text)
+            if page_num:
+                chunk_metadata["page_number"] = page_num
+        return chunk_metadata
+
+    def _source_chunk_metadata(self, source_id: str) -> Dict[str, Dict[str, Any]]:
+        results = self.collection.get(where={"source_id": source_id}, include=["metadatas"])
+        return dict(zip(results['ids'], results['metadatas']))
+
+    async def _write_chunks(
+        self,
+        entries: List[Tuple[str, str, Dict[str, Any]]],
+        db: Optional[AsyncSession] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        vectors: Optional[Dict[str, List[float]]] = None
+    ) -> None:
+        """Store (chunk_id, text, metadata) entries, embedding them unless vectors are given
+
+        Chunks are encoded EMBED_BATCH_SIZE at a time and upserted in bulk
+        every VECTOR_WRITE_BATCH_SIZE chunks, so large uploads don't pay
+        per-chunk model and transaction overhead. With a db session and the
+        pgvector backend they are staged in the session instead (see add_document).
+        """
+        total_chunks = len(entries)
+        embed_batch_size = max(1, settings.EMBED_BATCH_SIZE)
+        write_batch_size = max(embed_batch_size, settings.VECTOR_WRITE_BATCH_SIZE)
+        pending = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        # Chunk rows added to db, when writing through the caller's transaction
+        staged = [] if db is not None and self.transactional else None
+        started = time.perf_counter()
+
+        try:
+            for batch_start in range(0, total_chunks, embed_batch_size):
+                batch = entries[batch_start:batch_start + embed_batch_size]
+                if vectors is None:
+                    embeddings = await self._embed_chunks([text for _, text, _ in batch], embed_batch_size)
+                else:
+                    embeddings = [vectors[chunk_id] for chunk_id, _, _ in batch]
+                if self.embedding_dimension is None and embeddings:
+                    await self.io_executor.run(self._record_embedding_space, len(embeddings[0]))
+
+                for (chunk_id, text, chunk_metadata), embedding in zip(batch, embeddings):
+                    pending["ids"].append(chunk_id)
+                    pending["embeddings"].append(embedding)
+                    pending["documents"].append(text)
+                    pending["metadatas"].append(chunk_metadata)
+
+                if len(pending["ids"]) >= write_batch_size:
+                    await self._write_pending(pending, staged, db)
+
+                if vectors is None:
+                    done = batch_start + len(batch)
+                    elapsed = time.perf_counter() - started
+                    rate = done / elapsed if elapsed > 0 else float(done)
+                    print(f"[VECTOR_ADD] Embedded {done}/{total_chunks} chunks ({rate:.1f} chunks/s)")
+                    if progress_callback:
+                        progress_callback(done, total_chunks)
+
+            await self._write_pending(pending, staged, db)
+        except BaseException:
+            # Don't let a later commit on the same session persist a partial document
+            for row in staged or ():
+                db.expunge(row)
+            raise
+
+        if staged:
+            ids = [row.id for row in staged]
+            documents = [row.content for row in staged]
+            self._on_commit(db, lambda: self._index_committed(ids, documents))
 
-        return doc_ids[0] if doc_ids else None
+        if total_chunks:
+            elapsed = time.perf_counter() - started
+            rate = total_chunks / elapsed if elapsed > 0 else float(total_chunks)
+            verb = "Staged" if staged else "Stored"
+            print(f"[VECTOR_ADD] {verb} {total_chunks} chunks in {elapsed:.2f}s ({rate:.1f} chunks/s)")
+
+    def _encode_local(self, texts: List[str], batch_size: int):
+        return self.embedder.encode(texts, batch_size)
+
+    async def _encode(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        """Encode texts on the encode pool"""
+        if self.encode_executor.kind == "process":
+            vectors = await self.encode_executor.run(_encode_in_worker, texts, batch_size)
+        else:
+            vectors = await self.encode_executor.run(self._encode_local, texts, batch_size)
+        return vectors.tolist()
+
+    async def _embed_chunks(self, chunks: List[str], batch_size: int) -> List[List[float]]:
+        """Embed chunks, reusing cached vectors for text we've already seen"""
+        if not self.embedding_cache:
+            return await self._encode(chunks, batch_size)
+
+        embeddings = await self.io_executor.run(self.embedding_cache.get_many, self.embedding_version, chunks)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            missing_chunks = [chunks[i] for i in missing]
+            computed = await self._encode(missing_chunks, batch_size)
+            await self.io_executor.run(
+                self.embedding_cache.put_many, self.embedding_version, missing_chunks, computed
+            )
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+
+        return embeddings
+
+    async def _write_pending(self, pending: Dict[str, List], staged: Optional[List], db: Optional[AsyncSession]) -> None:
+        """Write buffered chunks to the collection, or add them to db when staging"""
+        if staged is None:
+            await self.io_executor.run(self._flush_pending, pending)
+            return
+
+        rows = self.collection.rows(**pending)
+        db.add_all(rows)
+        staged.extend(rows)
+        for values in pending.values():
+            values.clear()
+
+    def _after_commit(self, db: AsyncSession, callback: Callable[[], None]) -> None:
+        """Call callback on the event loop once db's current transaction commits; drop it on rollback"""
+        state = {"active": True}
+
+        def after_commit(session):
+            if state["active"]:
+                state["active"] = False
+                callback()
+
+        def after_rollback(session):
+            state["active"] = False
+
+        event.listen(db.sync_session, "after_commit", after_commit, once=True)
+        event.listen(db.sync_session, "after_rollback", after_rollback, once=True)
+
+    def _on_commit(self, db: AsyncSession, callback: Callable[[], None]) -> None:
+        """Run callback on the io pool once db's current transaction commits; drop it on rollback"""
+        def schedule():
+            task = asyncio.ensure_future(self.io_executor.run(callback))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+        self._after_commit(db, schedule)
+
+    def _sources_changed(self, source_ids: List[str], db: Optional[AsyncSession]) -> None:
+        """Report changed sources to on_sources_changed, once their content is committed"""
+        def notify():
+            if self.on_sources_changed is not None:
+                self.on_sources_changed(source_ids)
+
+        if self.on_sources_changed is None or not source_ids:
+            return
+        if db is None:
+            notify()
+        else:
+            self._after_commit(db, notify)
+
+    def _index_committed(self, ids: List[str], documents: List[str]) -> None:
+        """Catch the lexical index and caches up with chunks committed through a session"""
+        with self._write_lock:
+            if self.lexical_index is not None:
+                self.lexical_index.add(ids, documents)
+                self._save_lexical_index(min_interval=settings.LEXICAL_INDEX_SAVE_INTERVAL_SECONDS)
+            self._bump_kb_version()
+
+    def _unindex_committed(self, ids: List[str]) -> None:
+        """Drop chunks deleted through a session from the lexical index and caches"""
+        with self._write_lock:
+            if self.lexical_index is not None:
+                self.lexical_index.remove_ids(ids)
+                self._save_lexical_index(min_interval=settings.LEXICAL_INDEX_SAVE_INTERVAL_SECONDS)
+            self._bump_kb_version()
+
+    def _flush_pending(self, pending: Dict[str, List]) -> None:
+        """Write buffered chunks in as few upsert() calls as the client allows"""
+        if not pending["ids"]:
+            return
+
+        max_batch = getattr(self.client, "max_batch_size", None) or len(pending["ids"])
+        with self._write_lock:
+            for start in range(0, len(pending["ids"]), max_batch):
+                end = start + max_batch
+                self.collection.upsert(
+                    ids=pending["ids"][start:end],
+                    embeddings=pending["embeddings"][start:end],
+                    documents=pending["documents"][start:end],
+                    metadatas=pending["metadatas"][start:end]
+                )
+            if self.lexical_index is not None:
+                self.lexical_index.add(pending["ids"], pending["documents"])
+                self._save_lexical_index(min_interval=settings.LEXICAL_INDEX_SAVE_INTERVAL_SECONDS)
+            self._bump_kb_version()
+
+        for values in pending.values():
+            values.clear()
     
-    async def search(self, query: str, n_results: int = 5) -> List[Dict]:
-        """Search for relevant documents"""
-        query_embedding = self.embedder.encode(query).tolist()
+    async def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        mode: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        offset: int = 0,
+        diversify: bool = False
+    ) -> List[Dict]:
+        """Search for relevant documents
+
+        Args:
+            query: Natural-language query
+            n_results: Number of results to return
+            mode: "dense" (embeddings), "lexical" (BM25) or "hybrid" (reciprocal
+                rank fusion of both); defaults to settings.SEARCH_MODE
+            filters: Optional metadata filters (source_ids, domain, source_type,
+                content_type, created_after, created_before), applied inside
+                the index via a Chroma where clause
+            offset: Number of leading results to skip, for pagination
+            diversify: Merge adjacent overlapping chunks, cap chunks per source
+                and pick results by maximal marginal relevance (see
+                _diverse_search); not combinable with offset
+
+        Results are cached per (knowledge-base version, query, n_results, mode,
+        filters, offset), so a repeated question skips both the encode and the
+        index queries until the collection changes or the entry expires.
+        """
+        mode = self._resolve_mode(mode)
+        if diversify:
+            if offset:
+                raise ValueError("Diversified search does not support pagination")
+            return await self._diverse_search(query, n_results, mode, filters)
+        where = self._build_where(filters or {})
+
+        cache_key = self._search_cache_key(query, n_results, mode, where, offset)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_results(cached)
+
+        # Rankings have to cover everything up to the requested page
+        window = offset + n_results
+
+        # Resolving the filtered slice up front lets BM25 score only those chunks
+        # and keeps Chroma from being asked for more neighbours than match
+        allowed_ids = None
+        if where is not None:
+            allowed_ids = await self.io_executor.run(self._matching_ids, where)
+            if not allowed_ids:
+                return []
+
+        query_embedding, dense_results = None, None
+        if mode != "lexical":
+            query_embedding = await self._embed_query(query)
+            candidates = self._candidate_count(mode, window, allowed_ids)
+            dense_results = await self.io_executor.run(self._dense_search, query_embedding, candidates, where)
+
+        formatted_results = await self._rank(query, mode, window, allowed_ids, query_embedding, dense_results)
+
+        # Return only the requested page
+        formatted_results = formatted_results[offset:window]
+        self.search_cache.set(cache_key, formatted_results)
+        return self._copy_results(formatted_results)
+
+    async def search_batch(self, requests: List[Dict[str, Any]]) -> Tuple[List[List[Dict]], Dict[str, Any]]:
+        """Run many searches with one embedding pass and one index query per filter set
+
+        Args:
+            requests: Dicts with "query" and optional "n_results", "mode" and
+                "filters", as for search (no pagination or diversification)
+
+        Returns:
+            (results, timing): one result list per request, in request order,
+            and the batch's cache hits plus embed/search/total milliseconds
+        """
+        started = time.perf_counter()
+        plans = []
+        results: List[Optional[List[Dict]]] = [None] * len(requests)
+        for i, request in enumerate(requests):
+            mode = self._resolve_mode(request.get("mode"))
+            where = self._build_where(request.get("filters") or {})
+            n_results = request.get("n_results", 5)
+            cache_key = self._search_cache_key(request["query"], n_results, mode, where, 0)
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                results[i] = self._copy_results(cached)
+            plans.append((request["query"], n_results, mode, where, cache_key))
+        pending = [i for i, result in enumerate(results) if result is None]
+        cache_hits = len(requests) - len(pending)
+
+        # Each distinct filter is resolved once for the whole batch
+        where_keys = {i: json.dumps(plans[i][3], sort_keys=True) for i in pending}
+        allowed: Dict[str, Optional[set]] = {}
+        for i in pending:
+            if where_keys[i] not in allowed:
+                where = plans[i][3]
+                allowed[where_keys[i]] = await self.io_executor.run(self._matching_ids, where) if where else None
+        for i in pending:
+            if allowed[where_keys[i]] is not None and not allowed[where_keys[i]]:
+                results[i] = []
+        pending = [i for i in pending if results[i] is None]
+
+        # One encode call covers every query that needs a dense ranking
+        dense = [i for i in pending if plans[i][2] != "lexical"]
+        embed_started = time.perf_counter()
+        embeddings = await self._embed_queries(list(dict.fromkeys(plans[i][0] for i in dense)))
+        embed_ms = (time.perf_counter() - embed_started) * 1000
+
+        # One collection query (with many query_embeddings) per filter set
+        search_started = time.perf_counter()
+        groups: Dict[str, List[int]] = {}
+        for i in dense:
+            groups.setdefault(where_keys[i], []).append(i)
+        dense_results: Dict[int, List[Dict]] = {}
+        candidates = {
+            i: self._candidate_count(plans[i][2], plans[i][1], allowed[where_keys[i]]) for i in dense
+        }
+        for where_key, members in groups.items():
+            rankings = await self.io_executor.run(
+                self._dense_search_many,
+                [embeddings[plans[i][0]] for i in members],
+                max(candidates[i] for i in members),
+                plans[members[0]][3]
+            )
+            for i, ranking in zip(members, rankings):
+                dense_results[i] = ranking[:candidates[i]]
+
+        ranked = await asyncio.gather(*(
+            self._rank(
+                plans[i][0], plans[i][2], plans[i][1], allowed[where_keys[i]],
+                embeddings.get(plans[i][0]), dense_results.get(i)
+            )
+            for i in pending
+        ))
+        for i, ranking in zip(pending, ranked):
+            ranking = ranking[:plans[i][1]]
+            self.search_cache.set(plans[i][4], ranking)
+            results[i] = self._copy_results(ranking)
+        search_ms = (time.perf_counter() - search_started) * 1000
+
+        timing = {
+            "queries": len(requests),
+            "cache_hits": cache_hits,
+            "embed_ms": round(embed_ms, 2),
+            "search_ms": round(search_ms, 2),
+            "total_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        print(
+            f"[SEARCH_BATCH] {timing['queries']} queries ({cache_hits} cached, {len(groups)} index queries) "
+            f"in {timing['total_ms']:.1f}ms (embed {timing['embed_ms']:.1f}ms, search {timing['search_ms']:.1f}ms)"
+        )
+        return results, timing
+
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = mode or settings.SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode: {mode}")
+        if self.lexical_index is None:
+            return "dense"
+        return mode
+
+    def _search_cache_key(
+        self,
+        query: str,
+        n_results: int,
+        mode: str,
+        where: Optional[Dict[str, Any]],
+        offset: int
+    ) -> tuple:
+        return (self.kb_version, query, n_results, mode, json.dumps(where, sort_keys=True), offset)
+
+    @staticmethod
+    def _candidate_count(mode: str, window: int, allowed_ids: Optional[set]) -> int:
+        """Dense neighbours to fetch for a ranking that must cover window results"""
+        # Hybrid fetches extra candidates from each ranking so fusion has something to work with
+        candidates = window * 2 if mode == "hybrid" else window
+        if allowed_ids is not None:
+            candidates = min(candidates, len(allowed_ids))
+        return candidates
+
+    async def _rank(
+        self,
+        query: str,
+        mode: str,
+        window: int,
+        allowed_ids: Optional[set],
+        query_embedding: Optional[List[float]],
+        dense_results: Optional[List[Dict]]
+    ) -> List[Dict]:
+        """Final ranking for one query: BM25 hits, the dense results, or their fusion"""
+        if mode == "lexical":
+            hits = await self.io_executor.run(self._lexical_search, query, window, allowed_ids)
+            chunks = await self.io_executor.run(self._fetch_chunks, [chunk_id for chunk_id, _ in hits], None)
+            return [
+                {**chunks[chunk_id], "score": score}
+                for chunk_id, score in hits
+                if chunk_id in chunks
+            ]
+
+        if mode == "dense":
+            return dense_results
+
+        candidates = self._candidate_count(mode, window, allowed_ids)
+        lexical_hits = await self.io_executor.run(self._lexical_search, query, candidates, allowed_ids)
+        fused = reciprocal_rank_fusion([
+            [result["id"] for result in dense_results],
+            [chunk_id for chunk_id, _ in lexical_hits]
+        ])[:window]
+
+        by_id = {result["id"]: result for result in dense_results}
+        lexical_only = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+        if lexical_only:
+            by_id.update(await self.io_executor.run(self._fetch_chunks, lexical_only, query_embedding))
+
+        return [
+            {**by_id[chunk_id], "score": score}
+            for chunk_id, score in fused
+            if chunk_id in by_id
+        ]
+
+    async def _diverse_search(
+        self,
+        query: str,
+        n_results: int,
+        mode: str,
+        filters: Optional[Dict[str, Any]]
+    ) -> List[Dict]:
+        """Over-fetch candidates, merge adjacent chunks, then select by MMR with a per-source cap"""
+        cache_key = ("diverse", self.kb_version, query, n_results, mode, json.dumps(filters or {}, sort_keys=True))
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_results(cached)
+
+        pool_size = n_results * max(1, settings.DIVERSIFY_FETCH_MULTIPLIER)
+        candidates = await self.search(query, n_results=pool_size, mode=mode, filters=filters)
+        if not candidates:
+            return []
+
+        query_embedding = await self._embed_query(query)
+        vectors = await self.io_executor.run(self._fetch_embeddings, [c["id"] for c in candidates])
+        candidates = [c for c in candidates if c["id"] in vectors]
+        merged, merged_vectors = merge_adjacent_chunks(candidates, [vectors[c["id"]] for c in candidates])
 
-        # Get more results to see all available documents
+        diversified = mmr_select(
+            np.asarray(query_embedding, dtype=np.float32),
+            merged,
+            merged_vectors,
+            n_results,
+            lambda_mult=settings.MMR_LAMBDA,
+            max_per_source=settings.MAX_CHUNKS_PER_SOURCE
+        )
+        self.search_cache.set(cache_key, diversified)
+        return self._copy_results(diversified)
+
+    def _fetch_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        results = self.collection.get(ids=ids, include=["embeddings"])
+        return {
+            chunk_id: np.asarray(results['embeddings'][i], dtype=np.float32)
+            for i, chunk_id in enumerate(results['ids'])
+        }
+
+    @staticmethod
+    def _build_where(filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Translate search filters into a Chroma where clause"""
+        clauses = []
+        source_ids = filters.get("source_ids")
+        if source_ids:
+            clauses.append({"source_id": {"$in": list(source_ids)}})
+        for key in ("domain", "source_type", "content_type"):
+            if filters.get(key):
+                clauses.append({key: filters[key]})
+        if filters.get("created_after") is not None:
+            clauses.append({"created_at": {"$gte": float(filters["created_after"])}})
+        if filters.get("created_before") is not None:
+            clauses.append({"created_at": {"$lte": float(filters["created_before"])}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def _matching_ids(self, where: Dict[str, Any]) -> set:
+        return set(self.collection.get(where=where, include=[])['ids'])
+
+    def _dense_search(self, query_embedding: List[float], n_results: int, where: Optional[Dict[str, Any]]) -> List[Dict]:
+        return self._dense_search_many([query_embedding], n_results, where)[0]
+
+    def _dense_search_many(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[Dict[str, Any]]
+    ) -> List[List[Dict]]:
+        """Nearest neighbours for several query vectors in a single collection query"""
+        if not query_embeddings:
+            return []
         results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=min(n_results * 2, 20)  # Get more to debug
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where
         )
 
-        formatted_results = []
-        if results['documents']:
-            for i in range(len(results['documents'][0])):
-                formatted_results.append({
-                    "content": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i],
-                    "distance": results['distances'][0][i] if results['distances'] else None
-                })
+        rankings = []
+        for q in range(len(query_embeddings)):
+            formatted_results = []
+            if results['documents']:
+                for i in range(len(results['documents'][q])):
+                    formatted_results.append({
+                        "id": results['ids'][q][i],
+                        "content": results['documents'][q][i],
+                        "metadata": results['metadatas'][q][i],
+                        "distance": results['distances'][q][i] if results['distances'] else None
+                    })
+            rankings.append(formatted_results)
+        return rankings
+
+    def _fetch_chunks(self, ids: List[str], query_embedding: Optional[List[float]]) -> Dict[str, Dict]:
+        """Load chunks by ID; with a query embedding, also compute their cosine distance"""
+        if not ids:
+            return {}
+
+        include = ["documents", "metadatas"]
+        if query_embedding is not None:
+            include.append("embeddings")
+        results = self.collection.get(ids=ids, include=include)
 
-        # Return only the requested number
-        return formatted_results[:n_results]
+        query_vector = None
+        if query_embedding is not None:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            query_vector /= np.linalg.norm(query_vector) or 1.0
+
+        chunks = {}
+        for i, chunk_id in enumerate(results['ids']):
+            distance = None
+            if query_vector is not None:
+                vector = np.asarray(results['embeddings'][i], dtype=np.float32)
+                distance = float(1.0 - vector @ query_vector / (np.linalg.norm(vector) or 1.0))
+            chunks[chunk_id] = {
+                "id": chunk_id,
+                "content": results['documents'][i],
+                "metadata": results['metadatas'][i],
+                "distance": distance
+            }
+        return chunks
 
-    async def delete_by_source_id(self, source_id: str) -> int:
+    async def query_embedding(self, query: str) -> List[float]:
+        """Embedding of a search query, from query_embedding_cache when the query was just searched"""
+        return await self._embed_query(query)
+
+    async def _embed_query(self, query: str) -> List[float]:
+        embedding = self.query_embedding_cache.get(query)
+        if embedding is None:
+            if self.query_batcher:
+                embedding = await self.query_batcher.encode(query)
+            else:
+                embedding = (await self._encode([query], 1))[0]
+            self.query_embedding_cache.set(query, embedding)
+        return embedding
+
+    async def _embed_queries(self, queries: List[str]) -> Dict[str, List[float]]:
+        """Embeddings for distinct queries, encoding all cache misses in one call"""
+        embeddings = {}
+        missing = []
+        for query in queries:
+            embedding = self.query_embedding_cache.get(query)
+            if embedding is None:
+                missing.append(query)
+            else:
+                embeddings[query] = embedding
+        if missing:
+            encoded = await self._encode(missing, max(1, settings.EMBED_BATCH_SIZE))
+            for query, embedding in zip(missing, encoded):
+                self.query_embedding_cache.set(query, embedding)
+                embeddings[query] = embedding
+        return embeddings
+
+    @staticmethod
+    def _copy_results(results: List[Dict]) -> List[Dict]:
+        """Shallow-copy results so callers can't mutate cached entries"""
+        return [{**result, "metadata": dict(result["metadata"])} for result in results]
+
+    async def delete_by_source_id(self, source_id: str, db: Optional[AsyncSession] = None) -> int:
         """Delete all vectors associated with a source_id
 
         Args:
             source_id: The UUID of the source to delete vectors for
+            db: Optional session; with the pgvector backend the delete runs in
+                its transaction, so it only takes effect if the caller commits
 
         Returns:
             Number of vectors deleted
         """
-        try:
-            # Query all documents with this source_id in metadata
-            results = self.collection.get(
-                where={"source_id": source_id}
-            )
+        return await self.delete_by_source_ids([source_id], db=db)
 
-            if results and results['ids']:
-                vector_count = len(results['ids'])
-                print(f"[VECTOR_DELETE] Found {vector_count} vectors for source {source_id}")
+    async def delete_by_source_ids(self, source_ids: List[str], db: Optional[AsyncSession] = None) -> int:
+        """Delete the vectors of many sources, SOURCE_DELETE_BATCH_SIZE sources per index round trip
 
-                # Delete all matching documents
-                self.collection.delete(ids=results['ids'])
-                print(f"[VECTOR_DELETE] Successfully deleted {vector_count} vectors")
+        Only chunk IDs are read back (for the lexical index), never documents
+        or embeddings. Accepts db like delete_by_source_id.
 
-                return vector_count
+        Returns:
+            Number of vectors deleted
+        """
+        batch_size = max(1, settings.SOURCE_DELETE_BATCH_SIZE)
+        deleted = 0
+        for start in range(0, len(source_ids), batch_size):
+            batch = list(source_ids[start:start + batch_size])
+            where = {"source_id": batch[0]} if len(batch) == 1 else {"source_id": {"$in": batch}}
+            label = f"source {batch[0]}" if len(batch) == 1 else f"{len(batch)} sources"
+            try:
+                if db is not None and self.transactional:
+                    result = await db.execute(self.collection.delete_statement(where=where))
+                    ids = list(result.scalars())
+                    print(f"[VECTOR_DELETE] Deleting {len(ids)} vectors for {label} on commit")
+                    if ids:
+                        self._on_commit(db, lambda ids=ids: self._unindex_committed(ids))
+                    deleted += len(ids)
+                else:
+                    deleted += await self.io_executor.run(self._delete_source_vectors, where, label)
+            except Exception as e:
+                print(f"[VECTOR_DELETE] Error deleting vectors for {label}: {e}")
+                raise
+        self._sources_changed(list(source_ids), db)
+        return deleted
 
-            print(f"[VECTOR_DELETE] No vectors found for source {source_id}")
-            return 0
+    async def _delete_chunk_ids(self, ids: List[str], db: Optional[AsyncSession] = None) -> None:
+        """Delete chunks by ID, in db's transaction when the backend supports it"""
+        if not ids:
+            return
+        if db is not None and self.transactional:
+            await db.execute(self.collection.delete_statement(ids=ids))
+            self._on_commit(db, lambda: self._unindex_committed(ids))
+        else:
+            await self.io_executor.run(self._delete_ids, ids)
+
+    def _delete_ids(self, ids: List[str]) -> None:
+        """Delete chunks in as few delete() calls as the client allows"""
+        max_batch = getattr(self.client, "max_batch_size", None) or max(1, settings.VECTOR_WRITE_BATCH_SIZE)
+        with self._write_lock:
+            for start in range(0, len(ids), max_batch):
+                self.collection.delete(ids=ids[start:start + max_batch])
+            if self.lexical_index is not None:
+                self.lexical_index.remove_ids(ids)
+                self._save_lexical_index(min_interval=settings.LEXICAL_INDEX_SAVE_INTERVAL_SECONDS)
+            self._bump_kb_version()
+
+    def _delete_source_vectors(self, where: Dict[str, Any], label: str) -> int:
+        # IDs only: documents and embeddings stay in the index
+        ids = self.collection.get(where=where, include=[])['ids']
+
+        if ids:
+            print(f"[VECTOR_DELETE] Found {len(ids)} vectors for {label}")
+            self._delete_ids(ids)
+            print(f"[VECTOR_DELETE] Successfully deleted {len(ids)} vectors")
+            return len(ids)
+
+        print(f"[VECTOR_DELETE] No vectors found for {label}")
+        return 0
 
-        except Exception as e:
-            print(f"[VECTOR_DELETE] Error deleting vectors for source {source_id}: {e}")
-            raise
-    
     def _extract_page_number(self, chunk: str) -> Optional[int]:
         """Extract page number from chunk text that contains [PAGE X] marker"""
         match = re.search(r'\[PAGE (\d+)\]', chunk)
@@ -107,28 +1240,8 @@ class VectorStore:
             return int(match.group(1))
         return None
 
-    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        """Split text into overlapping chunks"""
-        if len(text) <= chunk_size:
-            return [text]
-
-        chunks = []
-        start = 0
-
-        while start < len(text):
-            end = start + chunk_size
-
-            # Try to break at sentence boundaries
-            if end < len(text):
-                # Look for sentence endings
-                sentence_end = text.rfind('.', start, end)
-                if sentence_end != -1 and sentence_end > start + chunk_size // 2:
-                    end = sentence_end + 1
-
-            chunks.append(text[start:end].strip())
-            start = end - overlap
-
-            if start >= len(text):
-                break
-
-        return chunks
\ No newline at end of file
+    def _chunk_text(self, text: str) -> List[Chunk]:
+        """Split text into overlapping chunks with character offsets"""
+        if self.chunker is None:
+            return chunk_by_characters(text)
+        return self.chunker.chunk(text)
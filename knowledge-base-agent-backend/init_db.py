@@ -1,10 +1,16 @@
 import asyncio
+from sqlalchemy import text
+from app.core.config import settings
 from app.core.database import async_engine
 from app.models.source import Base
 from app.models import chat  # Import chat models to register them
+from app.models import digest  # Source digests and the knowledge-base overview
 
 async def init_db():
     async with async_engine.begin() as conn:
+        if settings.VECTOR_DB_TYPE == "pgvector":
+            from app.models import chunk  # Chunk vectors live in PostgreSQL
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
     print("Database tables created successfully!")
 
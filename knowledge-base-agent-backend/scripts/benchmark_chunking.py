@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Compare the legacy 1000/200 character chunker with the token-aware chunker.
+
+For each chunker this reports the number of chunks, the time to embed them
+and the truncation rate, i.e. the share of chunks longer than the model's
+max_seq_length (the tail of those chunks is silently dropped at encode time).
+
+Usage:
+    python scripts/benchmark_chunking.py path/to/document.txt [more files...]
+    python scripts/benchmark_chunking.py --source-limit 20   # use completed sources from PostgreSQL
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.services.chunker import TokenChunker, chunk_by_characters, load_tokenizer
+
+
+async def load_sources(limit: int):
+    """Load document content from completed knowledge sources"""
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from app.models.source import KnowledgeSource
+
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with async_session() as session:
+        result = await session.execute(
+            select(KnowledgeSource.content)
+            .where(KnowledgeSource.status == "completed")
+            .limit(limit)
+        )
+        texts = [row[0] for row in result.all() if row[0]]
+    await engine.dispose()
+    return texts
+
+
+def measure(name, chunks, counter, model, model_max):
+    texts = [chunk.text for chunk in chunks]
+    token_counts = counter.count_tokens(texts) if texts else []
+    # +2 for the [CLS]/[SEP] tokens the model adds
+    truncated = [count for count in token_counts if count + 2 > model_max]
+    lost_tokens = sum(count + 2 - model_max for count in truncated)
+
+    started = time.perf_counter()
+    model.encode(texts, batch_size=settings.EMBED_BATCH_SIZE, show_progress_bar=False)
+    embed_seconds = time.perf_counter() - started
+
+    total_tokens = sum(token_counts)
+    print(f"\n{name}")
+    print(f"  Chunks:            {len(chunks)}")
+    print(f"  Avg tokens/chunk:  {total_tokens / len(chunks) if chunks else 0:.1f}")
+    print(f"  Embedding time:    {embed_seconds:.2f}s ({len(chunks) / embed_seconds if embed_seconds else 0:.1f} chunks/s)")
+    print(f"  Truncated chunks:  {len(truncated)} ({100 * len(truncated) / len(chunks) if chunks else 0:.1f}%)")
+    print(f"  Tokens discarded:  {lost_tokens} ({100 * lost_tokens / total_tokens if total_tokens else 0:.1f}% of input)")
+
+
+def run_benchmark(texts):
+    print("=" * 60)
+    print("Chunker Benchmark")
+    print("=" * 60)
+
+    model = SentenceTransformer(settings.EMBEDDING_MODEL)
+    model_max = model.max_seq_length
+    tokenizer = load_tokenizer(settings.EMBEDDING_MODEL)
+    token_chunker = TokenChunker(
+        tokenizer,
+        max_tokens=min(settings.CHUNK_MAX_TOKENS, model_max) - 2,
+        overlap_tokens=settings.CHUNK_OVERLAP_TOKENS
+    )
+
+    print(f"✓ Model: {settings.EMBEDDING_MODEL} (max_seq_length={model_max})")
+    print(f"✓ Documents: {len(texts)}, {sum(len(t) for t in texts)} characters")
+
+    started = time.perf_counter()
+    char_chunks = [chunk for text in texts for chunk in chunk_by_characters(text)]
+    char_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    token_chunks = [chunk for text in texts for chunk in token_chunker.chunk(text)]
+    token_seconds = time.perf_counter() - started
+
+    print(f"✓ Chunking time: characters {char_seconds:.2f}s, tokens {token_seconds:.2f}s")
+
+    measure("Character chunker (1000 chars / 200 overlap)", char_chunks, token_chunker, model, model_max)
+    measure(
+        f"Token chunker ({token_chunker.max_tokens} tokens / {token_chunker.overlap_tokens} overlap)",
+        token_chunks, token_chunker, model, model_max
+    )
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chunker comparison benchmark")
+    parser.add_argument("files", nargs="*", help="Text files to chunk")
+    parser.add_argument("--source-limit", type=int, default=0, help="Also load N completed sources from PostgreSQL")
+
+    args = parser.parse_args()
+
+    texts = []
+    for path in args.files:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            texts.append(f.read())
+    if args.source_limit:
+        texts.extend(asyncio.run(load_sources(args.source_limit)))
+
+    if not texts:
+        parser.print_usage()
+        sys.exit(1)
+
+    run_benchmark(texts)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Compare encode throughput and retrieval quality of the embedder backends.
+
+Runs the PyTorch model (sentence-transformers) and its ONNX export in
+float32 and int8 over the same texts and reports, against PyTorch:
+  - throughput in sentences/s,
+  - cosine similarity of each text's vector to its PyTorch vector,
+  - recall@k, the overlap of each text's k nearest neighbours with the
+    neighbours found using PyTorch vectors.
+
+Export the model first with scripts/export_onnx_embedder.py.
+
+Usage:
+    python scripts/benchmark_embedders.py path/to/document.txt [more files...]
+    python scripts/benchmark_embedders.py --source-limit 50 --threads 4
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedders import OnnxEmbedder, SentenceTransformerEmbedder
+
+
+async def load_sources(limit: int):
+    """Load document content from completed knowledge sources"""
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from app.models.source import KnowledgeSource
+
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with async_session() as session:
+        result = await session.execute(
+            select(KnowledgeSource.content)
+            .where(KnowledgeSource.status == "completed")
+            .limit(limit)
+        )
+        texts = [row[0] for row in result.all() if row[0]]
+    await engine.dispose()
+    return texts
+
+
+def split_passages(texts, max_chars: int):
+    """Paragraph-sized passages, roughly the size of indexed chunks"""
+    passages = []
+    for text in texts:
+        for paragraph in text.split("\n\n"):
+            paragraph = paragraph.strip()
+            while paragraph:
+                passages.append(paragraph[:max_chars])
+                paragraph = paragraph[max_chars:]
+    return passages
+
+
+def encode(embedder, passages, batch_size: int):
+    # Warm up so one-off allocations are not timed
+    embedder.encode(passages[:batch_size], batch_size)
+    started = time.perf_counter()
+    vectors = np.asarray(embedder.encode(passages, batch_size), dtype=np.float32)
+    seconds = time.perf_counter() - started
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    return vectors, seconds
+
+
+def neighbours(vectors, k: int):
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argpartition(-scores, k, axis=1)[:, :k]
+
+
+def run_benchmark(passages, batch_size: int, threads: int, k: int):
+    print("=" * 60)
+    print("Embedder Benchmark")
+    print("=" * 60)
+    print(f"✓ Model: {settings.EMBEDDING_MODEL}, passages: {len(passages)}, batch size: {batch_size}")
+    print(f"✓ ONNX model path: {settings.ONNX_MODEL_PATH}, intra-op threads: {threads or 'default'}\n")
+
+    embedders = [("torch", SentenceTransformerEmbedder(settings.EMBEDDING_MODEL))]
+    for name, quantized in (("onnx-fp32", False), ("onnx-int8", True)):
+        embedders.append((name, OnnxEmbedder(settings.ONNX_MODEL_PATH, quantized=quantized, intra_op_threads=threads)))
+
+    k = min(k, len(passages) - 1)
+    reference, reference_neighbours = None, None
+    print(f"{'backend':<12}{'sent/s':>10}{'speedup':>9}{'cos mean':>10}{'cos min':>9}{f'recall@{k}':>11}")
+    for name, embedder in embedders:
+        vectors, seconds = encode(embedder, passages, batch_size)
+        rate = len(passages) / seconds if seconds else 0.0
+        if reference is None:
+            reference, reference_neighbours, reference_rate = vectors, neighbours(vectors, k), rate
+
+        cosine = (vectors * reference).sum(axis=1)
+        found = neighbours(vectors, k)
+        recall = np.mean([
+            len(set(found[i]) & set(reference_neighbours[i])) / k
+            for i in range(len(passages))
+        ])
+        print(
+            f"{name:<12}{rate:>10.1f}{rate / reference_rate:>8.2f}x"
+            f"{cosine.mean():>10.5f}{cosine.min():>9.5f}{recall:>11.3f}"
+        )
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Embedder backend benchmark")
+    parser.add_argument("files", nargs="*", help="Text files to embed")
+    parser.add_argument("--source-limit", type=int, default=0, help="Also load N completed sources from PostgreSQL")
+    parser.add_argument("--max-chars", type=int, default=1000, help="Passage length")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBED_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=settings.ONNX_INTRA_OP_THREADS)
+    parser.add_argument("--k", type=int, default=10)
+
+    args = parser.parse_args()
+
+    texts = []
+    for path in args.files:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            texts.append(f.read())
+    if args.source_limit:
+        texts.extend(asyncio.run(load_sources(args.source_limit)))
+
+    passages = split_passages(texts, args.max_chars)
+    if len(passages) < 2:
+        parser.print_usage()
+        sys.exit(1)
+
+    run_benchmark(passages, args.batch_size, args.threads, args.k)
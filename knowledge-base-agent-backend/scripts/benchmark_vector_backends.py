@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Compare query latency, build time and memory of the vector backends.
+
+Each (backend, size) pair runs in a fresh subprocess over synthetic
+normalised vectors, so startup cost and resident memory are measured in
+isolation. Indexes are written to a temporary directory and removed
+afterwards.
+
+The pgvector backend writes to the knowledge_chunks table in DATABASE_URL
+(run init_db.py with VECTOR_DB_TYPE=pgvector first). It attaches the
+synthetic chunks to placeholder "benchmark://" sources and deletes those
+sources, and with them the chunks, when done. Its RSS column only covers
+the client; the index lives in the PostgreSQL server.
+
+Usage:
+    python scripts/benchmark_vector_backends.py
+    python scripts/benchmark_vector_backends.py --sizes 10000 100000 1000000 --backends chromadb numpy numpy-int8
+    python scripts/benchmark_vector_backends.py --sizes 10000 100000 --backends chromadb pgvector
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+DIM = 384  # all-MiniLM-L6-v2
+ADD_BATCH = 5000
+SOURCES = 100
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (Linux), falling back to peak RSS elsewhere"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def open_backend(backend: str, path: str):
+    if backend == "chromadb":
+        import chromadb
+        client = chromadb.PersistentClient(path=path)
+        return client.get_or_create_collection(name="benchmark", metadata={"hnsw:space": "cosine"})
+
+    if backend == "pgvector":
+        from app.core.config import settings
+        from app.services.pgvector_index import PgVectorCollection
+        return PgVectorCollection(settings.DATABASE_URL)
+
+    from app.services.numpy_index import NumpyCollection
+    return NumpyCollection(path, dtype="int8" if backend == "numpy-int8" else "float16")
+
+
+def reset_benchmark_sources(collection, create: bool) -> None:
+    """Delete the placeholder sources (cascading to their chunks) and optionally recreate them"""
+    from sqlalchemy import text
+    with collection.engine.begin() as conn:
+        conn.execute(text("DELETE FROM knowledge_sources WHERE url LIKE 'benchmark://%'"))
+        if create:
+            conn.execute(
+                text("INSERT INTO knowledge_sources (id, url, title, status) VALUES (:id, :url, :title, 'completed')"),
+                [
+                    {"id": f"source-{i}", "url": f"benchmark://source-{i}", "title": f"Benchmark source {i}"}
+                    for i in range(SOURCES)
+                ]
+            )
+
+
+def run_worker(backend: str, size: int, queries: int, n_results: int) -> dict:
+    rng = np.random.default_rng(42)
+    path = tempfile.mkdtemp(prefix=f"kba-bench-{backend}-")
+
+    # Build
+    collection = open_backend(backend, path)
+    if backend == "pgvector":
+        reset_benchmark_sources(collection, create=True)
+    started = time.perf_counter()
+    for start in range(0, size, ADD_BATCH):
+        count = min(ADD_BATCH, size - start)
+        vectors = rng.standard_normal((count, DIM), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        collection.add(
+            ids=[f"chunk-{start + i}" for i in range(count)],
+            embeddings=vectors.tolist(),
+            documents=[f"document {start + i}" for i in range(count)],
+            metadatas=[{"source_id": f"source-{(start + i) % SOURCES}"} for i in range(count)]
+        )
+    build_seconds = time.perf_counter() - started
+    if hasattr(collection, "close"):
+        collection.close()
+    del collection
+
+    # Reopen to measure cold start, then query
+    baseline_rss = rss_mb()
+    started = time.perf_counter()
+    collection = open_backend(backend, path)
+    open_seconds = time.perf_counter() - started
+
+    query_vectors = rng.standard_normal((queries, DIM), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    # First query pays for loading the index
+    started = time.perf_counter()
+    collection.query(query_embeddings=[query_vectors[0].tolist()], n_results=n_results)
+    first_query_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    for vector in query_vectors:
+        started = time.perf_counter()
+        collection.query(query_embeddings=[vector.tolist()], n_results=n_results)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    result = {
+        "backend": backend,
+        "size": size,
+        "build_s": build_seconds,
+        "open_s": open_seconds,
+        "first_query_ms": first_query_ms,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "rss_mb": rss_mb(),
+        "rss_delta_mb": rss_mb() - baseline_rss
+    }
+
+    if backend == "pgvector":
+        reset_benchmark_sources(collection, create=False)
+    if hasattr(collection, "close"):
+        collection.close()
+    import shutil
+    shutil.rmtree(path, ignore_errors=True)
+    return result
+
+
+def run_benchmark(backends, sizes, queries, n_results):
+    print("=" * 60)
+    print("Vector Backend Benchmark")
+    print("=" * 60)
+    print(f"✓ Dimension: {DIM}, queries per run: {queries}, n_results: {n_results}\n")
+    print(f"{'backend':<12}{'chunks':>10}{'build s':>10}{'open s':>9}{'1st ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'RSS MB':>9}")
+
+    for size in sizes:
+        for backend in backends:
+            completed = subprocess.run(
+                [sys.executable, __file__, "--worker", backend, str(size), str(queries), str(n_results)],
+                capture_output=True,
+                text=True
+            )
+            if completed.returncode != 0:
+                print(f"{backend:<12}{size:>10}  ✗ failed: {completed.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(
+                f"{r['backend']:<12}{r['size']:>10}{r['build_s']:>10.1f}{r['open_s']:>9.2f}"
+                f"{r['first_query_ms']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['rss_mb']:>9.0f}"
+            )
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vector backend benchmark")
+    parser.add_argument("--backends", nargs="+", default=["chromadb", "numpy", "numpy-int8"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--worker", nargs=4, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, size, queries, n_results = args.worker
+        print(json.dumps(run_worker(backend, int(size), int(queries), int(n_results))))
+    else:
+        run_benchmark(args.backends, args.sizes, args.queries, args.n_results)
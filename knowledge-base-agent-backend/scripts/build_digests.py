@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Build source digests and the knowledge-base overview.
+
+The API digests sources as they are added or edited and keeps the overview
+up to date (see app/services/digests.py). Run this to digest an existing
+knowledge base ahead of time, or with --force after changing DIGEST_METHOD
+or the chat model. Sources whose content is unchanged are skipped, and
+overview groups whose digests are unchanged are reused.
+
+Usage:
+    python scripts/build_digests.py
+    python scripts/build_digests.py --force --method extractive
+"""
+
+import argparse
+import asyncio
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.services.digests import DigestService
+from app.services.index_registry import completed_source_ids
+from app.services.llm import OllamaLLM
+
+
+async def build_digests(force: bool, overview: bool):
+    print("=" * 60)
+    print("Source Digests")
+    print("=" * 60)
+
+    source_ids = await completed_source_ids()
+    print(f"✓ Found {len(source_ids)} completed sources in PostgreSQL")
+    print(f"  Method: {settings.DIGEST_METHOD}{' (forced)' if force else ''}\n")
+
+    llm = OllamaLLM()
+    digests = DigestService(llm)
+    try:
+        totals = await digests.digest_sources(source_ids, force=force)
+        result = await digests.refresh_overview() if overview else None
+    finally:
+        await llm.close()
+        await async_engine.dispose()
+
+    stats = digests.stats()
+    print("\n" + "=" * 60)
+    print("Digest Summary")
+    print("=" * 60)
+    print(f"✓ Sources digested: {totals['digested']} ({stats['llm_fallbacks']} fell back to extractive)")
+    print(f"⊘ Sources unchanged: {totals['unchanged']}")
+    print(f"✗ Digests removed: {totals['removed']}")
+    if result is not None:
+        print(f"📊 Overview groups summarized: {stats['groups_summarized']}, reused: {stats['groups_reused']}")
+        print(f"\n{result['summary'] or '(empty knowledge base)'}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build source digests and the knowledge-base overview")
+    parser.add_argument("--force", action="store_true", help="re-digest sources whose content is unchanged")
+    parser.add_argument("--method", choices=["llm", "extractive"], help="override DIGEST_METHOD")
+    parser.add_argument("--no-overview", action="store_true", help="only digest sources")
+    args = parser.parse_args()
+    if args.method:
+        settings.DIGEST_METHOD = args.method
+    asyncio.run(build_digests(args.force, not args.no_overview))
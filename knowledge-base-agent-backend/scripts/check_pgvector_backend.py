@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Check the pgvector backend's guarantees against the PostgreSQL in DATABASE_URL.
+
+  1. A source and its chunks commit together, and roll back together when
+     the transaction fails after the chunks were added.
+  2. Deleting a source removes its chunks (ON DELETE CASCADE).
+  3. Filtered searches return exactly n_results, the true nearest matches,
+     even when the filter matches a small fraction of the collection, where
+     an HNSW scan would come back short.
+
+Run init_db.py with VECTOR_DB_TYPE=pgvector first. The checks use their own
+collection and placeholder "pgvector-check://" sources, and remove both
+when done, so the knowledge base is left as it was. Vectors are random, so
+no embedding model is needed. Exits with status 1 if any check fails.
+
+Usage:
+    python scripts/check_pgvector_backend.py
+    python scripts/check_pgvector_backend.py --chunks 20000 --n-results 20
+"""
+
+import argparse
+import asyncio
+import sys
+import os
+import uuid
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.source import KnowledgeSource
+from app.services.pgvector_index import PgVectorCollection
+
+COLLECTION = "pgvector_check"
+URL_PREFIX = "pgvector-check://"
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, ok: bool, description: str, detail: str = "") -> None:
+        if ok:
+            print(f"✓ {description}")
+        else:
+            self.failed += 1
+            print(f"✗ {description}{f': {detail}' if detail else ''}")
+
+
+def random_vectors(rng: np.random.Generator, count: int, dim: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def chunk_rows(collection: PgVectorCollection, source_id: str, vectors: np.ndarray, source_type: str):
+    count = len(vectors)
+    return collection.rows(
+        ids=[f"{source_id}:{i}" for i in range(count)],
+        embeddings=vectors.tolist(),
+        documents=[f"Chunk {i} of {source_id}" for i in range(count)],
+        metadatas=[
+            {"source_id": source_id, "source_type": source_type, "chunk_index": i}
+            for i in range(count)
+        ]
+    )
+
+
+def new_source(label: str) -> KnowledgeSource:
+    return KnowledgeSource(
+        id=str(uuid.uuid4()),
+        url=f"{URL_PREFIX}{label}/{uuid.uuid4()}",
+        title=f"pgvector check: {label}",
+        status="completed"
+    )
+
+
+async def chunk_count(collection: PgVectorCollection, source_id: str) -> int:
+    result = await asyncio.to_thread(collection.get, where={"source_id": source_id}, include=())
+    return len(result["ids"])
+
+
+async def source_exists(source_id: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(KnowledgeSource.id).where(KnowledgeSource.id == source_id))
+        return result.scalar_one_or_none() is not None
+
+
+async def check_transactions(checks: Checks, collection: PgVectorCollection, rng: np.random.Generator, dim: int):
+    print("\nTransactions")
+    committed = new_source("committed")
+    async with AsyncSessionLocal() as db:
+        db.add(committed)
+        await db.flush()
+        db.add_all(chunk_rows(collection, committed.id, random_vectors(rng, 5, dim), "web_scrape"))
+        await db.commit()
+    checks.expect(
+        await source_exists(committed.id) and await chunk_count(collection, committed.id) == 5,
+        "Committed source is stored with its 5 chunks"
+    )
+
+    rolled_back = new_source("rolled-back")
+    async with AsyncSessionLocal() as db:
+        try:
+            db.add(rolled_back)
+            await db.flush()
+            db.add_all(chunk_rows(collection, rolled_back.id, random_vectors(rng, 5, dim), "web_scrape"))
+            await db.flush()
+            raise RuntimeError("simulated failure after the chunks were written")
+        except RuntimeError:
+            await db.rollback()
+    exists = await source_exists(rolled_back.id)
+    chunks = await chunk_count(collection, rolled_back.id)
+    checks.expect(
+        not exists and chunks == 0,
+        "Rolled-back source leaves neither the source nor its chunks",
+        f"source stored: {exists}, chunks stored: {chunks}"
+    )
+    return committed.id
+
+
+async def check_cascade(checks: Checks, collection: PgVectorCollection, source_id: str):
+    print("\nCascading deletes")
+    async with AsyncSessionLocal() as db:
+        # Core DELETE, so only the database's foreign key can remove the chunks
+        await db.execute(delete(KnowledgeSource).where(KnowledgeSource.id == source_id))
+        await db.commit()
+    chunks = await chunk_count(collection, source_id)
+    checks.expect(chunks == 0, "Deleting a source deletes its chunks", f"{chunks} chunks left")
+
+
+async def check_filtered_search(
+    checks: Checks,
+    collection: PgVectorCollection,
+    rng: np.random.Generator,
+    dim: int,
+    total_chunks: int,
+    n_results: int
+):
+    print("\nFiltered search")
+    # One large source and a rare one, so the filter keeps a small fraction of the rows
+    rare_chunks = max(n_results * 2, total_chunks // 200)
+    common, rare = new_source("common"), new_source("rare")
+    common_vectors = random_vectors(rng, total_chunks - rare_chunks, dim)
+    rare_vectors = random_vectors(rng, rare_chunks, dim)
+    async with AsyncSessionLocal() as db:
+        db.add_all([common, rare])
+        await db.flush()
+        for start in range(0, len(common_vectors), 5000):
+            db.add_all(chunk_rows(collection, common.id, common_vectors[start:start + 5000], "web_scrape"))
+            await db.flush()
+        db.add_all(chunk_rows(collection, rare.id, rare_vectors, "document_upload"))
+        await db.commit()
+    print(f"  {total_chunks} chunks, {rare_chunks} matching the filter ({100 * rare_chunks / total_chunks:.1f}%)")
+
+    query = random_vectors(rng, 1, dim)[0]
+    # Exact answer: the rare source's chunks by cosine distance
+    expected = [f"{rare.id}:{i}" for i in np.argsort(-(rare_vectors @ query))[:n_results]]
+    for where in ({"source_id": rare.id}, {"source_type": "document_upload"}, {"source_type": {"$in": ["document_upload"]}}):
+        result = await asyncio.to_thread(collection.query, [query.tolist()], n_results=n_results, where=where)
+        ids = result["ids"][0]
+        # Compared as sets, since near-ties may order differently in float32 and in PostgreSQL
+        checks.expect(
+            len(ids) == n_results and set(ids) == set(expected),
+            f"where={where} returns the exact {n_results} nearest chunks",
+            f"got {len(ids)}, {len(set(ids) & set(expected))} of them expected"
+        )
+
+    result = await asyncio.to_thread(collection.query, [query.tolist()], n_results=n_results)
+    checks.expect(len(result["ids"][0]) == n_results, f"Unfiltered search returns {n_results} chunks")
+
+
+async def cleanup(collection: PgVectorCollection):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(KnowledgeSource).where(KnowledgeSource.url.startswith(URL_PREFIX)))
+        await db.commit()
+    await asyncio.to_thread(collection.drop)
+
+
+async def run_checks(total_chunks: int, n_results: int) -> int:
+    print("=" * 60)
+    print("pgvector Backend Checks")
+    print("=" * 60)
+
+    collection = PgVectorCollection(settings.DATABASE_URL, ef_search=settings.PGVECTOR_EF_SEARCH, name=COLLECTION)
+    checks = Checks()
+    try:
+        dim = await asyncio.to_thread(collection.vector_width)
+        print(f"✓ Connected; embedding column holds {dim} dimensions")
+        rng = np.random.default_rng(0)
+        # Left over from an interrupted run
+        await cleanup(collection)
+        await asyncio.to_thread(collection.ensure_index)
+
+        source_id = await check_transactions(checks, collection, rng, dim)
+        await check_cascade(checks, collection, source_id)
+        await check_filtered_search(checks, collection, rng, dim, total_chunks, n_results)
+    finally:
+        await cleanup(collection)
+        collection.close()
+        await async_engine.dispose()
+
+    print("\n" + "=" * 60)
+    print("All checks passed" if not checks.failed else f"{checks.failed} check(s) failed")
+    print("=" * 60)
+    return checks.failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the pgvector backend against the database in DATABASE_URL")
+    parser.add_argument("--chunks", type=int, default=10000, help="chunks in the filtered-search collection")
+    parser.add_argument("--n-results", type=int, default=10, help="results per search")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(run_checks(args.chunks, args.n_results)) else 0)
@@ -20,7 +20,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 from app.models.source import KnowledgeSource
-from app.services.vector_store import VectorStore
+from app.services.index_registry import open_active_store
 
 
 async def cleanup_orphaned_vectors():
@@ -34,8 +34,8 @@ async def cleanup_orphaned_vectors():
     engine = create_async_engine(settings.DATABASE_URL, echo=False)
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-    # Initialize vector store
-    vector_store = VectorStore()
+    # Open the live index (see ./data/vector_index.json)
+    vector_store = open_active_store()
 
     async with async_session() as session:
         # Get all source IDs from PostgreSQL
@@ -44,8 +44,8 @@ async def cleanup_orphaned_vectors():
 
         print(f"\n✓ Found {len(valid_source_ids)} valid sources in PostgreSQL")
 
-        # Get all vectors from ChromaDB
-        all_vectors = vector_store.collection.get()
+        # Get all vectors from ChromaDB (metadata only; documents and embeddings aren't needed)
+        all_vectors = vector_store.collection.get(include=["metadatas"])
 
         if not all_vectors or not all_vectors['ids']:
             print("\n✓ No vectors found in ChromaDB")
@@ -88,7 +88,10 @@ async def cleanup_orphaned_vectors():
 
         # Delete orphaned vectors
         print("\n🔄 Deleting orphaned vectors...")
-        vector_store.collection.delete(ids=orphaned_ids)
+        # The public delete path, so the lexical index, caches and source listeners all follow
+        await vector_store.delete_by_source_ids(list(orphaned_by_source))
+        # Saves the lexical index; a running API picks the change up from the pickle
+        vector_store.close()
 
         print(f"\n✅ Successfully deleted {orphaned_count} orphaned vectors")
         print(f"✅ ChromaDB cleaned: {total_vectors - orphaned_count} vectors remaining")
@@ -108,8 +111,8 @@ async def show_stats():
     engine = create_async_engine(settings.DATABASE_URL, echo=False)
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-    # Initialize vector store
-    vector_store = VectorStore()
+    # Open the live index (see ./data/vector_index.json)
+    vector_store = open_active_store()
 
     async with async_session() as session:
         # Get PostgreSQL stats
@@ -121,7 +124,7 @@ async def show_stats():
             print(f"   - {source.title[:50]} (ID: {source.id})")
 
         # Get ChromaDB stats
-        all_vectors = vector_store.collection.get()
+        all_vectors = vector_store.collection.get(include=["metadatas"])
 
         if not all_vectors or not all_vectors['ids']:
             print("\n📊 ChromaDB Vectors: 0")
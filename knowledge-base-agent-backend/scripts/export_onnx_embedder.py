@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Export EMBEDDING_MODEL to ONNX for EMBEDDER_BACKEND="onnx".
+
+Writes the transformer as model.onnx (float32) and, with dynamic int8 weight
+quantisation, as model-int8.onnx, together with the tokenizer files and
+embedder.json (sequence length, dimension, whether vectors are normalised).
+Pooling and normalisation are done by OnnxEmbedder, not in the graph.
+
+Needs torch and sentence-transformers, which the API itself no longer does
+when it runs the exported model. Check the result with
+scripts/benchmark_embedders.py before switching.
+
+Usage:
+    python scripts/export_onnx_embedder.py
+    python scripts/export_onnx_embedder.py --model all-MiniLM-L6-v2 --output ./data/onnx/all-MiniLM-L6-v2
+"""
+
+import json
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.services.embedders import ONNX_CONFIG, ONNX_MODEL, ONNX_MODEL_INT8
+
+OPSET = 14
+
+
+def export(model_name: str, output: str) -> None:
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+
+    print("=" * 60)
+    print("ONNX Embedder Export")
+    print("=" * 60)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    os.makedirs(output, exist_ok=True)
+
+    sample = tokenizer(["An example sentence to trace the graph."], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(output, ONNX_MODEL)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+            do_constant_folding=True
+        )
+    print(f"✓ Exported {model_name} to {model_path}")
+
+    tokenizer.save_pretrained(output)
+    config = {
+        "model_name": model_name,
+        "max_seq_length": model.max_seq_length,
+        "dim": model.get_sentence_embedding_dimension(),
+        "normalize": any(isinstance(module, Normalize) for module in model)
+    }
+    with open(os.path.join(output, ONNX_CONFIG), "w") as f:
+        json.dump(config, f, indent=2)
+    print(f"✓ Wrote tokenizer and {ONNX_CONFIG} ({config})")
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8_path = os.path.join(output, ONNX_MODEL_INT8)
+    quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"✓ Quantised to {int8_path}")
+
+    for path in (model_path, int8_path):
+        print(f"  {os.path.basename(path)}: {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--output", default=settings.ONNX_MODEL_PATH)
+
+    args = parser.parse_args()
+    export(args.model, args.output)
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 """
-Re-index existing sources in ChromaDB.
-Useful after ChromaDB has been reset or for sources that failed to vectorize.
+Re-index existing sources in the vector store.
+
+Each completed source is diffed against its stored chunks by content hash:
+new or edited chunks are embedded and added, unchanged chunks are kept and
+chunks that no longer occur are removed. Running it again on an unchanged
+knowledge base embeds nothing. Useful after the vector store has been reset,
+for sources that failed to vectorize, or after sources were edited. Works on
+the live index; changing embedder or chunking settings builds a new index
+instead (see app/services/index_registry.py).
 
 Usage:
     python scripts/reindex_sources.py
@@ -20,33 +27,22 @@ from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 from app.models.source import KnowledgeSource
-from app.services.vector_store import VectorStore
+from app.services.index_registry import open_active_store, source_index_metadata
 
 
 async def reindex_all_sources():
     """Re-index all completed sources in the vector store"""
 
     print("=" * 60)
-    print("ChromaDB Source Re-indexing")
+    print("Vector Store Source Re-indexing")
     print("=" * 60)
 
     # Initialize database connection
     engine = create_async_engine(settings.DATABASE_URL, echo=False)
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-    # Initialize vector store
-    vector_store = VectorStore()
-
-    # Get current vectors
-    existing_vectors = vector_store.collection.get()
-    existing_source_ids = set()
-    if existing_vectors and existing_vectors['metadatas']:
-        for metadata in existing_vectors['metadatas']:
-            source_id = metadata.get('source_id')
-            if source_id:
-                existing_source_ids.add(source_id)
-
-    print(f"\n✓ Found {len(existing_source_ids)} sources already in ChromaDB")
+    # Open the live index (see ./data/vector_index.json)
+    vector_store = open_active_store()
 
     async with async_session() as session:
         # Get all completed sources
@@ -56,22 +52,19 @@ async def reindex_all_sources():
             .order_by(KnowledgeSource.created_at.desc())
         )
         sources = result.scalars().all()
+        # Detach them so a rollback after a failed source doesn't expire the rest
+        session.expunge_all()
 
         print(f"✓ Found {len(sources)} completed sources in PostgreSQL\n")
 
-        reindexed = 0
-        skipped = 0
+        totals = {"added": 0, "kept": 0, "removed": 0}
+        updated = 0
+        unchanged = 0
         failed = 0
 
         for source in sources:
             source_id = str(source.id)
 
-            # Check if source already has vectors
-            if source_id in existing_source_ids:
-                print(f"⊘ Skipping: {source.title[:50]} (already indexed)")
-                skipped += 1
-                continue
-
             # Check if source has content
             if not source.content or len(source.content.strip()) == 0:
                 print(f"✗ Skipping: {source.title[:50]} (no content)")
@@ -79,38 +72,39 @@ async def reindex_all_sources():
                 continue
 
             try:
-                print(f"⟳ Indexing: {source.title[:50]}...")
-                print(f"  Content length: {len(source.content)} characters")
-
-                # Add to vector store
-                metadata = {
-                    "source_id": source_id,
-                    "title": source.title or "Untitled",
-                    "url": source.url,
-                    "source_type": "document_upload" if source.url.startswith("file://") else "web_scrape"
-                }
-
-                doc_id = await vector_store.add_document(
+                stats = await vector_store.sync_document(
                     content=source.content,
-                    metadata=metadata
+                    metadata=source_index_metadata(source),
+                    db=session
                 )
-
-                print(f"  ✓ Successfully indexed with doc_id: {doc_id}")
-                reindexed += 1
+                await session.commit()
+
+                for key in totals:
+                    totals[key] += stats[key]
+                if stats["added"] or stats["removed"]:
+                    print(
+                        f"⟳ Re-indexed: {(source.title or 'Untitled')[:50]} "
+                        f"(+{stats['added']} ={stats['kept']} -{stats['removed']} chunks)"
+                    )
+                    updated += 1
+                else:
+                    unchanged += 1
 
             except Exception as e:
-                print(f"  ✗ Failed to index: {str(e)}")
+                await session.rollback()
+                print(f"  ✗ Failed to index {(source.title or source_id)[:50]}: {str(e)}")
                 failed += 1
 
         print("\n" + "=" * 60)
         print("Re-indexing Summary")
         print("=" * 60)
-        print(f"✓ Successfully re-indexed: {reindexed}")
-        print(f"⊘ Already indexed (skipped): {skipped}")
+        print(f"✓ Sources re-indexed: {updated}")
+        print(f"⊘ Sources unchanged: {unchanged}")
         print(f"✗ Failed: {failed}")
-        print(f"📊 Total in ChromaDB: {len(existing_source_ids) + reindexed}")
+        print(f"📊 Chunks added: {totals['added']}, kept: {totals['kept']}, removed: {totals['removed']}")
         print("=" * 60)
 
+    vector_store.close()
     await engine.dispose()
 
 
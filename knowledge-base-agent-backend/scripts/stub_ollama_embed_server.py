@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Minimal stand-in for Ollama's /api/embed, for testing EMBEDDER_BACKEND="ollama".
+
+Returns deterministic unit vectors derived from a hash of each input, so the
+same text always gets the same vector, and can inject failures and latency
+to exercise the embedder's retries and concurrency limit. Request counts and
+the peak number of concurrent requests are printed on exit and served at
+GET /stats.
+
+Usage:
+    python scripts/stub_ollama_embed_server.py --port 11435 --dim 768
+    python scripts/stub_ollama_embed_server.py --fail-rate 0.2 --latency-ms 50
+    OLLAMA_BASE_URL=http://localhost:11435 EMBEDDER_BACKEND=ollama uvicorn app.main:app
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class StubState:
+    def __init__(self, dim: int, fail_rate: float, latency_ms: float):
+        self.dim = dim
+        self.fail_rate = fail_rate
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.inputs = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def embed(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "inputs": self.inputs,
+            "peak_in_flight": self.peak_in_flight
+        }
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like Ollama
+
+        def _send(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, state.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path != "/api/embed":
+                self._send(404, {"error": "not found"})
+                return
+
+            with state.lock:
+                state.requests += 1
+                state.in_flight += 1
+                state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+            try:
+                if state.latency:
+                    time.sleep(state.latency)
+                if random.random() < state.fail_rate:
+                    with state.lock:
+                        state.failures += 1
+                    self._send(503, {"error": "stub: injected failure"})
+                    return
+
+                inputs = body.get("input", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                with state.lock:
+                    state.inputs += len(inputs)
+                self._send(200, {"model": body.get("model"), "embeddings": [state.embed(text) for text in inputs]})
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stub Ollama embedding server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=768, help="Vector width (nomic-embed-text: 768)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every request")
+
+    args = parser.parse_args()
+
+    state = StubState(args.dim, args.fail_rate, args.latency_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"✓ Stub Ollama embedding server on http://{args.host}:{args.port} ({args.dim} dimensions)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"✓ {state.stats()}")